@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+"""
+Measures the memory held by loaded customers with and without compact child
+records. Every generated customer has a long invoice history. Run it from the
+repository root:
+
+    python benchmarks/bench_memory.py [number of customers] [invoices each]
+
+"""
+
+import os
+import sys
+import flask
+import tracemalloc
+from lxml import etree
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from flask_cheddargetter import Customer
+
+
+def build_customers_xml(count, invoices):
+    path = os.path.join(
+        os.path.dirname(__file__), "..", "tests", "fixtures", "customers_with_items.xml"
+    )
+    with open(path) as f:
+        fixture = f.read()
+    invoice = fixture[fixture.index("<invoice ") : fixture.index("</invoices>")]
+    fixture = fixture.replace(invoice, invoice * invoices)
+    customer = fixture[fixture.index("<customer ") : fixture.index("</customers>")]
+    customers = "".join(
+        customer.replace('code="test"', 'code="test{}"'.format(i)) for i in range(count)
+    )
+    return "<customers>{}</customers>".format(customers).encode("utf-8")
+
+
+def measure(body, compact):
+    xml = etree.fromstring(body)
+    tracemalloc.start()
+    customers = Customer._all_from_xml(xml, compact=compact)
+    size, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size / len(customers)
+
+
+def main(count=500, invoices=24):
+    app = flask.Flask(__name__)
+    app.config["CHEDDAR_PRODUCT"] = "Benchmark"
+    body = build_customers_xml(count, invoices)
+
+    with app.app_context():
+        full = measure(body, compact=False)
+        compact = measure(body, compact=True)
+
+    print("Objects: {:.0f} bytes per customer".format(full))
+    print("Compact: {:.0f} bytes per customer".format(compact))
+    print("{:.1f}x smaller".format(full / compact))
+
+
+if __name__ == "__main__":
+    main(*[int(i) for i in sys.argv[1:3]])
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+"""
+Measures how fast customer lists are turned into Customer objects. Run it
+from the repository root:
+
+    python benchmarks/bench_parsing.py [number of customers]
+
+"""
+
+import os
+import sys
+import time
+import flask
+from lxml import etree
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from flask_cheddargetter import Customer
+
+
+def build_customers_xml(count):
+    path = os.path.join(
+        os.path.dirname(__file__), "..", "tests", "fixtures", "customers_with_items.xml"
+    )
+    with open(path) as f:
+        fixture = f.read()
+    customer = fixture[fixture.index("<customer ") : fixture.index("</customers>")]
+    customers = "".join(
+        customer.replace('code="test"', 'code="test{}"'.format(i)) for i in range(count)
+    )
+    return "<customers>{}</customers>".format(customers).encode("utf-8")
+
+
+def main(count=2000, repeat=5):
+    app = flask.Flask(__name__)
+    app.config["CHEDDAR_PRODUCT"] = "Benchmark"
+    body = build_customers_xml(count)
+
+    with app.app_context():
+        timings = []
+        for i in range(repeat):
+            xml = etree.fromstring(body)
+            start = time.perf_counter()
+            customers = Customer._all_from_xml(xml)
+            timings.append(time.perf_counter() - start)
+            assert len(customers) == count
+
+    best = min(timings)
+    print(
+        "Parsed {} customers in {:.3f}s, {:.0f} customers/s".format(
+            count, best, count / best
+        )
+    )
+
+
+if __name__ == "__main__":
+    main(*[int(i) for i in sys.argv[1:2]])
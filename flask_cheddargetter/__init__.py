@@ -8,30 +8,279 @@ management. It is heavily inspired by pycheddar:
 
 """
 
-import re
 import sys
 import copy
+import time
 import arrow
+import weakref
+import asyncio
+import functools
+import contextlib
 import requests
 import datetime
+import threading
 import inflection
 import simplejson as json
 from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
 from os import environ
 from lxml import etree
+from requests.adapters import HTTPAdapter
 from flask import request
 from flask import current_app
-
+from flask import has_app_context
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from .cache import PlanCache
+from .cache import LRUCache
+from .cache import ShelveCache
+from .cache import Revalidator
+from .access import AccessCache
+from .entitlements import EntitlementIndex
+from .resilience import READ_PATHS
+from .resilience import is_transient
+from .resilience import CircuitBreaker
+from .resilience import RetryPolicy
+from .ratelimit import FileBackend
+from .ratelimit import RateLimiter
+from .singleflight import SingleFlight
+from .unitofwork import UnitOfWork
 from .exceptions import BadRequest
 from .exceptions import NotFound
 from .exceptions import UnexpectedResponse
 from .exceptions import GatewayFailure
 from .exceptions import GatewayConnectionError
+from .exceptions import ValidationError
+
+
+# Tags and attribute names come from a small fixed vocabulary so the
+# conversions are memoized rather than running inflection's regexes each time
+@functools.lru_cache(maxsize=1024)
+def _underscore(word):
+    return inflection.underscore(word)
+
+
+@functools.lru_cache(maxsize=1024)
+def _camelize(word, uppercase_first_letter=True):
+    return inflection.camelize(word, uppercase_first_letter)
+
+
+def _parse_datetime(value):
+    """Parse a CheddarGetter datetime. Values are ISO 8601 so the standard
+    library parser is tried first and arrow is only used for anything it
+    rejects. Naive values are taken to be UTC like arrow does."""
+    try:
+        value = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return arrow.get(value).datetime
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
+# Field converters used by the __fields__ schemas of the models
+INTEGER = int
+DECIMAL = Decimal
+DATETIME = _parse_datetime
+
+
+@functools.lru_cache(maxsize=1024)
+def _class_for_tag(tag):
+    """The class used to load an XML element or None if there is none."""
+    return getattr(sys.modules[__name__], _camelize(tag), None)
+
+
+class _AppState(object):
+    """The clients, caches and background workers of one application, kept in
+    app.extensions["cheddargetter"]. Every application initialized with the
+    extension gets its own, as with an application factory."""
+
+    def __init__(self, extension, app):
+        self.extension = extension
+        self.cookie_name = app.config["CHEDDAR_MARKETING_COOKIE_NAME"]
+        self.keep_alive = app.config["CHEDDAR_KEEP_ALIVE"]
+        self.async_max_connections = app.config["CHEDDAR_ASYNC_MAX_CONNECTIONS"]
+        self.timeout = app.config["CHEDDAR_TIMEOUT"]
+
+        # The adapter owns the urllib3 pool manager which is thread safe, so a
+        # single adapter is shared by the sessions of every thread
+        self._adapter = HTTPAdapter(
+            pool_connections=app.config["CHEDDAR_POOL_CONNECTIONS"],
+            pool_maxsize=app.config["CHEDDAR_POOL_MAXSIZE"],
+            pool_block=app.config["CHEDDAR_POOL_BLOCK"],
+        )
+        self._local = threading.local()
+        self._async_clients = weakref.WeakKeyDictionary()
+
+        self.retry_policy = RetryPolicy(
+            attempts=app.config["CHEDDAR_RETRY_ATTEMPTS"],
+            backoff=app.config["CHEDDAR_RETRY_BACKOFF"],
+            max_backoff=app.config["CHEDDAR_RETRY_MAX_BACKOFF"],
+        )
+        self.circuit_breaker = None
+        if app.config["CHEDDAR_CIRCUIT_BREAKER"]:
+            self.circuit_breaker = CircuitBreaker(
+                failure_rate=app.config["CHEDDAR_CIRCUIT_FAILURE_RATE"],
+                minimum_requests=app.config["CHEDDAR_CIRCUIT_MINIMUM_REQUESTS"],
+                window=app.config["CHEDDAR_CIRCUIT_WINDOW"],
+                recovery_timeout=app.config["CHEDDAR_CIRCUIT_RECOVERY_TIMEOUT"],
+            )
+
+        self.single_flight = None
+        if app.config["CHEDDAR_COALESCE_READS"]:
+            self.single_flight = SingleFlight()
+
+        self.rate_limiter = None
+        if app.config["CHEDDAR_RATE_LIMIT"]:
+            backend = None
+            if app.config["CHEDDAR_RATE_LIMIT_FILE"]:
+                backend = FileBackend(app.config["CHEDDAR_RATE_LIMIT_FILE"])
+            self.rate_limiter = RateLimiter(
+                reads=app.config["CHEDDAR_RATE_LIMIT_READS"],
+                read_burst=app.config["CHEDDAR_RATE_LIMIT_READ_BURST"],
+                writes=app.config["CHEDDAR_RATE_LIMIT_WRITES"],
+                write_burst=app.config["CHEDDAR_RATE_LIMIT_WRITE_BURST"],
+                reserve=app.config["CHEDDAR_RATE_LIMIT_RESERVE"],
+                backend=backend,
+            )
+
+        self.plan_cache = None
+        if app.config["CHEDDAR_PLAN_CACHE"]:
+            self.plan_cache = PlanCache(ttl=app.config["CHEDDAR_PLAN_CACHE_TTL"])
+
+        self.customer_cache = app.config["CHEDDAR_CUSTOMER_CACHE"]
+        if self.customer_cache == "lru":
+            self.customer_cache = LRUCache(
+                maxsize=app.config["CHEDDAR_CUSTOMER_CACHE_SIZE"],
+                ttl=app.config["CHEDDAR_CUSTOMER_CACHE_TTL"],
+            )
+
+        self.revalidator = Revalidator(
+            app, max_workers=app.config["CHEDDAR_REVALIDATE_WORKERS"]
+        )
+
+        self.entitlement_index = EntitlementIndex.from_config(
+            app.config["CHEDDAR_ENTITLEMENT_INDEX"]
+        )
+        self.access_cache = AccessCache.from_config(
+            app.config["CHEDDAR_ACCESS_CACHE"],
+            maxsize=app.config["CHEDDAR_ACCESS_CACHE_SIZE"],
+            missing_ttl=app.config["CHEDDAR_ACCESS_MISSING_TTL"],
+            overdue_ttl=app.config["CHEDDAR_ACCESS_OVERDUE_TTL"],
+        )
+
+        self.meter = None
+        self._metering_store = None
+        store = app.config["CHEDDAR_METERING"]
+        if store is True:
+            raise ValueError(
+                "CHEDDAR_METERING needs a file or a cache.CacheBackend to keep "
+                "the pending usage in"
+            )
+        if store:
+            from .metering import UsageMeter
+
+            if isinstance(store, str):
+                store = self._metering_store = ShelveCache(store)
+            self.meter = UsageMeter(
+                app,
+                store,
+                max_pending=app.config["CHEDDAR_METERING_MAX_PENDING"],
+                interval=app.config["CHEDDAR_METERING_INTERVAL"],
+            )
+
+        self.outbox = None
+        path = app.config["CHEDDAR_OUTBOX"]
+        if path is True:
+            raise ValueError("CHEDDAR_OUTBOX needs the path of the database file")
+        if path:
+            from .outbox import Outbox
+
+            self.outbox = Outbox(
+                app,
+                path,
+                max_workers=app.config["CHEDDAR_OUTBOX_WORKERS"],
+                max_attempts=app.config["CHEDDAR_OUTBOX_MAX_ATTEMPTS"],
+                backoff=app.config["CHEDDAR_OUTBOX_BACKOFF"],
+                lease=app.config["CHEDDAR_OUTBOX_LEASE"],
+                handlers=extension.outbox_handlers,
+            )
+
+    @property
+    def session(self):
+        """The requests session for the current thread. Sessions are not
+        shared between threads but all of them draw their connections from the
+        same pool so connections are reused across requests."""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("https://", self._adapter)
+            session.mount("http://", self._adapter)
+            if not self.keep_alive:
+                session.headers["Connection"] = "close"
+            self._local.session = session
+        return session
+
+    @property
+    def async_client(self):
+        """The httpx client for the running event loop. An async client is
+        bound to the loop it was first used in so one is kept per loop."""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._create_async_client()
+            self._async_clients[loop] = client
+        return client
+
+    def _create_async_client(self):
+        if httpx is None:
+            raise RuntimeError("httpx is required for the asyncio API")
+        limits = httpx.Limits(
+            max_connections=self.async_max_connections,
+            max_keepalive_connections=(
+                self.async_max_connections if self.keep_alive else 0
+            ),
+        )
+        return httpx.AsyncClient(limits=limits, timeout=self.timeout)
+
+    def close(self):
+        """Close all pooled connections."""
+        self._adapter.close()
+
+    async def aclose(self):
+        """Close the async client of the running event loop."""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def shutdown(self):
+        """Stop the background workers and close the pooled connections."""
+        self.revalidator.shutdown(wait=False)
+        if self.meter is not None:
+            # Anything pending is still in the store of the meter
+            self.meter.stop(flush=False)
+        if self._metering_store is not None:
+            self._metering_store.close()
+        if self.outbox is not None:
+            self.outbox.stop()
+        self.close()
+
+
+def _state_property(name):
+    """A CheddarGetter attribute read from the state of the current
+    application, see CheddarGetter.state."""
+    return property(lambda self: getattr(self.state(), name))
 
 
 class CheddarGetter(object):
     def __init__(self, app=None):
         self.app = app
+        self.webhook_handlers = []
+        self.outbox_handlers = []
         if app is not None:
             self.init_app(app)
 
@@ -43,14 +292,232 @@ class CheddarGetter(object):
             "CHEDDAR_MARKETING_COOKIE_NAME",
             environ.get("CHEDDAR_MARKETING_COOKIE_NAME", None),
         )
+        # Connection pool settings, see requests.adapters.HTTPAdapter
+        app.config.setdefault("CHEDDAR_POOL_CONNECTIONS", 10)
+        app.config.setdefault("CHEDDAR_POOL_MAXSIZE", 10)
+        app.config.setdefault("CHEDDAR_POOL_BLOCK", False)
+        app.config.setdefault("CHEDDAR_KEEP_ALIVE", True)
+        app.config.setdefault("CHEDDAR_ASYNC_MAX_CONNECTIONS", 100)
+        app.config.setdefault("CHEDDAR_MAX_WORKERS", 8)
+        # Seconds to wait for the connection and for each read of a response,
+        # None waits forever
+        app.config.setdefault("CHEDDAR_TIMEOUT", 30)
+        # Reads failing with a transient error are retried, 1 attempt disables
+        # retries, see resilience.RetryPolicy
+        app.config.setdefault("CHEDDAR_RETRY_ATTEMPTS", 3)
+        app.config.setdefault("CHEDDAR_RETRY_BACKOFF", 0.1)
+        app.config.setdefault("CHEDDAR_RETRY_MAX_BACKOFF", 2)
+        # Circuit breaker, see resilience.CircuitBreaker
+        app.config.setdefault("CHEDDAR_CIRCUIT_BREAKER", True)
+        app.config.setdefault("CHEDDAR_CIRCUIT_FAILURE_RATE", 0.5)
+        app.config.setdefault("CHEDDAR_CIRCUIT_MINIMUM_REQUESTS", 10)
+        app.config.setdefault("CHEDDAR_CIRCUIT_WINDOW", 30)
+        app.config.setdefault("CHEDDAR_CIRCUIT_RECOVERY_TIMEOUT", 30)
+        # Identical reads made concurrently share one request, see
+        # singleflight.SingleFlight
+        app.config.setdefault("CHEDDAR_COALESCE_READS", True)
+        # Client side rate limit in requests per second, see
+        # ratelimit.RateLimiter. Give a file to share the budgets with every
+        # process on the host using it.
+        app.config.setdefault("CHEDDAR_RATE_LIMIT", False)
+        app.config.setdefault("CHEDDAR_RATE_LIMIT_READS", 10)
+        app.config.setdefault("CHEDDAR_RATE_LIMIT_READ_BURST", 20)
+        app.config.setdefault("CHEDDAR_RATE_LIMIT_WRITES", 5)
+        app.config.setdefault("CHEDDAR_RATE_LIMIT_WRITE_BURST", 10)
+        app.config.setdefault("CHEDDAR_RATE_LIMIT_RESERVE", 0.25)
+        app.config.setdefault("CHEDDAR_RATE_LIMIT_FILE", None)
+        # Plans rarely change so they are cached, a TTL of None never expires
+        app.config.setdefault("CHEDDAR_PLAN_CACHE", True)
+        app.config.setdefault("CHEDDAR_PLAN_CACHE_TTL", 300)
+        # Customer cache, either "lru" or a cache.CacheBackend instance
+        app.config.setdefault("CHEDDAR_CUSTOMER_CACHE", None)
+        app.config.setdefault("CHEDDAR_CUSTOMER_CACHE_SIZE", 1024)
+        app.config.setdefault("CHEDDAR_CUSTOMER_CACHE_TTL", 300)
+        # Default soft and hard TTL of cached customers, see Customer.get
+        app.config.setdefault("CHEDDAR_CUSTOMER_SOFT_TTL", None)
+        app.config.setdefault("CHEDDAR_CUSTOMER_HARD_TTL", None)
+        app.config.setdefault("CHEDDAR_REVALIDATE_WORKERS", 2)
+        # Entitlement index, True to keep it in process or a cache.CacheBackend
+        # instance to store it in
+        app.config.setdefault("CHEDDAR_ENTITLEMENT_INDEX", False)
+        # Access decision cache, True to keep it in process or a
+        # cache.CacheBackend instance to store it in
+        app.config.setdefault("CHEDDAR_ACCESS_CACHE", False)
+        app.config.setdefault("CHEDDAR_ACCESS_CACHE_SIZE", 10000)
+        # Seconds customers that do not exist are decided not to be active
+        app.config.setdefault("CHEDDAR_ACCESS_MISSING_TTL", 300)
+        # Seconds running subscriptions past their renewal are decided to be
+        # active until they are fetched again
+        app.config.setdefault("CHEDDAR_ACCESS_OVERDUE_TTL", 300)
+        # Within a request the same customer is loaded once and saves are
+        # sent once when the request ends, see unitofwork.UnitOfWork
+        app.config.setdefault("CHEDDAR_IDENTITY_MAP", False)
+        app.config.setdefault("CHEDDAR_UNIT_OF_WORK", False)
+        # Usage metering, the path of the file or a cache.CacheBackend
+        # instance to keep the pending usage in. Each process needs its own.
+        app.config.setdefault("CHEDDAR_METERING", False)
+        app.config.setdefault("CHEDDAR_METERING_MAX_PENDING", 100)
+        app.config.setdefault("CHEDDAR_METERING_INTERVAL", 10)
+        # Outbox of deferred saves, the path of the SQLite database to keep it
+        # in
+        app.config.setdefault("CHEDDAR_OUTBOX", False)
+        app.config.setdefault("CHEDDAR_OUTBOX_WORKERS", 4)
+        app.config.setdefault("CHEDDAR_OUTBOX_MAX_ATTEMPTS", 5)
+        app.config.setdefault("CHEDDAR_OUTBOX_BACKOFF", 1)
+        # Seconds a write claimed by a process is left to it, see outbox.Outbox
+        app.config.setdefault("CHEDDAR_OUTBOX_LEASE", 300)
+        # Key the webhook signatures are checked with
+        app.config.setdefault(
+            "CHEDDAR_WEBHOOK_SECRET", environ.get("CHEDDAR_WEBHOOK_SECRET", None)
+        )
 
         if not hasattr(app, "extensions"):
             app.extensions = {}
-        app.extensions["cheddargetter"] = self
-
-        self.cookie_name = app.config["CHEDDAR_MARKETING_COOKIE_NAME"]
+        previous = app.extensions.get("cheddargetter")
+        if previous is not None:
+            # Initialized again, the application is reconfigured
+            previous.shutdown()
+        app.extensions["cheddargetter"] = _AppState(self, app)
+        if self._teardown_request not in app.teardown_request_funcs.get(None, []):
+            app.teardown_request(self._teardown_request)
         return app
 
+    def state(self, app=None):
+        """The clients, caches and workers of app, the current application by
+        default or the one the extension was created with outside of an
+        application context."""
+        if app is None:
+            app = current_app._get_current_object() if has_app_context() else self.app
+        state = getattr(app, "extensions", {}).get("cheddargetter")
+        if state is None or state.extension is not self:
+            raise RuntimeError("The extension is not initialized for the application")
+        return state
+
+    cookie_name = _state_property("cookie_name")
+    session = _state_property("session")
+    async_client = _state_property("async_client")
+    retry_policy = _state_property("retry_policy")
+    circuit_breaker = _state_property("circuit_breaker")
+    single_flight = _state_property("single_flight")
+    rate_limiter = _state_property("rate_limiter")
+    plan_cache = _state_property("plan_cache")
+    customer_cache = _state_property("customer_cache")
+    revalidator = _state_property("revalidator")
+    entitlement_index = _state_property("entitlement_index")
+    access_cache = _state_property("access_cache")
+    meter = _state_property("meter")
+    outbox = _state_property("outbox")
+
+    def close(self):
+        """Close all pooled connections of the current application."""
+        self.state().close()
+
+    async def aclose(self):
+        """Close the async client of the running event loop."""
+        await self.state().aclose()
+
+    def get_entitlements(self, code):
+        """Return the entitlements of a customer keyed by item code, see
+        entitlements.EntitlementIndex. Customers missing from the index are
+        fetched and indexed, NotFound is raised if the customer does not
+        exist."""
+        if self.entitlement_index is None:
+            raise RuntimeError("The entitlement index is not enabled")
+
+        entitlements = self.entitlement_index.get(code)
+        if entitlements is None:
+            xml = Customer.request("/customers/get", code=code)
+            Customer._refresh_customer_cache(code, xml)
+            entitlements = self.entitlement_index.get(code) or {}
+        return entitlements
+
+    def rebuild_entitlements(self):
+        """Rebuild the entitlement index from every customer. Returns the
+        number of customers indexed."""
+        if self.entitlement_index is None:
+            raise RuntimeError("The entitlement index is not enabled")
+
+        try:
+            return self.entitlement_index.rebuild(
+                Customer.iter_request("/customers/get", "customer")
+            )
+        except NotFound:
+            return self.entitlement_index.rebuild([])
+
+    def flush(self):
+        """Send the saves collected by the unit of work of the current request
+        now instead of when the request ends, errors are raised to the
+        caller."""
+        work = UnitOfWork.current(create=False)
+        if work is not None:
+            work.flush()
+
+    def _teardown_request(self, exc=None):
+        work = UnitOfWork.pop()
+        if work is None:
+            return
+        if exc is not None:
+            # The request failed, its changes are not sent
+            work.discard()
+            return
+        for customer in work.pending:
+            try:
+                customer._save()
+            except Exception:
+                current_app.logger.exception("Saving customer %s failed", customer.code)
+        work.discard()
+
+    def is_customer_active(self, code):
+        """Whether the subscription of a customer is active, see
+        Subscription.is_active. Decisions are cached until the billing period
+        ends or the customer changes, see access.AccessCache. Customers that
+        do not exist are not active, that decision is kept for
+        CHEDDAR_ACCESS_MISSING_TTL seconds."""
+        if self.access_cache is None:
+            raise RuntimeError("The access cache is not enabled")
+
+        active = self.access_cache.get(code)
+        if active is None:
+            try:
+                xml = Customer.request("/customers/get", code=code)
+            except NotFound:
+                Customer._refresh_customer_cache(code)
+                self.access_cache.set_missing(code)
+                return False
+            Customer._refresh_customer_cache(code, xml)
+            active = bool(self.access_cache.get(code))
+        return active
+
+    def webhook_blueprint(self, name="cheddargetter_webhooks", rule="/webhook"):
+        """A blueprint receiving CheddarGetter webhooks, see
+        webhooks.create_blueprint. Each webhook refreshes the configured
+        customer cache, plan cache and entitlement index."""
+        from .webhooks import create_blueprint
+
+        return create_blueprint(self, name=name, rule=rule)
+
+    def webhook_handler(self, func):
+        """Register a function called with the activity type and Customer of
+        every webhook received. Can be used as a decorator."""
+        self.webhook_handlers.append(func)
+        return func
+
+    def outbox_handler(self, func):
+        """Register a function called with the customer code, the Customer or
+        None and the exception or None when a deferred save was sent or given
+        up on. Unlike the callback passed to save, handlers also learn about
+        saves queued before a restart. Can be used as a decorator."""
+        self.outbox_handlers.append(func)
+        return func
+
+    def background(self):
+        """Context manager marking the requests made in the block, typically
+        by batch jobs, as background traffic yielding to interactive requests,
+        see ratelimit.RateLimiter. Does nothing without a rate limiter."""
+        if self.rate_limiter is None:
+            return contextlib.nullcontext()
+        return self.rate_limiter.background()
+
     def build_marketing_cookie(self):
         if not self.cookie_name:
             return False
@@ -118,24 +585,57 @@ class CheddarGetter(object):
 class CheddarObject(object):
     """A base class for CheddarGetter objects."""
 
-    def __init__(self, parent=None, **kwargs):
-        self._product_code = current_app.config["CHEDDAR_PRODUCT"]
-        self._data = {}
-        self._to_persist = {}
-        self._id = None
-        self._code = None
+    # Converters for the values of the object's fields keyed by attribute
+    # name, fields that are not listed are kept as strings
+    __fields__ = {}
 
-        if parent is not None:
-            setattr(self, parent.__class__.__name__.lower(), parent)
+    # Child attributes that have a default value, see _default
+    __children__ = ()
+
+    # The XML element of a lazily loaded object that has not been decoded yet
+    _xml = None
+
+    def __init__(self, parent=None, **kwargs):
+        self._setup(parent)
 
         for i in kwargs:
             setattr(self, i, kwargs[i])
 
+    def _setup(self, parent=None):
+        # Set directly, objects are created in bulk when loading from XML
+        self.__dict__.update(_data={}, _to_persist={}, _id=None, _code=None)
+
+        if parent is not None:
+            self.__dict__[parent.__class__.__name__.lower()] = parent
+
+    @property
+    def _product_code(self):
+        return current_app.config["CHEDDAR_PRODUCT"]
+
+    def _default(self, key):
+        """Return the default value of a child attribute listed in
+        __children__ that has not been set, e.g. the subscriptions of a new
+        customer. Defaults are only created when they are first used."""
+        raise AttributeError("Key {} does not exist".format(key))
+
+    def _materialize(self):
+        """Decode the XML element of a lazily loaded object."""
+        xml = self.__dict__.get("_xml")
+        if xml is not None:
+            self._xml = None
+            self._load_from_xml(
+                xml, lazy=True, compact=self.__dict__.get("_compact", False)
+            )
+
     def __setattr__(self, key, value):
         # If modifying a private attribute of the class then set it directly
         if key[0] == "_":
             self.__dict__[key] = value
-        elif key == "code":
+            return
+
+        # Decode lazily loaded data first so it doesn't overwrite the change
+        self._materialize()
+        if key == "code":
             if self._id is None:
                 self._code = value
             else:
@@ -148,22 +648,26 @@ class CheddarObject(object):
             self.__dict__[key] = value
         else:
             # Add value to dictionary of attributes to save to CheddarGetter
-            if (
-                inflection.underscore(key) not in self._data
-                or self._data[inflection.underscore(key)] != value
-            ):
-                self._to_persist[inflection.underscore(key)] = value
-            self._data[inflection.underscore(key)] = value
+            key = _underscore(key)
+            if key not in self._data or self._data[key] != value:
+                self._to_persist[key] = value
+            self._data[key] = value
 
     def __getattr__(self, key):
         if key in ["id", "code"]:
             return self.__dict__["_{}".format(key)]
         elif key[0] == "_" or key in self.__dict__:
             return self.__dict__[key]
+        elif self.__dict__.get("_xml") is not None:
+            self._materialize()
+            return getattr(self, key)
+        elif key in self.__children__:
+            value = self.__dict__[key] = self._default(key)
+            return value
         elif key in self._to_persist:
-            return self._to_persist[inflection.underscore(key)]
+            return self._to_persist[_underscore(key)]
         elif key in self._data:
-            return self._data[inflection.underscore(key)]
+            return self._data[_underscore(key)]
         else:
             raise AttributeError("Key {} does not exist".format(key))
 
@@ -178,6 +682,7 @@ class CheddarObject(object):
             return self._id is not None
         if key == "code" or key == "_code":
             return self._code is not None
+        self._materialize()
         return key in self._data
 
     def __iter__(self):
@@ -193,76 +698,205 @@ class CheddarObject(object):
     def is_new(self):
         return not "id" in self
 
-    def _load_from_xml(self, xml):
+    def _load_from_xml(self, xml, lazy=False, compact=False):
+        """Load the object from an XML element. If lazy is set child objects
+        only keep a reference to their element and decode it when they are
+        first used. If compact is set children that have a Record type, such
+        as items and invoices, are loaded as read only records."""
+        self._xml = None
         self._id = xml.get("id")
         self._code = xml.get("code")
+        fields = self.__fields__
 
-        for child in xml.getchildren():
-            if len(child.getchildren()) > 0:
+        for child in xml:
+            if len(child) > 0:
+                name = _underscore(child.tag)
                 # Determine if children are all of the same type, e.g. Items
                 # has many Item children, or if the current child should be
                 # instantiated as a class
-                is_list = len(set([i.tag for i in child.getchildren()])) == 1
+                is_list = len(set([i.tag for i in child])) == 1
                 if not is_list:
-                    # Single object
-                    try:
-                        cls = getattr(
-                            sys.modules[__name__], inflection.camelize(child.tag)
-                        )
-                        setattr(
-                            self,
-                            inflection.underscore(child.tag),
-                            cls.from_xml(child, parent=self),
-                        )
-                    except AttributeError:
-                        # No class for this object, ignore it
-                        pass
+                    # Single object, ignore it if there is no class for it
+                    cls = _class_for_tag(child.tag)
+                    if cls is not None:
+                        try:
+                            setattr(
+                                self, name, self._load_child(cls, child, lazy, compact)
+                            )
+                        except AttributeError:
+                            pass
                     continue
                 else:
-                    setattr(self, inflection.underscore(child.tag), [])
-                    for item_xml in child.getchildren():
+                    setattr(self, name, [])
+                    attr = getattr(self, name)
+                    for item_xml in child:
+                        # Give up if there is no class, remaining items are all
+                        # the same
+                        cls = _class_for_tag(item_xml.tag)
+                        if cls is None:
+                            break
                         try:
-                            cls = getattr(
-                                sys.modules[__name__], inflection.camelize(item_xml.tag)
-                            )
-                            attr = getattr(self, inflection.underscore(child.tag))
-                            attr.append(cls.from_xml(item_xml, parent=self))
+                            attr.append(self._load_child(cls, item_xml, lazy, compact))
                         except AttributeError:
-                            # Give up, remaining items are all the same and
-                            # there is no class for them
                             break
                     continue
 
-            key = inflection.underscore(child.tag)
+            key = _underscore(child.tag)
             value = child.text
             if value is not None:
-                # Parse numeric types
-                if re.match(r"^[\d]+$", value):
-                    value = int(value)
-                elif re.match(r"^[\d.]+$", value):
-                    value = float(value)
-                # Parse datetimes, use naive detection of key to avoid trying
-                # to parse every field
-                elif "date" in key:
+                converter = fields.get(key)
+                if converter is not None:
                     try:
-                        value = arrow.get(value).datetime
-                    except Exception:
+                        value = converter(value)
+                    except (ValueError, ArithmeticError):
+                        # Keep the original string if it can't be converted
                         pass
             self._data[key] = value
 
         # Reset dirty data because all data should now be clean
         self._to_persist = {}
 
+    def _load_child(self, cls, xml, lazy, compact):
+        if compact:
+            record = Record.for_model(cls)
+            if record is not None:
+                return record.from_xml(xml)
+        return cls.from_xml(xml, parent=self, lazy=lazy, compact=compact)
+
     def _is_dirty(self):
         return len(self._to_persist) > 0
 
     @classmethod
     def from_xml(cls, xml, **kwargs):
+        """Create an object from an XML element. If lazy is passed the element
+        is only decoded when an attribute of the object is first accessed, the
+        element must not be modified until then. If compact is passed child
+        objects are loaded as records where possible, see Record."""
         parent = kwargs.pop("parent", None)
+        lazy = kwargs.pop("lazy", False)
+        compact = kwargs.pop("compact", False)
+        if lazy and not kwargs:
+            new = cls.__new__(cls)
+            new._setup(parent)
+            new._id = xml.get("id")
+            new._code = xml.get("code")
+            new._xml = xml
+            new._compact = compact
+            return new
+
         new = cls(parent=parent, **kwargs)
-        new._load_from_xml(xml)
+        new._load_from_xml(xml, compact=compact)
         return new
 
+    @classmethod
+    def _extension(cls):
+        return current_app.extensions.get("cheddargetter")
+
+    @classmethod
+    def _plan_cache(cls):
+        extension = cls._extension()
+        return extension.plan_cache if extension is not None else None
+
+    @classmethod
+    def _customer_cache(cls):
+        extension = cls._extension()
+        return extension.customer_cache if extension is not None else None
+
+    @classmethod
+    def _entitlement_index(cls):
+        extension = cls._extension()
+        return extension.entitlement_index if extension is not None else None
+
+    @classmethod
+    def _access_cache(cls):
+        extension = cls._extension()
+        return extension.access_cache if extension is not None else None
+
+    @classmethod
+    def _unit_of_work(cls, option):
+        """The unit of work of the current request if option is enabled, see
+        unitofwork.UnitOfWork."""
+        if not current_app.config.get(option):
+            return None
+        return UnitOfWork.current()
+
+    @classmethod
+    def _meter(cls):
+        extension = cls._extension()
+        meter = extension.meter if extension is not None else None
+        if meter is None:
+            raise RuntimeError("Usage metering is not enabled")
+        return meter
+
+    @classmethod
+    def _outbox(cls):
+        extension = cls._extension()
+        outbox = extension.outbox if extension is not None else None
+        if outbox is None:
+            raise RuntimeError("The outbox is not enabled")
+        return outbox
+
+    @classmethod
+    def _customer_cache_key(cls, code):
+        return "{}:{}".format(current_app.config["CHEDDAR_PRODUCT"], code)
+
+    @classmethod
+    def _refresh_customer_cache(cls, code, xml=None):
+        """Store the customer returned by a request in the customer cache,
+        reindex its entitlements and decide its access again. If the response
+        does not contain the customer the cached copy, index entry and access
+        decision are dropped instead so the next read goes to
+        CheddarGetter."""
+        cache = cls._customer_cache()
+        index = cls._entitlement_index()
+        access = cls._access_cache()
+        if (cache is None and index is None and access is None) or code is None:
+            return
+
+        customer_xml = None
+        if xml is not None:
+            customer_xml = next(
+                (i for i in xml.iter(tag="customer") if i.get("code") == str(code)),
+                None,
+            )
+
+        if cache is not None:
+            key = cls._customer_cache_key(code)
+            if customer_xml is not None:
+                # Record when the copy was fetched so the age of cached copies
+                # is known in every process sharing the cache, see
+                # Customer.get. The response is shared so a copy is stamped.
+                stamped = copy.deepcopy(customer_xml)
+                stamped.set("fetchedAt", "{:.3f}".format(time.time()))
+                cache.set(key, etree.tostring(stamped, with_tail=False))
+            else:
+                cache.delete(key)
+
+        if index is not None:
+            if customer_xml is not None:
+                index.update(customer_xml)
+            else:
+                index.remove(code)
+
+        if access is not None:
+            if customer_xml is not None:
+                access.update(customer_xml)
+            else:
+                access.remove(code)
+
+    @classmethod
+    def _session(cls):
+        extension = cls._extension()
+        if extension is None:
+            # The extension has not been initialised so there is no pool to
+            # draw from, use a one off session
+            return requests.Session()
+        return extension.session
+
+    @classmethod
+    def _timeout(cls):
+        return current_app.config.get("CHEDDAR_TIMEOUT", 30)
+
     @classmethod
     def build_url(cls, path, code=None, item_code=None, is_new=False):
         # Build the request URL
@@ -275,7 +909,7 @@ class CheddarObject(object):
         return url
 
     @classmethod
-    def request(cls, path, code=None, item_code=None, is_new=False, **kwargs):
+    def _prepare_request(cls, path, code=None, item_code=None, is_new=False, **kwargs):
         if not current_app.config["CHEDDAR_EMAIL"]:
             raise Exception("CHEDDAR_EMAIL not configured")
         if not current_app.config["CHEDDAR_PASSWORD"]:
@@ -292,21 +926,24 @@ class CheddarObject(object):
             # Handle metaData keys separately to avoid camel casing user
             # defined name attribute
             if "_" in key and not key.startswith("metaData"):
-                kwargs[inflection.camelize(key, False)] = kwargs[key]
+                kwargs[_camelize(key, False)] = kwargs[key]
                 del kwargs[key]
 
-        # Execute the request
-        client = requests.Session()
-        client.auth = (
+        auth = (
             current_app.config.get("CHEDDAR_EMAIL"),
             current_app.config.get("CHEDDAR_PASSWORD"),
         )
-        response = client.post(url, data=kwargs)
+        return url, kwargs, auth
 
+    @classmethod
+    def _parse_response(cls, status_code, body):
         try:
-            content = etree.fromstring(response.content)
+            content = etree.fromstring(body)
         except:
-            raise UnexpectedResponse("CheddarGetter sent Invalid XML", response.content)
+            error = UnexpectedResponse("CheddarGetter sent Invalid XML", body)
+            # Kept so retries can tell a failing server from a bad request
+            error.status_code = status_code
+            raise error
 
         code_exception_map = {
             400: BadRequest,
@@ -316,128 +953,688 @@ class CheddarObject(object):
             500: GatewayConnectionError,
         }
 
-        if response.status_code > 400 or content.tag == "error":
-            if response.status_code in code_exception_map:
-                exception = code_exception_map[response.status_code]
+        if status_code > 400 or content.tag == "error":
+            if status_code in code_exception_map:
+                exception = code_exception_map[status_code]
             else:
                 exception = UnexpectedResponse
             # If the customer didn't exist in CheddarGetter the error will be
             # the only thing returned. If the customer did exist the error
             # will be embedded in the customer object
             error = content if content.tag == "error" else content.find(".//error")
-            raise exception(
+            error = exception(
                 error.get("id", None),
                 error.get("code", None),
                 error.text,
                 error.get("auxCode", None),
             )
+            error.status_code = status_code
+            raise error
 
         return content
 
+    @classmethod
+    def _resilience(cls, path):
+        """The circuit breaker, the retry policy and the rate limiter for
+        requests of path, any may be None."""
+        extension = cls._extension()
+        if extension is None:
+            return None, None, None
+        policy = extension.retry_policy if path in READ_PATHS else None
+        return extension.circuit_breaker, policy, extension.rate_limiter
+
+    @classmethod
+    def _call(cls, path, send):
+        """Call send, which makes the request and returns the result, through
+        the circuit breaker. Reads failing with a transient error are
+        retried."""
+        breaker, policy, limiter = cls._resilience(path)
+        attempt = 1
+        while True:
+            probe = False
+            if breaker is not None:
+                probe = breaker.before_request()
+            try:
+                if limiter is not None:
+                    limiter.acquire(path)
+                result = send()
+            except Exception as error:
+                if not is_transient(error):
+                    # CheddarGetter answered, the request itself was wrong
+                    if breaker is not None:
+                        breaker.record_success(probe)
+                    raise
+                if breaker is not None:
+                    breaker.record_failure(probe)
+                if policy is None or attempt >= policy.attempts:
+                    raise
+            except BaseException:
+                # Cancelled or interrupted, a probe must not stay taken
+                if breaker is not None:
+                    breaker.abandon(probe)
+                raise
+            else:
+                if breaker is not None:
+                    breaker.record_success(probe)
+                return result
+
+            time.sleep(policy.delay(attempt - 1))
+            attempt += 1
+
+    @classmethod
+    async def _acall(cls, path, send):
+        """Asynchronous version of _call, send is a coroutine function."""
+        breaker, policy, limiter = cls._resilience(path)
+        attempt = 1
+        while True:
+            probe = False
+            if breaker is not None:
+                probe = breaker.before_request()
+            try:
+                if limiter is not None:
+                    await limiter.aacquire(path)
+                result = await send()
+            except Exception as error:
+                if not is_transient(error):
+                    # CheddarGetter answered, the request itself was wrong
+                    if breaker is not None:
+                        breaker.record_success(probe)
+                    raise
+                if breaker is not None:
+                    breaker.record_failure(probe)
+                if policy is None or attempt >= policy.attempts:
+                    raise
+            except BaseException:
+                # Cancelled or interrupted, a probe must not stay taken
+                if breaker is not None:
+                    breaker.abandon(probe)
+                raise
+            else:
+                if breaker is not None:
+                    breaker.record_success(probe)
+                return result
+
+            await asyncio.sleep(policy.delay(attempt - 1))
+            attempt += 1
+
+    @classmethod
+    def _single_flight(cls, path, url, data, auth):
+        """The single flight group coalescing the request and its key, None
+        if the request must be sent on its own. Only reads are coalesced,
+        their parsed response is shared and must not be modified."""
+        extension = cls._extension()
+        if extension is None or extension.single_flight is None:
+            return None, None
+        if path not in READ_PATHS:
+            return None, None
+        params = tuple(sorted((key, str(value)) for key, value in data.items()))
+        return extension.single_flight, (url, params, auth)
+
+    @classmethod
+    def request(cls, path, code=None, item_code=None, is_new=False, **kwargs):
+        url, data, auth = cls._prepare_request(path, code, item_code, is_new, **kwargs)
+
+        # Execute the request
+        def send():
+            response = cls._session().post(
+                url, data=data, auth=auth, timeout=cls._timeout()
+            )
+            return cls._parse_response(response.status_code, response.content)
+
+        group, key = cls._single_flight(path, url, data, auth)
+        if group is not None:
+            return group.do(key, lambda: cls._call(path, send))
+        return cls._call(path, send)
+
+    @classmethod
+    def iter_request(cls, path, tag, code=None, item_code=None, **kwargs):
+        """Like request but the response is parsed incrementally and every
+        element with the given tag is yielded as soon as it is complete. The
+        yielded elements are freed when the caller moves on so memory use
+        stays flat however large the response is."""
+        url, data, auth = cls._prepare_request(path, code, item_code, **kwargs)
+
+        def send():
+            response = cls._session().post(
+                url, data=data, auth=auth, stream=True, timeout=cls._timeout()
+            )
+            if response.status_code > 400:
+                # Errors are small, parse them as usual to raise the exception
+                with contextlib.closing(response):
+                    cls._parse_response(response.status_code, response.content)
+            return response
+
+        # Only sending the request is retried, nothing has been yielded then
+        response = cls._call(path, send)
+        with contextlib.closing(response):
+            response.raw.decode_content = True
+            try:
+                for event, element in etree.iterparse(
+                    response.raw, events=("end",), tag=(tag, "error")
+                ):
+                    if element.tag == "error":
+                        if element.getparent() is None:
+                            cls._parse_response(
+                                response.status_code, etree.tostring(element)
+                            )
+                        continue
+
+                    yield element
+
+                    # Free the element and any siblings already processed
+                    element.clear()
+                    while element.getprevious() is not None:
+                        del element.getparent()[0]
+            except etree.XMLSyntaxError:
+                raise UnexpectedResponse("CheddarGetter sent Invalid XML")
+
+    @classmethod
+    async def arequest(cls, path, code=None, item_code=None, is_new=False, **kwargs):
+        """Asynchronous version of request, requires httpx."""
+        url, data, auth = cls._prepare_request(path, code, item_code, is_new, **kwargs)
+
+        # Encode values the same way requests does, dropping empty ones
+        data = {key: str(value) for key, value in data.items() if value is not None}
+
+        # Execute the request
+        async def send():
+            extension = cls._extension()
+            if extension is not None:
+                response = await extension.async_client.post(url, data=data, auth=auth)
+            else:
+                if httpx is None:
+                    raise RuntimeError("httpx is required for the asyncio API")
+                async with httpx.AsyncClient(timeout=cls._timeout()) as client:
+                    response = await client.post(url, data=data, auth=auth)
+            return cls._parse_response(response.status_code, response.content)
+
+        group, key = cls._single_flight(path, url, data, auth)
+        if group is not None:
+            return await group.ado(key, lambda: cls._acall(path, send))
+        return await cls._acall(path, send)
+
 
 class Customer(CheddarObject):
     __serialize__ = ["id", "first_name", "last_name", "email"]
+    __fields__ = {
+        "is_vat_exempt": INTEGER,
+        "first_contact_datetime": DATETIME,
+        "created_datetime": DATETIME,
+        "modified_datetime": DATETIME,
+    }
+
+    __children__ = ("subscriptions", "meta_data")
+
+    # Subscription fields sent along with the customer, the payment details
+    # and plan of its subscription
+    _subscription_fields = (
+        "cc_first_name",
+        "cc_last_name",
+        "cc_number",
+        "cc_expiration",
+        "cc_card_code",
+        "cc_zip",
+        "return_url",
+        "cancel_url",
+        "method",
+        "plan_code",
+    )
+
+    def _default(self, key):
+        if key == "subscriptions":
+            # Add an empty subscription to the customer object because the
+            # CheddarGetter API creates a customer and subscription at the
+            # same time
+            return [Subscription(parent=self)]
+        elif key == "meta_data":
+            return []
+        return super(Customer, self)._default(key)
 
-    def __init__(self, **kwargs):
-        # Add an empty subscription to the customer object because the
-        # CheddarGetter API creates a customer and subscription at the same
-        # time
-        self.subscriptions = []
-        self.subscriptions.append(Subscription(parent=self))
-        self.meta_data = []
-        super(Customer, self).__init__(**kwargs)
+    @classmethod
+    def _all_from_xml(cls, xml, **options):
+        customers = []
+        for customer_xml in xml.iter(tag="customer"):
+            customers.append(Customer.from_xml(customer_xml, **options))
+        return customers
 
     @classmethod
-    def all(cls):
+    def _get_from_xml(cls, xml, **options):
+        customer_xml = next(xml.iter(tag="customer"), None)
+        if customer_xml is not None:
+            return Customer.from_xml(customer_xml, **options)
+
+        return None
+
+    @classmethod
+    def all(cls, lazy=False, compact=False):
+        """Get every customer. If lazy is set each customer, and each of its
+        subscriptions, invoices and so on, is only decoded from the response
+        when it is first used. If compact is set items, invoices and metadata
+        are loaded as read only records which use far less memory."""
         try:
-            customers = []
             xml = cls.request("/customers/get")
-            for customer_xml in xml.iter(tag="customer"):
-                customers.append(Customer.from_xml(customer_xml))
         except NotFound:
             return []
         else:
-            return customers
+            return cls._all_from_xml(xml, lazy=lazy, compact=compact)
+
+    @classmethod
+    def iter_all(cls, compact=False):
+        """Like all but customers are yielded one at a time while the response
+        is still being parsed, so only one customer is held in memory."""
+        try:
+            for customer_xml in cls.iter_request("/customers/get", "customer"):
+                yield Customer.from_xml(customer_xml, compact=compact)
+        except NotFound:
+            return
 
     @classmethod
-    def list(cls):
+    def to_columns(cls, **filters):
+        """Get customers as a columns.CustomerColumns table, one column per
+        attribute, for analytics over many customers. The response is
+        streamed and read directly into the columns without building Customer
+        objects. The filters are the ones query accepts, apart from the
+        paging arguments."""
+        from .columns import CustomerColumns
+
+        params = cls._query_params(**filters)
+        try:
+            return CustomerColumns.from_elements(
+                cls.iter_request("/customers/get", "customer", **params)
+            )
+        except NotFound:
+            return CustomerColumns.from_elements([])
+
+    @classmethod
+    def query(
+        cls,
+        plan_code=None,
+        subscription_status=None,
+        created_after=None,
+        created_before=None,
+        canceled_after=None,
+        canceled_before=None,
+        search=None,
+        order_by=None,
+        order_by_direction=None,
+        page=None,
+        per_page=None,
+    ):
+        """Get the customers matching the passed filters. Filtering is done by
+        CheddarGetter so only the matching customers are transferred and
+        parsed. plan_code may be a single code or a list of codes and
+        subscription_status is either activeOnly or canceledOnly. Dates may be
+        passed as date objects or YYYY-MM-DD strings.
+
+        Customers are yielded lazily. If page is passed only that page is
+        fetched, otherwise if per_page is passed pages are fetched one after
+        another as the results are consumed, a page at a time."""
+        params = cls._query_params(
+            plan_code=plan_code,
+            subscription_status=subscription_status,
+            created_after=created_after,
+            created_before=created_before,
+            canceled_after=canceled_after,
+            canceled_before=canceled_before,
+            search=search,
+            order_by=order_by,
+            order_by_direction=order_by_direction,
+            per_page=per_page,
+        )
+
+        if page is not None or per_page is None:
+            if page is not None:
+                params["page"] = page
+            for customer in cls._query_page(params):
+                yield customer
+            return
+
+        # Walk through every page, a partial page is the last one. A page
+        # larger than per_page means perPage was ignored and everything was
+        # sent, a page identical to the previous one that page was ignored.
+        page = 1
+        previous = None
+        while True:
+            params["page"] = page
+            customers = list(cls._query_page(params))
+            ids = [customer.id for customer in customers]
+            if ids == previous:
+                return
+            for customer in customers:
+                yield customer
+            if len(customers) != per_page:
+                return
+            previous = ids
+            page += 1
+
+    @classmethod
+    def _query_params(
+        cls,
+        plan_code=None,
+        subscription_status=None,
+        created_after=None,
+        created_before=None,
+        canceled_after=None,
+        canceled_before=None,
+        transacted_after=None,
+        transacted_before=None,
+        search=None,
+        order_by=None,
+        order_by_direction=None,
+        per_page=None,
+    ):
+        """Build the /customers/get request arguments for the filters."""
+        params = {}
+        if plan_code is not None:
+            if isinstance(plan_code, str):
+                plan_code = [plan_code]
+            params["planCode[]"] = list(plan_code)
+
+        dates = {
+            "created_after_date": created_after,
+            "created_before_date": created_before,
+            "canceled_after_date": canceled_after,
+            "canceled_before_date": canceled_before,
+            "transacted_after_date": transacted_after,
+            "transacted_before_date": transacted_before,
+        }
+        for key, value in dates.items():
+            if value is not None:
+                if hasattr(value, "strftime"):
+                    value = value.strftime("%Y-%m-%d")
+                params[key] = value
+
+        others = {
+            "subscription_status": subscription_status,
+            "search": search,
+            "order_by": order_by,
+            "order_by_direction": order_by_direction,
+            "per_page": per_page,
+        }
+        for key, value in others.items():
+            if value is not None:
+                params[key] = value
+
+        return params
+
+    @classmethod
+    def _query_page(cls, params):
+        try:
+            for customer_xml in cls.iter_request(
+                "/customers/get", "customer", **params
+            ):
+                yield Customer.from_xml(customer_xml)
+        except NotFound:
+            return
+
+    @classmethod
+    async def aall(cls, lazy=False, compact=False):
+        try:
+            xml = await cls.arequest("/customers/get")
+        except NotFound:
+            return []
+        else:
+            return cls._all_from_xml(xml, lazy=lazy, compact=compact)
+
+    @classmethod
+    def list(cls, lazy=False, compact=False):
         """The list method of the CheddarGetter API returns a summary of each
         customer rather than the complete history. This is useful because the
         get method often is too large and is returned incomplete."""
         try:
-            customers = []
             xml = cls.request("/customers/list")
-            for customer_xml in xml.iter(tag="customer"):
-                customers.append(Customer.from_xml(customer_xml))
         except NotFound:
             return []
         else:
-            return customers
+            return cls._all_from_xml(xml, lazy=lazy, compact=compact)
 
     @classmethod
-    def get(cls, code):
-        xml = cls.request("/customers/get", code=code)
+    async def alist(cls, lazy=False, compact=False):
+        try:
+            xml = await cls.arequest("/customers/list")
+        except NotFound:
+            return []
+        else:
+            return cls._all_from_xml(xml, lazy=lazy, compact=compact)
 
-        customer_xml = next(xml.iter(tag="customer"), None)
-        if customer_xml is not None:
-            return Customer.from_xml(customer_xml)
+    @classmethod
+    def _cached_customer(cls, code, soft_ttl=None, hard_ttl=None, **options):
+        """The cached copy of a customer or None. Copies older than hard_ttl
+        seconds are not used, copies older than soft_ttl are used but
+        refreshed in the background. None uses the configured default."""
+        cache = cls._customer_cache()
+        if cache is None:
+            return None
+
+        value = cache.get(cls._customer_cache_key(code))
+        if value is None:
+            return None
+        xml = etree.fromstring(value)
+
+        config = current_app.config
+        if soft_ttl is None:
+            soft_ttl = config.get("CHEDDAR_CUSTOMER_SOFT_TTL")
+        if hard_ttl is None:
+            hard_ttl = config.get("CHEDDAR_CUSTOMER_HARD_TTL")
+        if soft_ttl is not None or hard_ttl is not None:
+            fetched = xml.get("fetchedAt")
+            if fetched is None:
+                # Cached before copies were stamped, the age is unknown
+                return None
+            age = time.time() - float(fetched)
+            if hard_ttl is not None and age >= hard_ttl:
+                return None
+            if soft_ttl is not None and age >= soft_ttl:
+                cls._revalidate(code)
+        return Customer.from_xml(xml, **options)
 
-        return None
+    @classmethod
+    def _revalidate(cls, code):
+        """Refresh the cached copy of a customer in the background."""
+
+        def refresh():
+            try:
+                xml = cls.request("/customers/get", code=code)
+            except NotFound:
+                xml = None
+            cls._refresh_customer_cache(code, xml)
+
+        cls._extension().revalidator.submit(cls._customer_cache_key(code), refresh)
+
+    @classmethod
+    def get(cls, code, lazy=False, compact=False, soft_ttl=None, hard_ttl=None):
+        """Get a customer by code. The customer can be loaded lazily or with
+        compact child records, see all.
+
+        With a customer cache soft_ttl and hard_ttl give the stale while
+        revalidate policy of the lookup, defaulting to the configured
+        CHEDDAR_CUSTOMER_SOFT_TTL and CHEDDAR_CUSTOMER_HARD_TTL. A cached copy
+        younger than soft_ttl seconds is returned as is, one younger than
+        hard_ttl seconds is returned at once and refreshed in the background
+        and only older copies wait for CheddarGetter. Without either every
+        cached copy is used, the cache TTL always applies.
+
+        With CHEDDAR_IDENTITY_MAP a customer already loaded during the current
+        request is returned as is."""
+        work = cls._unit_of_work("CHEDDAR_IDENTITY_MAP")
+        if work is not None and work.get(code) is not None:
+            return work.get(code)
+
+        customer = cls._cached_customer(
+            code, soft_ttl=soft_ttl, hard_ttl=hard_ttl, lazy=lazy, compact=compact
+        )
+        if customer is None:
+            xml = cls.request("/customers/get", code=code)
+            cls._refresh_customer_cache(code, xml)
+            customer = cls._get_from_xml(xml, lazy=lazy, compact=compact)
+        return cls._identify(work, customer, compact)
+
+    @classmethod
+    def _identify(cls, work, customer, compact):
+        # Customers with read only records can not stand in for full ones and
+        # an empty customer list has no customer to hold
+        if work is not None and customer is not None and not compact:
+            work.add(customer)
+        return customer
+
+    @classmethod
+    async def aget(cls, code, lazy=False, compact=False, soft_ttl=None, hard_ttl=None):
+        work = cls._unit_of_work("CHEDDAR_IDENTITY_MAP")
+        if work is not None and work.get(code) is not None:
+            return work.get(code)
+
+        customer = cls._cached_customer(
+            code, soft_ttl=soft_ttl, hard_ttl=hard_ttl, lazy=lazy, compact=compact
+        )
+        if customer is None:
+            xml = await cls.arequest("/customers/get", code=code)
+            cls._refresh_customer_cache(code, xml)
+            customer = cls._get_from_xml(xml, lazy=lazy, compact=compact)
+        return cls._identify(work, customer, compact)
+
+    @classmethod
+    def get_many(cls, codes, max_workers=None):
+        """Get several customers concurrently using a pool of worker threads.
+        Returns a dictionary of customers keyed by code, codes of customers
+        that do not exist map to None."""
+        if max_workers is None:
+            max_workers = current_app.config.get("CHEDDAR_MAX_WORKERS", 8)
+        app = current_app._get_current_object()
+
+        def get(code):
+            # Each worker thread needs its own application context
+            with app.app_context():
+                try:
+                    return cls.get(code)
+                except NotFound:
+                    return None
+
+        codes = list(codes)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return dict(zip(codes, executor.map(get, codes)))
 
     @property
     def subscription(self):
         # Current subscription is the first one
         return self.subscriptions[0]
 
-    def save(self):
+    def _prepare_save(self):
+        """Collect the pending changes of the customer, its subscription and
+        metadata. Returns the request path and arguments or None if there is
+        nothing to save."""
         # Collect all the keys from the subscription and modify them to
         # CheddarGetter format for submission with the customer
-        subscription_fields = [
-            "cc_first_name",
-            "cc_last_name",
-            "cc_number",
-            "cc_expiration",
-            "cc_card_code",
-            "cc_zip",
-            "return_url",
-            "cancel_url",
-            "method",
-            "plan_code",
-        ]
-        for key in subscription_fields:
+        for key in self._subscription_fields:
             if key in self.subscription._to_persist:
                 self._to_persist["subscription[%s]" % key] = getattr(
                     self.subscription, key
                 )
 
         for datum in self.meta_data:
+            # Metadata loaded as records is read only
+            if isinstance(datum, Record):
+                continue
             if "value" in datum._to_persist:
                 self._to_persist["metaData[%s]" % datum.name] = datum.value
 
         if not self._to_persist:
-            return
+            return None
 
-        if self.is_new():
+        if self.is_new() and not self._create_queued():
             # Object doesn't exist in Cheddargetter, create it
-            xml = self.request(
-                "/customers/new", code=self._code, is_new=True, **self._to_persist
+            return "/customers/new", dict(
+                self._to_persist, code=self._code, is_new=True
             )
-        else:
-            # Object exists in CheddarGetter, this is just an update
-            xml = self.request("/customers/edit", code=self._code, **self._to_persist)
+
+        # Object exists in CheddarGetter, this is just an update
+        return "/customers/edit", dict(self._to_persist, code=self._code)
+
+    def _saves_subscription(self):
+        """Whether saving sends subscription fields, payment details or a
+        plan change, whose outcome the caller has to see at once."""
+        return any(
+            key in self.subscription._to_persist for key in self._subscription_fields
+        )
+
+    def _create_queued(self):
+        """Whether the creation of this new customer waits in the outbox.
+        Later saves must edit the customer and come after the creation."""
+        return self.__dict__.get("_queued_create", False)
+
+    def _check_not_queued(self):
+        if self.is_new() and self._create_queued():
+            raise ValidationError(
+                "The customer is still being created, save it deferred"
+            )
+
+    def _load_saved(self, xml):
+        self._refresh_customer_cache(self._code, xml)
 
         # Reload the current customer object
         for customer_xml in xml.iter(tag="customer"):
             self._load_from_xml(customer_xml)
 
+        return self._clear_persisted()
+
+    def _clear_persisted(self):
         # We've saved successfully, we don't want to persist the changes again
         self._to_persist = {}
         self.subscription._to_persist = {}
         for datum in self.meta_data:
-            datum._to_persist = {}
+            if not isinstance(datum, Record):
+                datum._to_persist = {}
 
         return self
 
+    def save(self, deferred=False, callback=None):
+        """Save the changes to CheddarGetter. If deferred is set the changes
+        are queued in the outbox, see outbox.Outbox, and sent in the
+        background. The customer is not reloaded then, the outcome is passed
+        to callback instead as the customer code, the saved Customer or None
+        and the exception or None. Card details can not be saved deferred.
+
+        With CHEDDAR_UNIT_OF_WORK saves of existing customers made during a
+        request are sent once when the request ends, along with every change
+        made until then, see CheddarGetter.flush. Saves changing the
+        subscription fields are still sent at once so a declined card is
+        raised and a PayPal redirect_url is loaded."""
+        work = None
+        if not deferred and not self.is_new() and not self._saves_subscription():
+            work = self._unit_of_work("CHEDDAR_UNIT_OF_WORK")
+        if work is not None:
+            work.register_save(self)
+            return self
+        return self._save(deferred, callback)
+
+    def _save(self, deferred=False, callback=None):
+        request_args = self._prepare_save()
+        if request_args is None:
+            return
+
+        path, kwargs = request_args
+        if deferred:
+            self._outbox().put(path, callback=callback, **kwargs)
+            if path == "/customers/new":
+                self._queued_create = True
+            return self._clear_persisted()
+
+        self._check_not_queued()
+        xml = self.request(path, **kwargs)
+        return self._load_saved(xml)
+
+    async def asave(self):
+        """Save the changes to CheddarGetter at once. Unlike save the unit of
+        work is not used, it sends its saves synchronously when the request
+        ends."""
+        request_args = self._prepare_save()
+        if request_args is None:
+            return
+
+        path, kwargs = request_args
+        self._check_not_queued()
+        xml = await self.arequest(path, **kwargs)
+        return self._load_saved(xml)
+
     def update_metadata(self, name, value):
         for datum in self.meta_data:
             if datum.name == name:
@@ -461,32 +1658,115 @@ class Plan(CheddarObject):
         "items",
         "code",
     ]
+    __fields__ = {
+        "is_active": INTEGER,
+        "is_free": INTEGER,
+        "payment_method_is_required": INTEGER,
+        "trial_days": INTEGER,
+        "initial_bill_count": INTEGER,
+        "billing_frequency_quantity": INTEGER,
+        "setup_charge_amount": DECIMAL,
+        "recurring_charge_amount": DECIMAL,
+        "initial_invoice_billing_datetime": DATETIME,
+        "next_invoice_billing_datetime": DATETIME,
+        "created_datetime": DATETIME,
+    }
+
+    @classmethod
+    def _cache_all(cls, xml):
+        plans_xml = list(xml.iter(tag="plan"))
+        cache = cls._plan_cache()
+        if cache is not None:
+            cache.set_all(plans_xml)
+        return plans_xml
+
+    @classmethod
+    def _cache_one(cls, code, xml):
+        plan_xml = next(xml.iter(tag="plan"), None)
+        cache = cls._plan_cache()
+        if cache is not None and plan_xml is not None:
+            cache.set(code, plan_xml)
+        return plan_xml
+
+    @classmethod
+    def _cached_all(cls):
+        cache = cls._plan_cache()
+        return cache.all() if cache is not None else None
+
+    @classmethod
+    def _cached_one(cls, code):
+        cache = cls._plan_cache()
+        return cache.get(code) if cache is not None else None
 
     @classmethod
     def all(cls):
-        plans = []
-        try:
-            xml = cls.request("/plans/get")
-            for plan_xml in xml.iter(tag="plan"):
-                plans.append(Plan.from_xml(plan_xml))
-        except NotFound:
-            return []
-        return plans
+        plans_xml = cls._cached_all()
+        if plans_xml is None:
+            try:
+                xml = cls.request("/plans/get")
+            except NotFound:
+                return []
+            plans_xml = cls._cache_all(xml)
+        return [Plan.from_xml(plan_xml) for plan_xml in plans_xml]
+
+    @classmethod
+    async def aall(cls):
+        plans_xml = cls._cached_all()
+        if plans_xml is None:
+            try:
+                xml = await cls.arequest("/plans/get")
+            except NotFound:
+                return []
+            plans_xml = cls._cache_all(xml)
+        return [Plan.from_xml(plan_xml) for plan_xml in plans_xml]
 
     @classmethod
     def get(cls, code):
-        try:
-            xml = cls.request("/plans/get", code=code)
-            for plan_xml in xml.iter(tag="plan"):
-                return Plan.from_xml(plan_xml)
-        except NotFound:
-            return []
+        plan_xml = cls._cached_one(code)
+        if plan_xml is None:
+            try:
+                xml = cls.request("/plans/get", code=code)
+            except NotFound:
+                return []
+            plan_xml = cls._cache_one(code, xml)
+        if plan_xml is not None:
+            return Plan.from_xml(plan_xml)
+
+    @classmethod
+    async def aget(cls, code):
+        plan_xml = cls._cached_one(code)
+        if plan_xml is None:
+            try:
+                xml = await cls.arequest("/plans/get", code=code)
+            except NotFound:
+                return []
+            plan_xml = cls._cache_one(code, xml)
+        if plan_xml is not None:
+            return Plan.from_xml(plan_xml)
+
+    @classmethod
+    def refresh(cls):
+        """Drop the cached plan catalog and load it again."""
+        cache = cls._plan_cache()
+        if cache is not None:
+            cache.clear()
+        return cls.all()
 
     def save(self):
         raise NotImplementedError
 
     def delete(self):
         self.request("/plans/delete", code=self._code)
+        self._invalidate_cache()
+
+    async def adelete(self):
+        await self.arequest("/plans/delete", code=self._code)
+        self._invalidate_cache()
+
+    def _invalidate_cache(self):
+        cache = self._plan_cache()
+        if cache is not None:
+            cache.invalidate(self._code)
 
 
 class GatewayAccount(CheddarObject):
@@ -516,24 +1796,35 @@ class Subscription(CheddarObject):
         "redirect_url",
         "is_active",
     ]
-
-    def __init__(self, **kwargs):
-        # Create an empty plan object because newly instantiated subscriptions
-        # should have a plan
-        self.plans = []
-        self.plans.append(Plan())
-        self.items = []
-        super(Subscription, self).__init__(**kwargs)
+    __fields__ = {
+        "cc_expiration_date": DATETIME,
+        "canceled_datetime": DATETIME,
+        "created_datetime": DATETIME,
+    }
+
+    __children__ = ("plans", "items")
+
+    def _default(self, key):
+        if key == "plans":
+            # Create an empty plan object because newly instantiated
+            # subscriptions should have a plan
+            return [Plan()]
+        elif key == "items":
+            return []
+        return super(Subscription, self)._default(key)
 
     def __getattr__(self, key):
         # Proxy plan_code to the plan object
-        if inflection.underscore(key) == "plan_code":
+        if _underscore(key) == "plan_code":
             return self.plan.code
         return super(Subscription, self).__getattr__(key)
 
     def __setattr__(self, key, value):
+        if key[0] != "_":
+            self._materialize()
+
         # Intercept plan code and handle it appropriately
-        if inflection.underscore(key) == "plan_code" and value is not self.plan.code:
+        if _underscore(key) == "plan_code" and value is not self.plan.code:
             previous_plan = self.plans.pop(0)
             # Add the new plan to the subscriptions plans
             self.plans.insert(0, Plan.get(value))
@@ -543,7 +1834,7 @@ class Subscription(CheddarObject):
                 # data to be saved if this is a plan change
                 self._to_persist["plan_code"] = self.plan.code
 
-        if inflection.underscore(key) in [
+        if _underscore(key) in [
             "cc_first_name",
             "cc_last_name",
             "cc_number",
@@ -553,7 +1844,7 @@ class Subscription(CheddarObject):
         ]:
             # Always persist these fields in case this is a subscription
             # change (plan or payment change)
-            self._to_persist[inflection.underscore(key)] = value
+            self._to_persist[_underscore(key)] = value
         else:
             super(Subscription, self).__setattr__(key, value)
 
@@ -581,18 +1872,16 @@ class Subscription(CheddarObject):
 
         return True
 
-    def save(self):
+    def save(self, deferred=False, callback=None):
         """Save the subscription to CheddarGetter. The CheddarGetter API does
         not do allow the creation of a subscription unless a customer is created
         at the same time. Calling this save method will save the parent
         customer if this subscription is new (completely new or a reactivation)
-        and in other cases the subscription is being edited."""
-        # If this is a new subscription save the parent customer object instead
-        # OR if this is a previously cancelled subscription we need to save the
-        # customer and associated subscription to create a new subscription.
-        if self.is_new() or self.cancel_type == "customer":
+        and in other cases the subscription is being edited. See Customer.save
+        for deferred and callback."""
+        if self._saves_with_customer():
             if self.customer._is_dirty():
-                self.customer.save()
+                self.customer.save(deferred=deferred, callback=callback)
             return self
 
         # This is not a new customer or a reactivate of a cancelled
@@ -602,17 +1891,52 @@ class Subscription(CheddarObject):
         if not self._to_persist:
             return self
 
+        self._camelize_to_persist()
+        if deferred:
+            self._outbox().put(
+                "/customers/edit-subscription",
+                code=self.customer.code,
+                callback=callback,
+                **self._to_persist
+            )
+            self._to_persist = {}
+            return self
+
+        xml = self.request(
+            "/customers/edit-subscription", code=self.customer.code, **self._to_persist
+        )
+        return self._load_subscription(xml)
+
+    async def asave(self):
+        if self._saves_with_customer():
+            if self.customer._is_dirty():
+                await self.customer.asave()
+            return self
+
+        if not self._to_persist:
+            return self
+
+        self._camelize_to_persist()
+        xml = await self.arequest(
+            "/customers/edit-subscription", code=self.customer.code, **self._to_persist
+        )
+        return self._load_subscription(xml)
+
+    def _saves_with_customer(self):
+        # If this is a new subscription save the parent customer object instead
+        # OR if this is a previously cancelled subscription we need to save the
+        # customer and associated subscription to create a new subscription.
+        return self.is_new() or self.cancel_type == "customer"
+
+    def _camelize_to_persist(self):
         # Convert keys to camel case
         for key in copy.copy(self._to_persist):
             if "_" in key:
-                self._to_persist[inflection.camelize(key, False)] = self._to_persist[
-                    key
-                ]
+                self._to_persist[_camelize(key, False)] = self._to_persist[key]
                 del self._to_persist[key]
 
-        xml = self.request(
-            "/customers/edit-subscription", code=self.customer.code, **self._to_persist
-        )
+    def _load_subscription(self, xml):
+        self._refresh_customer_cache(self.customer.code, xml)
 
         # Reload updated data from response
         subscription_xml = next(xml.iter(tag="subscription"), None)
@@ -623,12 +1947,11 @@ class Subscription(CheddarObject):
 
     def delete(self):
         xml = self.request("/customers/cancel", code=self.customer.code)
+        return self._load_subscription(xml)
 
-        subscription_xml = next(xml.iter(tag="subscription"), None)
-        if subscription_xml is not None:
-            self._load_from_xml(subscription_xml)
-
-        return self
+    async def adelete(self):
+        xml = await self.arequest("/customers/cancel", code=self.customer.code)
+        return self._load_subscription(xml)
 
 
 class Invoice(CheddarObject):
@@ -639,6 +1962,12 @@ class Invoice(CheddarObject):
         "created_datetime",
         "billing_datetime",
     ]
+    __fields__ = {
+        "number": INTEGER,
+        "vat_rate": DECIMAL,
+        "billing_datetime": DATETIME,
+        "created_datetime": DATETIME,
+    }
 
 
 class Item(CheddarObject):
@@ -651,6 +1980,14 @@ class Item(CheddarObject):
         "created",
         "modified",
     ]
+    __fields__ = {
+        "quantity": DECIMAL,
+        "quantity_included": DECIMAL,
+        "is_periodic": INTEGER,
+        "overage_amount": DECIMAL,
+        "created_datetime": DATETIME,
+        "modified_datetime": DATETIME,
+    }
 
     def _normalize_quantity(self, quantity=None):
         if quantity is not None:
@@ -659,20 +1996,14 @@ class Item(CheddarObject):
 
         return quantity
 
-    def increment(self, quantity=None):
-        """Increment the item's quantity by the passed amount. If nothing is
-        passed a quantity of 1 is assumed."""
-
+    def _quantity_data(self, quantity=None):
         data = {}
         if quantity:
             data["quantity"] = self._normalize_quantity(quantity)
+        return data
 
-        xml = self.request(
-            "/customers/add-item-quantity",
-            code=self.subscription.customer.code,
-            item_code=self.code,
-            **data
-        )
+    def _load_quantity(self, xml):
+        self._refresh_customer_cache(self.subscription.customer.code, xml)
 
         item_xpath = '//subscription/items/item[@id="%s"]' % self.id
         (item_xml,) = xml.xpath(item_xpath)
@@ -680,47 +2011,76 @@ class Item(CheddarObject):
 
         return self
 
-    def decrement(self, quantity=None):
-        """Decrement item's quantity to the passed in amount. If nothing is
-        passed a quantity of 1 is assumed."""
-        data = {}
-        if quantity:
-            data["quantity"] = self._normalize_quantity(quantity)
-
+    def _update_quantity(self, path, data):
         xml = self.request(
-            "/customers/remove-item-quantity",
-            code=self.subscription.customer.code,
-            item_code=self.code,
-            **data
+            path, code=self.subscription.customer.code, item_code=self.code, **data
         )
+        return self._load_quantity(xml)
 
-        item_xpath = '//subscription/items/item[@id="%s"]' % self.id
-        (item_xml,) = xml.xpath(item_xpath)
-        self._load_from_xml(item_xml)
-
+    async def _aupdate_quantity(self, path, data):
+        xml = await self.arequest(
+            path, code=self.subscription.customer.code, item_code=self.code, **data
+        )
+        return self._load_quantity(xml)
+
+    def _defer_quantity(self, quantity):
+        """Record the change with the usage meter rather than sending it, the
+        quantity of the item is updated straight away."""
+        quantity = self._normalize_quantity(quantity or 1)
+        self._meter().record(self.subscription.customer.code, self.code, quantity)
+        if self.quantity is not None:
+            self._data["quantity"] = self.quantity + quantity
         return self
 
+    def increment(self, quantity=None, deferred=False):
+        """Increment the item's quantity by the passed amount. If nothing is
+        passed a quantity of 1 is assumed. If deferred is set the change is
+        buffered by the usage meter, see metering.UsageMeter, and sent later
+        together with other changes of the item."""
+        if deferred:
+            return self._defer_quantity(quantity)
+        return self._update_quantity(
+            "/customers/add-item-quantity", self._quantity_data(quantity)
+        )
+
+    async def aincrement(self, quantity=None):
+        return await self._aupdate_quantity(
+            "/customers/add-item-quantity", self._quantity_data(quantity)
+        )
+
+    def decrement(self, quantity=None, deferred=False):
+        """Decrement item's quantity to the passed in amount. If nothing is
+        passed a quantity of 1 is assumed. See increment for deferred."""
+        if deferred:
+            return self._defer_quantity(-self._normalize_quantity(quantity or 1))
+        return self._update_quantity(
+            "/customers/remove-item-quantity", self._quantity_data(quantity)
+        )
+
+    async def adecrement(self, quantity=None):
+        return await self._aupdate_quantity(
+            "/customers/remove-item-quantity", self._quantity_data(quantity)
+        )
+
     def set(self, quantity):
         """Set the item's quantity to the passed in amount. If nothing is
         passed a quantity of 1 is assumed."""
         data = {}
         data["quantity"] = self._normalize_quantity(quantity)
+        return self._update_quantity("/customers/set-item-quantity", data)
 
-        xml = self.request(
-            "/customers/set-item-quantity",
-            code=self.subscription.customer.code,
-            item_code=self.code,
-            **data
-        )
-
-        item_xpath = '//subscription/items/item[@id="%s"]' % self.id
-        (item_xml,) = xml.xpath(item_xpath)
-        self._load_from_xml(item_xml)
-
-        return self
+    async def aset(self, quantity):
+        data = {}
+        data["quantity"] = self._normalize_quantity(quantity)
+        return await self._aupdate_quantity("/customers/set-item-quantity", data)
 
 
 class MetaDatum(CheddarObject):
+    __fields__ = {
+        "created_datetime": DATETIME,
+        "modified_datetime": DATETIME,
+    }
+
     def __init__(self, parent=None, **kwargs):
         super(MetaDatum, self).__init__(parent, **kwargs)
 
@@ -733,6 +2093,7 @@ class MetaDatum(CheddarObject):
         elif key == "id":
             raise AttributeError("CheddarGetter ID is immutable")
         else:
+            self._materialize()
             if key not in self._data or self._data[key] != value:
                 self._to_persist[key] = value
             self._data[key] = value
@@ -745,9 +2106,141 @@ class MetaDatum(CheddarObject):
             return self.__dict__["id"]
         elif key[0] == "_" or key in self.__dict__:
             return self.__dict__[key]
+        elif self.__dict__.get("_xml") is not None:
+            self._materialize()
+            return getattr(self, key)
         elif key in self._to_persist:
             return self._to_persist[key]
         elif key in self._data:
             return self._data[key]
         else:
             raise AttributeError("Key {} does not exist".format(key))
+
+
+# Marks a field a record does not have
+_MISSING = object()
+
+
+class Record(object):
+    """A compact, read only representation of a child object such as an item
+    or an invoice, used when customers are loaded with compact set. Field
+    names are shared by every record of a class so each record only holds a
+    tuple of values, it has no dictionaries and no reference to its parent.
+
+    Subclasses set __model__ to the CheddarObject class they stand in for and
+    share its field schema."""
+
+    __slots__ = ("_id", "_code", "_values")
+    __model__ = None
+
+    _records = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.__fields__ = cls.__model__.__fields__
+        cls.__serialize__ = getattr(cls.__model__, "__serialize__", [])
+        cls._field_index = {}
+        cls._lock = threading.Lock()
+        Record._records[cls.__model__] = cls
+
+    @classmethod
+    def for_model(cls, model):
+        """The record class for a CheddarObject class or None."""
+        return cls._records.get(model)
+
+    @classmethod
+    def _position(cls, key):
+        position = cls._field_index.get(key)
+        if position is None:
+            with cls._lock:
+                position = cls._field_index.setdefault(key, len(cls._field_index))
+        return position
+
+    @classmethod
+    def from_xml(cls, xml):
+        fields = cls.__fields__
+        values = []
+
+        for child in xml:
+            key = _underscore(child.tag)
+            if len(child) > 0:
+                # Nested lists are loaded as tuples of records when possible,
+                # anything else is ignored
+                if len(set([i.tag for i in child])) != 1:
+                    continue
+                record = cls.for_model(_class_for_tag(child[0].tag))
+                if record is None:
+                    value = ()
+                else:
+                    value = tuple(record.from_xml(item_xml) for item_xml in child)
+            else:
+                value = child.text
+                if value is not None:
+                    converter = fields.get(key)
+                    if converter is not None:
+                        try:
+                            value = converter(value)
+                        except (ValueError, ArithmeticError):
+                            pass
+
+            position = cls._position(key)
+            if position >= len(values):
+                values.extend([_MISSING] * (position + 1 - len(values)))
+            values[position] = value
+
+        record = cls.__new__(cls)
+        object.__setattr__(record, "_id", xml.get("id"))
+        object.__setattr__(record, "_code", xml.get("code"))
+        object.__setattr__(record, "_values", tuple(values))
+        return record
+
+    @property
+    def id(self):
+        return self._id
+
+    @property
+    def code(self):
+        return self._code
+
+    def __getattr__(self, key):
+        position = self._field_index.get(key)
+        if position is not None and position < len(self._values):
+            value = self._values[position]
+            if value is not _MISSING:
+                return value
+        raise AttributeError("Key {} does not exist".format(key))
+
+    def __setattr__(self, key, value):
+        raise AttributeError("Records are read only")
+
+    def __eq__(self, other):
+        return self._id == other._id and self._id is not None
+
+    def __contains__(self, key):
+        if key == "id" or key == "_id":
+            return self._id is not None
+        if key == "code" or key == "_code":
+            return self._code is not None
+        return hasattr(self, key)
+
+    def _asdict(self):
+        data = {}
+        for key in self.__serialize__:
+            if hasattr(self, key):
+                data[key] = getattr(self, key)
+        return data
+
+
+class ItemRecord(Record):
+    __slots__ = ()
+    __model__ = Item
+
+
+class InvoiceRecord(Record):
+    __slots__ = ()
+    __model__ = Invoice
+
+
+class MetaDatumRecord(Record):
+    __slots__ = ()
+    __model__ = MetaDatum
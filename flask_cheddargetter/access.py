@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import time
+import arrow
+
+from .cache import LRUCache
+from .cache import CustomerIndex
+
+
+class AccessCache(CustomerIndex):
+    """Cached access decisions, whether a customer's subscription is active,
+    keyed by customer code. The rules are the ones of
+    Subscription.is_active: a subscription is active unless it was cancelled
+    and its billing period, which ends at the billing datetime of the current
+    invoice, is over.
+
+    The decision can only change at the end of the billing period, when a
+    cancelled subscription lapses or a running one renews, so every decision
+    is kept until then. Decisions without such a boundary are kept until the
+    customer is updated or dropped, which happens whenever a response, save
+    or webhook containing the customer comes back. Running subscriptions
+    whose period is over but which were not renewed yet are active for
+    overdue_ttl seconds only, CheddarGetter may still fail to bill them.
+    Customers that do not exist are not active for missing_ttl seconds only,
+    they may be created without this process hearing of it.
+
+    The decisions are kept in store, see cache.CustomerIndex. The default
+    store is an in process cache holding the decisions of at most maxsize
+    customers."""
+
+    key_prefix = "access:"
+
+    def __init__(self, store=None, maxsize=10000, missing_ttl=300, overdue_ttl=300):
+        self.maxsize = maxsize
+        self.missing_ttl = missing_ttl
+        self.overdue_ttl = overdue_ttl
+        super(AccessCache, self).__init__(store)
+
+    def default_store(self):
+        return LRUCache(maxsize=self.maxsize)
+
+    @classmethod
+    def decision_from_xml(cls, customer_xml, now=None, overdue_ttl=300):
+        """Decide whether the customer element is active. Returns the decision
+        and the timestamp it expires at, None if it does not expire. Only the
+        current subscription, the first one, is considered."""
+        if now is None:
+            now = time.time()
+        subscription_xml = customer_xml.find("subscriptions/subscription")
+        if subscription_xml is None:
+            return False, None
+
+        billing = subscription_xml.findtext("invoices/invoice/billingDatetime")
+        period_end = arrow.get(billing).timestamp() if billing else None
+        over = period_end is not None and period_end <= now
+
+        if subscription_xml.findtext("cancelType"):
+            # Cancelled subscriptions are active until the period is over
+            if over:
+                return False, None
+            return period_end is not None, period_end
+        if over:
+            # The renewal is due but was not seen yet, check again soon
+            return True, now + overdue_ttl
+        return True, period_end
+
+    def get(self, code):
+        """Return whether the customer is active or None if there is no
+        current decision for the customer."""
+        value = self._load(code)
+        if value is None:
+            return None
+        active, expires = value
+        if expires is not None and expires <= time.time():
+            self.remove(code)
+            return None
+        return active
+
+    def set(self, code, active, expires=None):
+        self._dump(code, [active, expires])
+
+    def set_missing(self, code):
+        """Decide that the customer, which does not exist, is not active
+        for the next missing_ttl seconds."""
+        self.set(code, False, time.time() + self.missing_ttl)
+
+    def update(self, customer_xml):
+        """Decide, or decide again, for the customer element."""
+        self.set(
+            customer_xml.get("code"),
+            *self.decision_from_xml(customer_xml, overdue_ttl=self.overdue_ttl)
+        )
+
+    def remove(self, code):
+        self.store.delete(self._key(code))
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+import time
+import shelve
+import simplejson as json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PlanCache(object):
+    """A process wide cache of the plan catalog. Plans are stored as XML
+    elements rather than Plan objects so every lookup builds fresh objects
+    that callers are free to modify. Entries expire after ttl seconds, a ttl
+    of None keeps them until they are invalidated."""
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._plans = {}
+        self._catalog = None
+
+    def _expiry(self):
+        if self.ttl is None:
+            return None
+        return time.monotonic() + self.ttl
+
+    def _is_fresh(self, expiry):
+        return expiry is None or expiry > time.monotonic()
+
+    def get(self, code):
+        """Return the cached plan element for code or None."""
+        with self._lock:
+            entry = self._plans.get(code)
+            if entry is None or not self._is_fresh(entry[1]):
+                return None
+            return entry[0]
+
+    def set(self, code, plan_xml):
+        with self._lock:
+            self._plans[code] = (plan_xml, self._expiry())
+
+    def all(self):
+        """Return the cached list of every plan element or None if the full
+        catalog has not been loaded or has expired."""
+        with self._lock:
+            if self._catalog is None or not self._is_fresh(self._catalog[1]):
+                return None
+            return list(self._catalog[0])
+
+    def set_all(self, plans_xml):
+        with self._lock:
+            expiry = self._expiry()
+            self._catalog = (list(plans_xml), expiry)
+            self._plans = {}
+            for plan_xml in plans_xml:
+                self._plans[plan_xml.get("code")] = (plan_xml, expiry)
+
+    def invalidate(self, code):
+        """Drop a single plan, the catalog is dropped as well because it would
+        otherwise still contain the plan."""
+        with self._lock:
+            self._plans.pop(code, None)
+            self._catalog = None
+
+    def clear(self):
+        with self._lock:
+            self._plans = {}
+            self._catalog = None
+
+
+class CacheBackend(object):
+    """Interface for customer cache backends. Values are the serialized
+    customer XML so a shared store such as memcached or redis only has to
+    hold bytes. Implementations must be safe to use from several threads."""
+
+    def get(self, key):
+        """Return the value stored for key or None."""
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    """An in process cache holding at most maxsize entries, the least
+    recently used entry is evicted first. A maxsize of None never evicts.
+    Entries expire after ttl seconds, a ttl of None keeps them until they are
+    evicted."""
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expiry = entry
+            if expiry is not None and expiry <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expiry = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[key] = (value, expiry)
+            self._entries.move_to_end(key)
+            while self.maxsize is not None and len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class Revalidator(object):
+    """Refreshes stale cache entries in the background on a pool of
+    max_workers threads started when first needed. A refresh of a key is only
+    started if none is pending for it already, errors are logged to the logger
+    of app."""
+
+    def __init__(self, app, max_workers=2):
+        self.app = app
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._executor = None
+
+    def submit(self, key, func):
+        """Call func in the application context of a worker thread. Returns
+        False if a refresh of key is pending already."""
+        with self._lock:
+            if key in self._pending:
+                return False
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix="cheddargetter-revalidate"
+                )
+            self._pending.add(key)
+            self._executor.submit(self._run, key, func)
+        return True
+
+    def _run(self, key, func):
+        try:
+            with self.app.app_context():
+                func()
+        except Exception:
+            self.app.logger.exception("Refreshing %s failed", key)
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def shutdown(self, wait=True):
+        """Stop the worker threads, by default once the pending refreshes are
+        done. Threads are started again by the next submit."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+class ShelveCache(CacheBackend):
+    """A cache persisted to disk with the shelve module. Entries never
+    expire, which makes it suitable as a durable local store."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._shelf = shelve.open(path)
+
+    def get(self, key):
+        with self._lock:
+            return self._shelf.get(key)
+
+    def set(self, key, value):
+        with self._lock:
+            self._shelf[key] = value
+
+    def delete(self, key):
+        with self._lock:
+            self._shelf.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._shelf.clear()
+
+    def keys(self):
+        with self._lock:
+            return list(self._shelf.keys())
+
+    def sync(self):
+        with self._lock:
+            self._shelf.sync()
+
+    def close(self):
+        with self._lock:
+            self._shelf.close()
+
+
+class CustomerIndex(object):
+    """Base of the values derived from customers and kept in store, any
+    CacheBackend, keyed by customer code. Values are encoded as JSON so a
+    shared store only has to hold strings. Subclasses set key_prefix so
+    several indexes can share a store."""
+
+    key_prefix = None
+
+    def __init__(self, store=None):
+        if store is None:
+            store = self.default_store()
+        self.store = store
+
+    def default_store(self):
+        """The store used when none is passed, an unbounded in process
+        cache."""
+        return LRUCache(maxsize=None)
+
+    @classmethod
+    def from_config(cls, value, **kwargs):
+        """Build an index from a configuration value, True for the default
+        store or a CacheBackend instance to store it in. Returns None if the
+        value is false."""
+        if value is True:
+            return cls(**kwargs)
+        if value:
+            return cls(value, **kwargs)
+        return None
+
+    def _key(self, code):
+        return "{}{}".format(self.key_prefix, code)
+
+    def _load(self, code, **kwargs):
+        """The decoded value of a customer or None, kwargs are passed to
+        json.loads."""
+        value = self.store.get(self._key(code))
+        if value is None:
+            return None
+        return json.loads(value, **kwargs)
+
+    def _dump(self, code, value):
+        self.store.set(self._key(code), json.dumps(value))
+
+    def remove(self, code):
+        self.store.delete(self._key(code))
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+from collections.abc import Mapping
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from flask_cheddargetter import DATETIME
+from flask_cheddargetter import DECIMAL
+from flask_cheddargetter import _parse_datetime
+
+
+def _to_datetime64(value):
+    # numpy datetimes have no timezone, store everything as naive UTC
+    value = _parse_datetime(value)
+    return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class CustomerColumns(Mapping):
+    """Customer data held column by column rather than as Customer objects,
+    one row per customer. Subscription and plan columns come from the first
+    subscription of each customer, the same one Customer.subscription
+    returns, and are None when a customer has no subscription.
+
+    The columns are read straight from the XML elements, no Customer objects
+    are built. When NumPy is installed every column is an array so the data
+    can be aggregated with vectorized operations: amounts are float64 with
+    nan for missing values, datetimes are naive UTC datetime64 with NaT for
+    missing values and text is an object array. Without NumPy the columns
+    are lists holding the values the models would have, Decimal and aware
+    datetime objects.
+
+    Item usage is kept apart in quantities, a mapping of item code to a
+    column of quantities that is zero for customers without the item."""
+
+    # Column name, tag of the element the value is read from and converter
+    customer_columns = [
+        ("first_name", "firstName", None),
+        ("last_name", "lastName", None),
+        ("company", "company", None),
+        ("email", "email", None),
+        ("created_datetime", "createdDatetime", DATETIME),
+        ("modified_datetime", "modifiedDatetime", DATETIME),
+    ]
+    subscription_columns = [
+        ("subscription_created_datetime", "createdDatetime", DATETIME),
+        ("canceled_datetime", "canceledDatetime", DATETIME),
+        ("cancel_type", "cancelType", None),
+    ]
+    plan_columns = [
+        ("plan_name", "name", None),
+        ("billing_frequency", "billingFrequency", None),
+        ("setup_charge_amount", "setupChargeAmount", DECIMAL),
+        ("recurring_charge_amount", "recurringChargeAmount", DECIMAL),
+    ]
+
+    def __init__(self, columns, quantities, rows):
+        self._columns = columns
+        self.quantities = quantities
+        self.rows = rows
+
+    @classmethod
+    def names(cls):
+        """The names of the columns in order."""
+        return (
+            ["id", "code"]
+            + [name for name, tag, converter in cls.customer_columns]
+            + ["plan_code", "status"]
+            + [name for name, tag, converter in cls.subscription_columns]
+            + [name for name, tag, converter in cls.plan_columns]
+        )
+
+    @classmethod
+    def _converters(cls):
+        if numpy is None:
+            return {DECIMAL: DECIMAL, DATETIME: DATETIME}
+        return {DECIMAL: float, DATETIME: _to_datetime64}
+
+    @classmethod
+    def from_xml(cls, xml):
+        """Build the columns from a parsed customers response."""
+        return cls.from_elements(xml.iter(tag="customer"))
+
+    @classmethod
+    def from_elements(cls, elements):
+        """Build the columns from customer elements. Each element is read
+        completely before the next one is taken, so the elements streamed by
+        CheddarObject.iter_request may be passed directly."""
+        values = {name: [] for name in cls.names()}
+        quantities = {}
+        converters = cls._converters()
+
+        rows = 0
+        for customer_xml in elements:
+            cls._read_row(values, quantities, rows, customer_xml, converters)
+            rows += 1
+
+        return cls(cls._build(values), cls._build_quantities(quantities, rows), rows)
+
+    @classmethod
+    def _read(cls, values, specs, element, converters):
+        """Append a value to each column in specs from the children of
+        element, which is walked once. Returns the children that have
+        children of their own keyed by tag."""
+        texts = {}
+        nested = {}
+        if element is not None:
+            for child in element:
+                if len(child):
+                    nested[child.tag] = child
+                else:
+                    texts[child.tag] = child.text
+
+        for name, tag, converter in specs:
+            value = texts.get(tag)
+            if value is not None and converter is not None:
+                try:
+                    value = converters[converter](value)
+                except (ValueError, ArithmeticError):
+                    value = None
+            values[name].append(value)
+        return nested
+
+    @classmethod
+    def _read_row(cls, values, quantities, row, customer_xml, converters):
+        values["id"].append(customer_xml.get("id"))
+        values["code"].append(customer_xml.get("code"))
+        nested = cls._read(values, cls.customer_columns, customer_xml, converters)
+
+        subscription_xml = None
+        if "subscriptions" in nested:
+            subscription_xml = nested["subscriptions"][0]
+        nested = cls._read(
+            values, cls.subscription_columns, subscription_xml, converters
+        )
+
+        plan_xml = None
+        if "plans" in nested:
+            plan_xml = nested["plans"][0]
+        cls._read(values, cls.plan_columns, plan_xml, converters)
+        values["plan_code"].append(None if plan_xml is None else plan_xml.get("code"))
+
+        status = None
+        if subscription_xml is not None:
+            if values["canceled_datetime"][-1] is None:
+                status = "active"
+            else:
+                status = "canceled"
+        values["status"].append(status)
+
+        convert = converters[DECIMAL]
+        for item_xml in nested.get("items", ()):
+            quantity = item_xml.findtext("quantity")
+            if quantity:
+                column = quantities.setdefault(item_xml.get("code"), ([], []))
+                column[0].append(row)
+                column[1].append(convert(quantity))
+
+    @classmethod
+    def _build(cls, values):
+        if numpy is None:
+            return values
+
+        dtypes = {"id": object, "code": object, "plan_code": object, "status": object}
+        for specs in cls.customer_columns, cls.subscription_columns, cls.plan_columns:
+            for name, tag, converter in specs:
+                if converter is DATETIME:
+                    dtypes[name] = "datetime64[s]"
+                elif converter is DECIMAL:
+                    dtypes[name] = numpy.float64
+                else:
+                    dtypes[name] = object
+
+        return {
+            name: numpy.array(column, dtype=dtypes[name])
+            for name, column in values.items()
+        }
+
+    @classmethod
+    def _build_quantities(cls, quantities, rows):
+        columns = {}
+        for code, (positions, values) in quantities.items():
+            if numpy is None:
+                column = [DECIMAL(0)] * rows
+                for position, value in zip(positions, values):
+                    column[position] = value
+            else:
+                column = numpy.zeros(rows)
+                column[positions] = values
+            columns[code] = column
+        return columns
+
+    def __getitem__(self, name):
+        return self._columns[name]
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __len__(self):
+        return len(self._columns)
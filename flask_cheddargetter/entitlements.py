@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+from collections import namedtuple
+from decimal import Decimal
+from decimal import InvalidOperation
+
+from .cache import CustomerIndex
+
+
+class Entitlement(namedtuple("Entitlement", ["name", "included", "used"])):
+    """The quantity of an item included in a customer's plan and the
+    quantity the customer has used so far."""
+
+    __slots__ = ()
+
+    @property
+    def remaining(self):
+        return self.included - self.used
+
+
+def _quantity(value):
+    try:
+        return Decimal(value) if value else Decimal(0)
+    except InvalidOperation:
+        return Decimal(0)
+
+
+class EntitlementIndex(CustomerIndex):
+    """An index of the items each customer is entitled to, keyed by customer
+    code. Entries are computed from the customer XML alone, the plan and its
+    included quantities are part of every customer response, so a customer
+    can be reindexed whenever a response containing it comes back.
+
+    The entries are kept in store, see cache.CustomerIndex, use a
+    cache.ShelveCache to keep the index across restarts. The default store is
+    an unbounded in process cache."""
+
+    key_prefix = "entitlements:"
+
+    @classmethod
+    def entitlements_from_xml(cls, customer_xml):
+        """Compute the entitlements of a customer element keyed by item code.
+        Only the current subscription, the first one, is considered."""
+        subscription_xml = customer_xml.find("subscriptions/subscription")
+        if subscription_xml is None:
+            return {}
+
+        entitlements = {}
+        for item_xml in subscription_xml.iterfind("plans/plan/items/item"):
+            entitlements[item_xml.get("code")] = Entitlement(
+                item_xml.findtext("name"),
+                _quantity(item_xml.findtext("quantityIncluded")),
+                Decimal(0),
+            )
+        for item_xml in subscription_xml.iterfind("items/item"):
+            code = item_xml.get("code")
+            used = _quantity(item_xml.findtext("quantity"))
+            if code in entitlements:
+                entitlements[code] = entitlements[code]._replace(used=used)
+            else:
+                # Usage of an item the plan does not include
+                entitlements[code] = Entitlement(
+                    item_xml.findtext("name"), Decimal(0), used
+                )
+        return entitlements
+
+    def get(self, code):
+        """Return the entitlements of a customer keyed by item code or None
+        if the customer is not in the index."""
+        value = self._load(code, use_decimal=True)
+        if value is None:
+            return None
+        return {item_code: Entitlement(*entry) for item_code, entry in value.items()}
+
+    def update(self, customer_xml):
+        """Index, or reindex, the customer element."""
+        entitlements = self.entitlements_from_xml(customer_xml)
+        self._dump(
+            customer_xml.get("code"),
+            {code: list(entry) for code, entry in entitlements.items()},
+        )
+
+    def rebuild(self, customers_xml):
+        """Replace the whole index with the customer elements passed, any
+        customer not among them is dropped. The store is cleared first so it
+        should only hold the index. Returns the number of customers
+        indexed."""
+        self.store.clear()
+        count = 0
+        for customer_xml in customers_xml:
+            self.update(customer_xml)
+            count += 1
+        return count
@@ -31,3 +31,7 @@ class GatewayFailure(CheddarException):
 
 class GatewayConnectionError(CheddarException):
     pass
+
+
+class CircuitOpen(CheddarException):
+    pass
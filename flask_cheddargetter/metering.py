@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+import atexit
+import threading
+import simplejson as json
+from decimal import Decimal
+
+from flask_cheddargetter import Customer
+from flask_cheddargetter.exceptions import BadRequest
+from flask_cheddargetter.exceptions import NotFound
+
+
+class UsageMeter(object):
+    """Buffers item quantity changes so metered usage does not cost a
+    CheddarGetter request per event. Changes are added up per customer and
+    item and sent as a single add or remove of the net quantity when the
+    buffer holds max_pending customer and item pairs, every interval seconds
+    and on flush.
+
+    The pending totals are written to store, any cache.CacheBackend, before
+    record returns. With a durable store such as cache.ShelveCache usage that
+    was not sent before a restart is sent by the next meter using the store.
+    Totals are only dropped from the store once CheddarGetter accepted them
+    so delivery is at least once: a crash between the two sends them again.
+    The pending totals are kept under a single key so every process needs a
+    store of its own, a cache.ShelveCache can not be shared between
+    processes either.
+    """
+
+    pending_key = "metering:pending"
+
+    def __init__(self, app, store, max_pending=100, interval=10):
+        self.app = app
+        self.store = store
+        self.max_pending = max_pending
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stopped = False
+        self.pending = self._load()
+
+    def _load(self):
+        value = self.store.get(self.pending_key)
+        if value is None:
+            return {}
+        return {
+            (customer_code, item_code): Decimal(quantity)
+            for customer_code, item_code, quantity in json.loads(
+                value, use_decimal=True
+            )
+        }
+
+    def _persist(self):
+        # Called with the lock held
+        self.store.set(
+            self.pending_key,
+            json.dumps(
+                [
+                    [customer_code, item_code, quantity]
+                    for (customer_code, item_code), quantity in self.pending.items()
+                ]
+            ),
+        )
+
+    def record(self, customer_code, item_code, quantity=1):
+        """Record a change of quantity, negative quantities are removed."""
+        key = (str(customer_code), item_code)
+        with self._lock:
+            self.pending[key] = self.pending.get(key, Decimal(0)) + Decimal(quantity)
+            self._persist()
+            full = len(self.pending) >= self.max_pending
+
+        self._start()
+        if full:
+            self._wake.set()
+
+    def _send(self, customer_code, item_code, quantity):
+        if quantity > 0:
+            path = "/customers/add-item-quantity"
+        else:
+            path = "/customers/remove-item-quantity"
+        xml = Customer.request(
+            path,
+            code=customer_code,
+            item_code=item_code,
+            quantity=abs(quantity).quantize(Decimal(".0001")),
+        )
+        Customer._refresh_customer_cache(customer_code, xml)
+
+    def flush(self):
+        """Send the pending totals. Totals CheddarGetter rejects as invalid,
+        for instance because the customer no longer exists, are dropped,
+        anything else is kept to be sent again. Returns the number of
+        requests made."""
+        with self._flush_lock:
+            with self._lock:
+                pending = dict(self.pending)
+
+            sent = 0
+            with self.app.app_context():
+                for key, quantity in pending.items():
+                    if quantity != 0:
+                        try:
+                            self._send(key[0], key[1], quantity)
+                        except (BadRequest, NotFound):
+                            pass
+                        sent += 1
+
+                    # Changes recorded while sending stay pending
+                    with self._lock:
+                        remaining = self.pending.get(key, Decimal(0)) - quantity
+                        if remaining == 0:
+                            self.pending.pop(key, None)
+                        else:
+                            self.pending[key] = remaining
+                        self._persist()
+            return sent
+
+    def _start(self):
+        if self._thread is not None or self._stopped:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+                atexit.register(self._stop_at_exit)
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                self.app.logger.exception("Sending metered usage failed")
+
+    def _stop_at_exit(self):
+        try:
+            self.stop()
+        except Exception:
+            # The usage stays in the store to be sent after the restart
+            self.app.logger.exception("Sending metered usage failed")
+
+    def stop(self, flush=True):
+        """Stop the background thread, sending what is pending first unless
+        flush is False."""
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None:
+            atexit.unregister(self._stop_at_exit)
+            self._thread.join()
+        if flush:
+            self.flush()
@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+
+import copy
+import sqlite3
+import datetime
+import itertools
+import threading
+from lxml import etree
+
+from flask_cheddargetter import Customer
+from flask_cheddargetter import _parse_datetime
+from flask_cheddargetter.cache import CacheBackend
+from flask_cheddargetter.exceptions import NotFound
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS customers (
+    code TEXT PRIMARY KEY,
+    id TEXT,
+    first_name TEXT,
+    last_name TEXT,
+    email TEXT,
+    company TEXT,
+    created_datetime TEXT,
+    modified_datetime TEXT,
+    xml BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS customers_email ON customers (email);
+CREATE INDEX IF NOT EXISTS customers_created ON customers (created_datetime);
+
+CREATE TABLE IF NOT EXISTS subscriptions (
+    customer_code TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    id TEXT,
+    plan_code TEXT,
+    status TEXT,
+    created_datetime TEXT,
+    canceled_datetime TEXT,
+    PRIMARY KEY (customer_code, position)
+);
+CREATE INDEX IF NOT EXISTS subscriptions_plan
+    ON subscriptions (plan_code, status, position);
+
+CREATE TABLE IF NOT EXISTS items (
+    customer_code TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    item_code TEXT NOT NULL,
+    quantity NUMERIC,
+    quantity_included NUMERIC
+);
+CREATE INDEX IF NOT EXISTS items_customer ON items (customer_code, position);
+CREATE INDEX IF NOT EXISTS items_code ON items (item_code);
+
+CREATE TABLE IF NOT EXISTS invoices (
+    customer_code TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    id TEXT,
+    number INTEGER,
+    type TEXT,
+    billing_datetime TEXT,
+    created_datetime TEXT
+);
+CREATE INDEX IF NOT EXISTS invoices_customer ON invoices (customer_code, position);
+CREATE INDEX IF NOT EXISTS invoices_billing ON invoices (billing_datetime);
+
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value BLOB);
+"""
+
+# The tables holding customers, in the order they are emptied
+TABLES = ("items", "invoices", "subscriptions", "customers")
+
+# The same tables in the staging database a load is written to
+STAGING_SCHEMA = SCHEMA.replace(
+    "CREATE TABLE IF NOT EXISTS ", "CREATE TABLE staging."
+).replace("CREATE INDEX IF NOT EXISTS ", "CREATE INDEX staging.")
+
+
+def _text(element, tag):
+    # Empty elements have no text, findtext returns "" for those
+    return element.findtext(tag) or None
+
+
+def _datetime(element, tag):
+    """Datetimes are stored as UTC ISO 8601 strings so they sort and compare
+    correctly as text."""
+    value = _text(element, tag)
+    if value is None:
+        return None
+    try:
+        value = _parse_datetime(value)
+    except ValueError:
+        return None
+    return value.astimezone(datetime.timezone.utc).isoformat()
+
+
+def _datetime_param(value):
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return value.astimezone(datetime.timezone.utc).isoformat()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+
+class CustomerMirror(CacheBackend):
+    """A local SQLite copy of customers with indexed tables of their
+    subscriptions, items and invoices, so customers can be queried without
+    going to CheddarGetter. The complete customer XML is kept as well and
+    queries return Customer objects built from it.
+
+    Only the first, current, subscription of each customer is considered by
+    query but every subscription is stored with its position. Datetimes are
+    stored as UTC ISO 8601 strings.
+
+    Load it with load_all or, as the mirror is also a cache.CacheBackend, pass
+    it as the store of a sync.CustomerSync to keep it up to date
+    incrementally. path is the database file, the default keeps the mirror in
+    memory."""
+
+    customer_prefix = "customer:"
+
+    # Customers written to the staging tables per transaction while loading
+    load_batch_size = 100
+
+    def __init__(self, path=":memory:"):
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+
+    def _delete_customer(self, code, schema="main"):
+        for table in ("items", "invoices", "subscriptions"):
+            self.connection.execute(
+                "DELETE FROM {}.{} WHERE customer_code = ?".format(schema, table),
+                (code,),
+            )
+        self.connection.execute(
+            "DELETE FROM {}.customers WHERE code = ?".format(schema), (code,)
+        )
+
+    def _insert_customer(self, customer_xml, value=None, schema="main"):
+        code = customer_xml.get("code")
+        if value is None:
+            value = etree.tostring(customer_xml, with_tail=False)
+        self._delete_customer(code, schema)
+        self.connection.execute(
+            "INSERT INTO {}.customers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)".format(
+                schema
+            ),
+            (
+                code,
+                customer_xml.get("id"),
+                _text(customer_xml, "firstName"),
+                _text(customer_xml, "lastName"),
+                _text(customer_xml, "email"),
+                _text(customer_xml, "company"),
+                _datetime(customer_xml, "createdDatetime"),
+                _datetime(customer_xml, "modifiedDatetime"),
+                value,
+            ),
+        )
+
+        subscriptions = customer_xml.iterfind("subscriptions/subscription")
+        for position, subscription_xml in enumerate(subscriptions):
+            canceled_datetime = _datetime(subscription_xml, "canceledDatetime")
+            plan_xml = subscription_xml.find("plans/plan")
+            self.connection.execute(
+                "INSERT INTO {}.subscriptions VALUES (?, ?, ?, ?, ?, ?, ?)".format(
+                    schema
+                ),
+                (
+                    code,
+                    position,
+                    subscription_xml.get("id"),
+                    None if plan_xml is None else plan_xml.get("code"),
+                    "active" if canceled_datetime is None else "canceled",
+                    _datetime(subscription_xml, "createdDatetime"),
+                    canceled_datetime,
+                ),
+            )
+
+            included = {}
+            if plan_xml is not None:
+                for item_xml in plan_xml.iterfind("items/item"):
+                    included[item_xml.get("code")] = _text(item_xml, "quantityIncluded")
+            self.connection.executemany(
+                "INSERT INTO {}.items VALUES (?, ?, ?, ?, ?)".format(schema),
+                [
+                    (
+                        code,
+                        position,
+                        item_xml.get("code"),
+                        _text(item_xml, "quantity") or 0,
+                        included.get(item_xml.get("code")) or 0,
+                    )
+                    for item_xml in subscription_xml.iterfind("items/item")
+                ],
+            )
+            self.connection.executemany(
+                "INSERT INTO {}.invoices VALUES (?, ?, ?, ?, ?, ?, ?)".format(schema),
+                [
+                    (
+                        code,
+                        position,
+                        invoice_xml.get("id"),
+                        _text(invoice_xml, "number"),
+                        _text(invoice_xml, "type"),
+                        _datetime(invoice_xml, "billingDatetime"),
+                        _datetime(invoice_xml, "createdDatetime"),
+                    )
+                    for invoice_xml in subscription_xml.iterfind("invoices/invoice")
+                ],
+            )
+
+    def update(self, customer_xml):
+        """Add the customer element to the mirror or replace it."""
+        with self._lock, self.connection:
+            self._insert_customer(customer_xml)
+
+    def remove(self, code):
+        with self._lock, self.connection:
+            self._delete_customer(code)
+
+    def load(self, customers_xml):
+        """Replace the customers in the mirror with the customer elements
+        passed. They are written to staging tables in batches of
+        load_batch_size and swapped in in a single transaction, the mirror is
+        only locked for each batch and the swap so it can be queried while
+        the customers stream in. Changes made to the mirror while loading are
+        replaced by the load. Returns the number of customers loaded."""
+        count = 0
+        with self._load_lock:
+            with self._lock:
+                # An empty name is a temporary database dropped when detached
+                self.connection.execute("ATTACH DATABASE '' AS staging")
+                self.connection.executescript(STAGING_SCHEMA)
+            try:
+                customers_xml = iter(customers_xml)
+                while True:
+                    # Streamed elements are freed once the next one is read
+                    batch = [
+                        copy.deepcopy(customer_xml)
+                        for customer_xml in itertools.islice(
+                            customers_xml, self.load_batch_size
+                        )
+                    ]
+                    if not batch:
+                        break
+                    with self._lock, self.connection:
+                        for customer_xml in batch:
+                            self._insert_customer(customer_xml, schema="staging")
+                    count += len(batch)
+
+                with self._lock, self.connection:
+                    for table in TABLES:
+                        self.connection.execute("DELETE FROM main.{}".format(table))
+                        self.connection.execute(
+                            "INSERT INTO main.{0} SELECT * FROM staging.{0}".format(
+                                table
+                            )
+                        )
+            finally:
+                with self._lock:
+                    self.connection.execute("DETACH DATABASE staging")
+        return count
+
+    def load_all(self):
+        """Replace the mirror with every customer, the response is streamed
+        so the customers never have to be held in memory at once."""
+        try:
+            return self.load(Customer.iter_request("/customers/get", "customer"))
+        except NotFound:
+            return self.load([])
+
+    def get_customer(self, code):
+        """Return the mirrored customer or None."""
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT xml FROM customers WHERE code = ?", (code,)
+            ).fetchone()
+        if row is None:
+            return None
+        return Customer.from_xml(etree.fromstring(row[0]))
+
+    def query(
+        self,
+        plan_code=None,
+        status=None,
+        item_code=None,
+        over_quota=False,
+        created_after=None,
+        created_before=None,
+        search=None,
+        order_by="code",
+        limit=None,
+    ):
+        """Get the mirrored customers matching the filters as Customer
+        objects. plan_code may be a single code or a list of codes and status
+        is either active or canceled. If item_code is passed only customers
+        using that item are returned and if over_quota is set only customers
+        using more of it, or of any item without item_code, than their plan
+        includes. search matches the start of the code, names or email."""
+        where = []
+        params = []
+
+        if plan_code is not None:
+            if isinstance(plan_code, str):
+                plan_code = [plan_code]
+            plan_code = list(plan_code)
+            where.append(
+                "s.plan_code IN ({})".format(", ".join("?" for i in plan_code))
+            )
+            params.extend(plan_code)
+        if status is not None:
+            where.append("s.status = ?")
+            params.append(status)
+        if item_code is not None or over_quota:
+            condition = "i.customer_code = c.code AND i.position = 0"
+            if item_code is not None:
+                condition += " AND i.item_code = ?"
+                params.append(item_code)
+            if over_quota:
+                condition += " AND i.quantity > i.quantity_included"
+            where.append("EXISTS (SELECT 1 FROM items i WHERE {})".format(condition))
+        if created_after is not None:
+            where.append("c.created_datetime >= ?")
+            params.append(_datetime_param(created_after))
+        if created_before is not None:
+            where.append("c.created_datetime < ?")
+            params.append(_datetime_param(created_before))
+        if search is not None:
+            where.append(
+                "(c.code LIKE ? OR c.first_name LIKE ? OR c.last_name LIKE ? "
+                "OR c.email LIKE ?)"
+            )
+            params.extend([search + "%"] * 4)
+
+        if order_by not in ("code", "email", "created_datetime", "modified_datetime"):
+            raise ValueError("Can not order by {}".format(order_by))
+
+        sql = (
+            "SELECT c.xml FROM customers c LEFT JOIN subscriptions s "
+            "ON s.customer_code = c.code AND s.position = 0"
+        )
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY c.{}".format(order_by)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with self._lock:
+            rows = self.connection.execute(sql, params).fetchall()
+        return [Customer.from_xml(etree.fromstring(row[0])) for row in rows]
+
+    def __len__(self):
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM customers").fetchone()[
+                0
+            ]
+
+    # The cache.CacheBackend interface, customer keys hold the customer XML
+    # and everything else, such as the watermark of a sync, is kept in meta
+
+    def get(self, key):
+        with self._lock:
+            if key.startswith(self.customer_prefix):
+                row = self.connection.execute(
+                    "SELECT xml FROM customers WHERE code = ?",
+                    (key[len(self.customer_prefix) :],),
+                ).fetchone()
+            else:
+                row = self.connection.execute(
+                    "SELECT value FROM meta WHERE key = ?", (key,)
+                ).fetchone()
+        return None if row is None else row[0]
+
+    def set(self, key, value):
+        with self._lock, self.connection:
+            if key.startswith(self.customer_prefix):
+                self._insert_customer(etree.fromstring(value), value)
+            else:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value)
+                )
+
+    def delete(self, key):
+        with self._lock, self.connection:
+            if key.startswith(self.customer_prefix):
+                self._delete_customer(key[len(self.customer_prefix) :])
+            else:
+                self.connection.execute("DELETE FROM meta WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock, self.connection:
+            for table in TABLES + ("meta",):
+                self.connection.execute("DELETE FROM {}".format(table))
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
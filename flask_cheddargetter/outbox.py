@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+
+import time
+import atexit
+import sqlite3
+import threading
+import simplejson as json
+
+from flask_cheddargetter import Customer
+from flask_cheddargetter.exceptions import BadRequest
+from flask_cheddargetter.exceptions import GatewayFailure
+from flask_cheddargetter.exceptions import NotFound
+from flask_cheddargetter.exceptions import ValidationError
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    customer_code TEXT NOT NULL,
+    path TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    claimed_until REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_customer ON outbox (customer_code, id);
+"""
+
+# Card details must never be written to disk
+SENSITIVE_KEYS = ("ccnumber", "cccardcode")
+
+# Errors retrying will not fix, such as invalid data or a declined card
+PERMANENT_ERRORS = (BadRequest, NotFound, GatewayFailure, ValidationError)
+
+
+class Outbox(object):
+    """A durable queue of writes to CheddarGetter sent by a pool of worker
+    threads, used by the deferred saves of Customer and Subscription.
+
+    Writes are kept in an SQLite database at path until CheddarGetter
+    accepted them, writes still queued when the process stops are sent once
+    an outbox is opened on the same database again. The writes of a customer
+    are sent one at a time in the order they were queued, writes of different
+    customers are sent concurrently by max_workers threads.
+
+    Several processes may open an outbox on the same database, such as the
+    workers of a server. A write is claimed in the database before it is sent
+    so only one of them sends it, the claim is given up after lease seconds
+    in case the process sending it died. The lease must be longer than a
+    request can take.
+
+    A write that fails is tried again after backoff seconds, doubling with
+    every attempt, until max_attempts were made. Errors retrying can not fix,
+    see PERMANENT_ERRORS, are not retried. The outcome of every write is
+    passed to the callback given to put and to every function in handlers as
+    the customer code, the Customer returned by CheddarGetter or None and the
+    exception or None."""
+
+    def __init__(
+        self,
+        app,
+        path,
+        max_workers=4,
+        max_attempts=5,
+        backoff=1,
+        handlers=None,
+        lease=300,
+    ):
+        self.app = app
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lease = lease
+        self.handlers = handlers if handlers is not None else []
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._busy = set()
+        self._callbacks = {}
+        self._threads = []
+        self._stopped = False
+
+        if len(self):
+            self._start()
+
+    def __len__(self):
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def put(self, path, code, is_new=False, callback=None, **kwargs):
+        """Queue a request of path for the customer with code, the arguments
+        are the ones Customer.request takes. Returns the id of the write."""
+        for key in kwargs:
+            normalized = key.replace("_", "").lower()
+            if any(sensitive in normalized for sensitive in SENSITIVE_KEYS):
+                raise ValidationError("Card details can not be saved deferred")
+
+        # Values are form encoded as strings anyway, empty ones are not sent
+        data = {key: str(value) for key, value in kwargs.items() if value is not None}
+        payload = json.dumps({"is_new": is_new, "data": data})
+
+        with self._changed:
+            with self.connection:
+                cursor = self.connection.execute(
+                    "INSERT INTO outbox (customer_code, path, payload, next_attempt) "
+                    "VALUES (?, ?, ?, ?)",
+                    (str(code), path, payload, time.time()),
+                )
+            if callback is not None:
+                self._callbacks[cursor.lastrowid] = callback
+            self._changed.notify()
+
+        self._start()
+        return cursor.lastrowid
+
+    def _claim(self):
+        """Take the next write that is due, called with the lock held. Only
+        the oldest write of each customer is considered and only if no other
+        write of the customer is being sent, by this or any other outbox on
+        the database. Returns the write or None and how long to wait for the
+        next one."""
+        now = time.time()
+        claimed = None
+        waits = []
+        # Locks the database against other processes until the claim is made
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self.connection.execute(
+                "SELECT id, customer_code, path, payload, attempts, next_attempt, "
+                "claimed_until FROM outbox o WHERE id = "
+                "(SELECT MIN(id) FROM outbox WHERE customer_code = o.customer_code) "
+                "ORDER BY next_attempt, id"
+            ).fetchall()
+            for row in rows:
+                if row[1] in self._busy:
+                    continue
+                if row[6] is not None and row[6] > now:
+                    # Sent by another process, look again once the lease ends
+                    waits.append(row[6] - now)
+                    continue
+                if row[5] > now:
+                    waits.append(row[5] - now)
+                    break
+                self.connection.execute(
+                    "UPDATE outbox SET claimed_until = ? WHERE id = ?",
+                    (now + self.lease, row[0]),
+                )
+                claimed = row[:6]
+                break
+            self.connection.commit()
+        except BaseException:
+            self.connection.rollback()
+            raise
+
+        if claimed is None:
+            return None, min(waits) if waits else None
+        self._busy.add(claimed[1])
+        return claimed, None
+
+    def _deliver(self, row):
+        id, code, path, payload, attempts, next_attempt = row
+        payload = json.loads(payload)
+
+        customer = None
+        error = None
+        try:
+            with self.app.app_context():
+                xml = Customer.request(
+                    path, code=code, is_new=payload["is_new"], **payload["data"]
+                )
+                Customer._refresh_customer_cache(code, xml)
+                customer = Customer._get_from_xml(xml)
+        except Exception as e:
+            error = e
+
+        with self._changed:
+            attempts += 1
+            retry = (
+                error is not None
+                and not isinstance(error, PERMANENT_ERRORS)
+                and attempts < self.max_attempts
+            )
+            with self.connection:
+                if retry:
+                    self.connection.execute(
+                        "UPDATE outbox SET attempts = ?, next_attempt = ?, "
+                        "claimed_until = NULL WHERE id = ?",
+                        (
+                            attempts,
+                            time.time() + self.backoff * 2 ** (attempts - 1),
+                            id,
+                        ),
+                    )
+                else:
+                    self.connection.execute("DELETE FROM outbox WHERE id = ?", (id,))
+            callback = None if retry else self._callbacks.pop(id, None)
+
+        if not retry:
+            for handler in [callback] + list(self.handlers):
+                if handler is None:
+                    continue
+                try:
+                    handler(code, customer, error)
+                except Exception:
+                    self.app.logger.exception("Outbox callback failed")
+
+        # The next write of the customer may only start now
+        with self._changed:
+            self._busy.discard(code)
+            self._changed.notify_all()
+
+    def process_pending(self):
+        """Send every write that is due in the calling thread, for instance
+        from a scheduled job instead of the worker threads. Returns the number
+        of attempts made."""
+        count = 0
+        while True:
+            with self._lock:
+                row, wait = self._claim()
+            if row is None:
+                return count
+            self._deliver(row)
+            count += 1
+
+    def _start(self):
+        with self._lock:
+            if self._threads or self._stopped:
+                return
+            for i in range(self.max_workers):
+                thread = threading.Thread(target=self._run, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        atexit.register(self.stop)
+
+    def _run(self):
+        while True:
+            with self._changed:
+                while True:
+                    if self._stopped:
+                        return
+                    row, wait = self._claim()
+                    if row is not None:
+                        break
+                    self._changed.wait(wait)
+            self._deliver(row)
+
+    def join(self, timeout=None):
+        """Wait until every queued write was sent or given up on. Returns
+        False if the timeout expired first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._changed:
+            while (
+                self._busy or self.connection.execute("SELECT 1 FROM outbox").fetchone()
+            ):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+        return True
+
+    def stop(self):
+        """Stop the worker threads once the writes being sent are done, queued
+        writes stay in the database."""
+        with self._changed:
+            self._stopped = True
+            self._changed.notify_all()
+        for thread in self._threads:
+            thread.join()
+        atexit.unregister(self.stop)
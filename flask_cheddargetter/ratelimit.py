@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+import time
+import asyncio
+import threading
+import contextlib
+import contextvars
+import simplejson as json
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from .resilience import READ_PATHS
+
+# Set while requests are made on behalf of a batch job, see
+# RateLimiter.background
+_background = contextvars.ContextVar("cheddargetter_background", default=False)
+
+
+class MemoryBackend(object):
+    """Keeps the state of the buckets in this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states = {}
+
+    def update(self, name, func):
+        """Replace the state of the bucket name, None if there is none yet,
+        with the first value func returns and return the second one."""
+        with self._lock:
+            state, result = func(self._states.get(name))
+            self._states[name] = state
+            return result
+
+
+class FileBackend(object):
+    """Keeps the state of the buckets in a file locked while it is updated,
+    so every process using the same path on a host shares the budgets."""
+
+    def __init__(self, path):
+        if fcntl is None:
+            raise RuntimeError("FileBackend requires fcntl")
+        self._lock = threading.Lock()
+        self._file = open(path, "a+")
+
+    def update(self, name, func):
+        with self._lock:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                self._file.seek(0)
+                content = self._file.read()
+                states = json.loads(content) if content else {}
+                state, result = func(states.get(name))
+                states[name] = state
+                self._file.seek(0)
+                self._file.truncate()
+                self._file.write(json.dumps(states))
+                self._file.flush()
+            finally:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+            return result
+
+    def close(self):
+        self._file.close()
+
+
+class TokenBucket(object):
+    """A bucket refilled with rate tokens per second holding at most capacity
+    tokens. Wall clock time is used so processes sharing a backend agree."""
+
+    def __init__(self, name, rate, capacity, backend):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.backend = backend
+
+    def take(self, reserve=0):
+        """Take a token if more than reserve tokens would be left. Returns 0
+        if a token was taken or the seconds to wait before trying again."""
+
+        def take(state):
+            now = time.time()
+            if state is None:
+                tokens = self.capacity
+            else:
+                tokens, updated = state
+                tokens = min(self.capacity, tokens + max(0, now - updated) * self.rate)
+            if tokens >= 1 + reserve:
+                return [tokens - 1, now], 0
+            return [tokens, now], (1 + reserve - tokens) / self.rate
+
+        return self.backend.update(self.name, take)
+
+
+class RateLimiter(object):
+    """Limits the requests made to CheddarGetter with separate token buckets
+    for reads and writes. Requests wait for a token instead of setting off
+    the throttling of CheddarGetter.
+
+    Requests made in a background block, typically by batch jobs, only take
+    a token while more than reserve of the burst of the bucket is left, so
+    they slow down before interactive requests have to wait. Pass a
+    FileBackend as backend to share the budgets between processes."""
+
+    def __init__(
+        self,
+        reads=10,
+        read_burst=20,
+        writes=5,
+        write_burst=10,
+        reserve=0.25,
+        backend=None,
+    ):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.reserve = reserve
+        self.read_bucket = TokenBucket("read", reads, read_burst, self.backend)
+        self.write_bucket = TokenBucket("write", writes, write_burst, self.backend)
+
+    def _wait_time(self, path):
+        bucket = self.read_bucket if path in READ_PATHS else self.write_bucket
+        reserve = 0
+        if _background.get():
+            # A reserve the bucket can never hold would stall the block forever
+            reserve = min(bucket.capacity * self.reserve, bucket.capacity - 1)
+        return bucket.take(reserve)
+
+    def acquire(self, path):
+        """Wait until a request of path may be made."""
+        delay = self._wait_time(path)
+        while delay > 0:
+            time.sleep(delay)
+            delay = self._wait_time(path)
+
+    async def aacquire(self, path):
+        delay = self._wait_time(path)
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self._wait_time(path)
+
+    @contextlib.contextmanager
+    def background(self):
+        """Mark the requests made in the block as background traffic."""
+        token = _background.set(True)
+        try:
+            yield
+        finally:
+            _background.reset(token)
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+import time
+import random
+import requests
+import threading
+from collections import deque
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from .exceptions import CircuitOpen
+from .exceptions import GatewayConnectionError
+from .exceptions import UnexpectedResponse
+
+# Failures that say nothing about the request itself, the same request may
+# well succeed when it is sent again
+TRANSIENT_ERRORS = (
+    GatewayConnectionError,
+    requests.ConnectionError,
+    requests.Timeout,
+)
+if httpx is not None:
+    TRANSIENT_ERRORS += (httpx.TransportError,)
+
+
+def is_transient(error):
+    """Whether error is one of TRANSIENT_ERRORS or an unexpected response
+    with a status saying the server is throttling or failing. Other
+    unexpected responses, such as a 401 for bad credentials, fail again the
+    same way."""
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    status_code = getattr(error, "status_code", None)
+    return (
+        isinstance(error, UnexpectedResponse)
+        and status_code is not None
+        and (status_code == 429 or status_code >= 500)
+    )
+
+
+# Endpoints that only read and are therefore safe to send again
+READ_PATHS = ("/customers/get", "/customers/list", "/plans/get")
+
+
+class RetryPolicy(object):
+    """How often and when a failed read is sent again. attempts is the total
+    number of attempts, the delay before each retry is random between zero
+    and backoff seconds doubled for every retry made, at most max_backoff.
+    Spreading the delays out keeps clients from retrying in lockstep."""
+
+    def __init__(self, attempts=3, backoff=0.1, max_backoff=2):
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def delay(self, retry):
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**retry))
+
+
+class CircuitBreaker(object):
+    """Fails requests fast while CheddarGetter is failing. The breaker opens
+    once at least minimum_requests were made in the last window seconds and
+    the share of them that failed reached failure_rate. Requests then raise
+    CircuitOpen without being sent. After recovery_timeout seconds a single
+    request is let through, if it succeeds the breaker closes again and if it
+    fails the breaker stays open for another recovery_timeout. Only the
+    outcome of that probe counts then, requests still in flight from before
+    the breaker opened do not close or reopen it."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(
+        self, failure_rate=0.5, minimum_requests=10, window=30, recovery_timeout=30
+    ):
+        self.failure_rate = failure_rate
+        self.minimum_requests = minimum_requests
+        self.window = window
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self._lock = threading.Lock()
+        self._results = deque()
+        self._opened_at = None
+        self._probing = False
+
+    def _expire(self, now):
+        while self._results and self._results[0][0] <= now - self.window:
+            self._results.popleft()
+
+    def _open(self, now):
+        self.state = self.OPEN
+        self._opened_at = now
+        self._probing = False
+        self._results.clear()
+
+    def before_request(self):
+        """Raise CircuitOpen if the request must not be sent. Returns True if
+        the request is the probe of a half-open breaker, its outcome must be
+        recorded with probe set."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return False
+            now = time.monotonic()
+            if (
+                self.state == self.OPEN
+                and now - self._opened_at >= self.recovery_timeout
+            ):
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            raise CircuitOpen(
+                None, None, "CheddarGetter is failing, requests are not sent"
+            )
+
+    def record_success(self, probe=False):
+        with self._lock:
+            if self.state != self.CLOSED:
+                if probe and self.state == self.HALF_OPEN:
+                    self.state = self.CLOSED
+                    self._probing = False
+                    self._results.clear()
+                return
+            now = time.monotonic()
+            self._results.append((now, True))
+            self._expire(now)
+
+    def abandon(self, probe=False):
+        """Give up a request whose outcome is unknown because it was
+        cancelled or interrupted. A probe counts as failed so the breaker
+        stays open for another recovery_timeout and a new probe is let
+        through after it."""
+        with self._lock:
+            if probe and self.state == self.HALF_OPEN:
+                self._open(time.monotonic())
+
+    def record_failure(self, probe=False):
+        with self._lock:
+            now = time.monotonic()
+            if self.state != self.CLOSED:
+                if probe and self.state == self.HALF_OPEN:
+                    self._open(now)
+                return
+            self._results.append((now, False))
+            self._expire(now)
+            total = len(self._results)
+            failures = sum(1 for result in self._results if not result[1])
+            if total >= self.minimum_requests:
+                if failures >= self.failure_rate * total:
+                    self._open(now)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+from collections import namedtuple
+from lxml import etree
+
+from flask_cheddargetter import Customer
+from flask_cheddargetter.exceptions import NotFound
+
+SyncResult = namedtuple("SyncResult", ["added", "changed", "cancelled"])
+
+
+class CustomerSync(object):
+    """Keeps a local store of customers up to date by fetching only the
+    customers that changed since the previous run. The store is any
+    cache.CacheBackend, use a cache.ShelveCache to keep the customers and the
+    high-water mark across runs.
+
+    CheddarGetter filters customers by the date they were created, cancelled
+    or last transacted, so those are the changes a sync picks up. The first
+    run has no high-water mark and loads every customer."""
+
+    watermark_key = "watermark"
+
+    def __init__(self, store):
+        self.store = store
+
+    def _customer_key(self, code):
+        return "customer:{}".format(code)
+
+    @property
+    def watermark(self):
+        """The date of the last successful run."""
+        value = self.store.get(self.watermark_key)
+        if value is None:
+            return None
+        return datetime.date.fromisoformat(value)
+
+    def get(self, code):
+        """Return the stored customer or None."""
+        value = self.store.get(self._customer_key(code))
+        if value is None:
+            return None
+        return Customer.from_xml(etree.fromstring(value))
+
+    def _fetch(self, **filters):
+        params = Customer._query_params(**filters)
+        try:
+            for customer_xml in Customer.iter_request(
+                "/customers/get", "customer", **params
+            ):
+                # The tail is whitespace depending on where the customer is
+                # in the response, it would make unchanged customers differ
+                yield customer_xml.get("code"), etree.tostring(
+                    customer_xml, with_tail=False
+                )
+        except NotFound:
+            return
+
+    def run(self):
+        """Fetch the customers changed since the last run, merge them into the
+        store and return which customer codes were added, changed or
+        cancelled."""
+        # Dates are only precise to the day so the next run starts on the day
+        # this one started, customers seen twice are simply unchanged
+        started = datetime.datetime.utcnow().date()
+        watermark = self.watermark
+
+        if watermark is None:
+            queries = [{}]
+        else:
+            queries = [
+                {"created_after": watermark},
+                {"transacted_after": watermark},
+                {"canceled_after": watermark},
+            ]
+
+        added = set()
+        changed = set()
+        cancelled = set()
+        for filters in queries:
+            for code, value in self._fetch(**filters):
+                key = self._customer_key(code)
+                previous = self.store.get(key)
+                if previous != value:
+                    if previous is None:
+                        added.add(code)
+                    else:
+                        changed.add(code)
+                    self.store.set(key, value)
+
+                # Customers cancelled on the day of the watermark are fetched
+                # again by the next run, they are only new if they changed
+                if "canceled_after" in filters and (code in added or code in changed):
+                    cancelled.add(code)
+
+        self.store.set(self.watermark_key, started.isoformat())
+        return SyncResult(
+            added=sorted(added),
+            changed=sorted(changed - cancelled - added),
+            cancelled=sorted(cancelled),
+        )
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+from flask import g
+from flask import has_request_context
+
+# Attribute of flask.g holding the unit of work of the current request
+G_ATTRIBUTE = "_cheddargetter_unit_of_work"
+
+
+class UnitOfWork(object):
+    """The customers loaded and saved during a request.
+
+    The identity map holds every customer loaded by code so loading the same
+    customer again returns the instance already loaded, edits made through
+    any reference to it are seen by all of them. Saves of loaded customers
+    are collected instead of being sent at once and flush sends each customer
+    once with every change made until then."""
+
+    def __init__(self):
+        self.customers = {}
+        self._pending = {}
+
+    @classmethod
+    def current(cls, create=True):
+        """The unit of work of the current request, None outside of
+        requests."""
+        if not has_request_context():
+            return None
+        work = getattr(g, G_ATTRIBUTE, None)
+        if work is None and create:
+            work = cls()
+            setattr(g, G_ATTRIBUTE, work)
+        return work
+
+    @classmethod
+    def pop(cls):
+        """Remove the unit of work of the current request and return it, None
+        if there is none. The application context, and with it flask.g, may
+        outlive the request."""
+        if not has_request_context():
+            return None
+        return g.pop(G_ATTRIBUTE, None)
+
+    def get(self, code):
+        """The customer loaded with code or None."""
+        return self.customers.get(str(code))
+
+    def add(self, customer):
+        self.customers[str(customer.code)] = customer
+
+    def register_save(self, customer):
+        """Send the changes of customer on the next flush."""
+        self._pending[id(customer)] = customer
+
+    @property
+    def pending(self):
+        return list(self._pending.values())
+
+    def flush(self):
+        """Save every customer registered since the last flush in the order
+        they were first registered. The first error raised is passed on, the
+        customers not saved yet stay registered."""
+        while self._pending:
+            key = next(iter(self._pending))
+            customer = self._pending[key]
+            customer._save()
+            del self._pending[key]
+
+    def discard(self):
+        """Forget the registered saves without sending them."""
+        self._pending.clear()
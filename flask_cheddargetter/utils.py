@@ -6,7 +6,9 @@ from flask_cheddargetter import Plan
 
 def get_items_by_customer_code():
     """Helper method that uses the /customer/list API of endpoint to get a
-    dictionary of the items available to each customer keyed by code."""
+    dictionary of the items available to each customer keyed by code. Codes
+    are kept as the strings CheddarGetter returns, converting them to int
+    failed for any code that is not a number."""
 
     plans = {plan.code: plan for plan in Plan.all()}
     customers = Customer.list()
@@ -14,7 +16,7 @@ def get_items_by_customer_code():
     items = {}
     for customer in customers:
         # Grab the items for each customer from the plan of the subscription
-        items[int(customer.code)] = {
+        items[customer.code] = {
             item.name: item.quantity_included
             for item in plans[customer.subscription.plan.code].items
         }
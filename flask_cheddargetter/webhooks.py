@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+import copy
+import hmac
+import hashlib
+from lxml import etree
+from flask import Blueprint
+from flask import abort
+from flask import current_app
+from flask import request
+
+from flask_cheddargetter import Customer
+from flask_cheddargetter import Plan
+
+SIGNATURE_HEADER = "X-CG-Signature"
+
+# Activities after which the customer no longer exists
+DELETED_ACTIVITIES = ("customerDeleted",)
+
+
+def sign(secret, body):
+    """The signature of a webhook body, a hex HMAC-SHA256 digest keyed with
+    the webhook secret."""
+    return hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(secret, body, signature):
+    if not secret or not signature:
+        return False
+    return hmac.compare_digest(sign(secret, body), signature)
+
+
+def _plan_content(plan_xml):
+    # Plans nested in customers are indented differently from the ones sent
+    # by /plans/get so whitespace is ignored when comparing them
+    return [
+        (element.tag, sorted(element.attrib.items()), (element.text or "").strip())
+        for element in plan_xml.iter()
+    ]
+
+
+def apply_customer(activity_type, customer_xml):
+    """Bring the configured caches in line with a customer sent by a webhook.
+    The customer cache and entitlement index are refreshed with the customer,
+    or dropped if it was deleted, and plans embedded in the customer replace
+    cached plans that differ from them."""
+    code = customer_xml.get("code")
+    if activity_type in DELETED_ACTIVITIES:
+        Customer._refresh_customer_cache(code)
+        return
+
+    Customer._refresh_customer_cache(code, customer_xml)
+
+    cache = Plan._plan_cache()
+    if cache is None:
+        return
+    for plan_xml in customer_xml.iterfind("subscriptions/subscription/plans/plan"):
+        plan_code = plan_xml.get("code")
+        cached = cache.get(plan_code)
+        if cached is None or _plan_content(cached) != _plan_content(plan_xml):
+            # The catalog holds the old plan as well so it has to go too
+            cache.invalidate(plan_code)
+            cache.set(plan_code, copy.deepcopy(plan_xml))
+
+
+def create_blueprint(extension, name="cheddargetter_webhooks", rule="/webhook"):
+    """Create a blueprint receiving CheddarGetter webhooks at rule. Requests
+    must be signed with CHEDDAR_WEBHOOK_SECRET, see sign. The body is the XML
+    payload holding the activityType and the customer the activity is about.
+
+    The customer is loaded with Customer.from_xml, applied to the caches and
+    passed to every handler registered with CheddarGetter.webhook_handler
+    along with the activity type."""
+    blueprint = Blueprint(name, __name__)
+
+    @blueprint.route(rule, methods=["POST"])
+    def receive():
+        body = request.get_data()
+        if not verify_signature(
+            current_app.config["CHEDDAR_WEBHOOK_SECRET"],
+            body,
+            request.headers.get(SIGNATURE_HEADER),
+        ):
+            abort(403)
+
+        try:
+            xml = etree.fromstring(body)
+        except etree.XMLSyntaxError:
+            abort(400)
+
+        customer_xml = next(xml.iter(tag="customer"), None)
+        if customer_xml is None:
+            abort(400)
+        activity_type = xml.findtext("activityType")
+
+        customer = Customer.from_xml(customer_xml)
+        apply_customer(activity_type, customer_xml)
+        for handler in extension.webhook_handlers:
+            handler(activity_type, customer)
+
+        return "", 204
+
+    return blueprint
@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 
 import os
-import unittest
 import flask
+import unittest
+import responses
+
+from flask_cheddargetter import Customer
 
 
 class TestBase(unittest.TestCase):
@@ -11,6 +14,51 @@ class TestBase(unittest.TestCase):
         f = open(path)
         return f.read()
 
+    def add_response(
+        self,
+        path,
+        fixture="customers_with_items.xml",
+        status=200,
+        body=None,
+        code="test",
+        **kwargs
+    ):
+        """Answer requests to path for the customer code with the fixture or
+        body, which may also be an exception to raise. Any other keyword
+        argument is passed to responses.add, a callback replaces the
+        response."""
+        url = Customer.build_url(path, code=code)
+        if "callback" in kwargs:
+            responses.add_callback(
+                responses.POST, url, content_type="application/xml", **kwargs
+            )
+            return
+        responses.add(
+            responses.POST,
+            url,
+            status=status,
+            body=self.read_fixture(fixture) if body is None else body,
+            content_type="application/xml",
+            **kwargs
+        )
+
+    def two_customers(self):
+        """A customer list holding the customer of customers_with_items.xml
+        and a customer coded other with a cancelled subscription."""
+        with_items = self.read_fixture("customers_with_items.xml")
+        without_items = (
+            self.read_fixture("customers_without_items.xml")
+            .replace('code="test"', 'code="other"')
+            .replace(
+                "<canceledDatetime/>",
+                "<canceledDatetime>2011-03-10T05:45:51+00:00</canceledDatetime>",
+            )
+        )
+        customer = without_items[
+            without_items.index("<customer ") : without_items.index("</customers>")
+        ]
+        return with_items.replace("</customers>", customer + "</customers>")
+
     def setUp(self):
         self.app = flask.Flask(__name__)
         self.app.config["CHEDDAR_API_URL"] = "https://127.0.0.1"
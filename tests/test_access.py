@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+import responses
+from lxml import etree
+from unittest import mock
+
+from flask_cheddargetter import CheddarGetter
+from flask_cheddargetter import Customer
+from flask_cheddargetter.access import AccessCache
+
+from . import TestBase
+
+# End of the billing period of the cancelled subscription in
+# paypal_customer.xml
+PERIOD_END = 1308242161.0
+
+
+class AccessTests(TestBase):
+    def setUp(self):
+        super(AccessTests, self).setUp()
+        self.app.config["CHEDDAR_ACCESS_CACHE"] = True
+        self.cheddar = CheddarGetter(self.app)
+        self.now = PERIOD_END - 3600
+        patcher = mock.patch("flask_cheddargetter.access.time.time", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def customer_xml(self, fixture):
+        return etree.fromstring(self.read_fixture(fixture).encode()).find("customer")
+
+    def test_decision_from_xml(self):
+        running = self.customer_xml("customers_with_items.xml")
+        cancelled = self.customer_xml("paypal_customer.xml")
+
+        # The renewal of a running subscription is long past, it is checked
+        # again soon
+        assert AccessCache.decision_from_xml(running, overdue_ttl=60) == (
+            True,
+            self.now + 60,
+        )
+        assert AccessCache.decision_from_xml(cancelled) == (True, PERIOD_END)
+        assert AccessCache.decision_from_xml(cancelled, now=PERIOD_END) == (
+            False,
+            None,
+        )
+
+    @responses.activate
+    def test_overdue_decision_expires(self):
+        self.add_response("/customers/get")
+
+        assert self.cheddar.is_customer_active("test") is True
+        self.now += self.cheddar.access_cache.overdue_ttl - 1
+        assert self.cheddar.is_customer_active("test") is True
+        assert len(responses.calls) == 1
+
+        # Never active for long past the renewal without fetching again
+        self.now += 1
+        assert self.cheddar.is_customer_active("test") is True
+        assert len(responses.calls) == 2
+
+    @responses.activate
+    def test_cancelled_subscription_lapses(self):
+        self.add_response("/customers/get", "paypal_customer.xml")
+
+        assert self.cheddar.is_customer_active("test") is True
+        self.now = PERIOD_END - 1
+        assert self.cheddar.is_customer_active("test") is True
+        assert len(responses.calls) == 1
+
+        # Never active past the end of the period, the customer is fetched
+        # again at the boundary
+        self.now = PERIOD_END
+        assert self.cheddar.is_customer_active("test") is False
+        assert len(responses.calls) == 2
+        assert self.cheddar.is_customer_active("test") is False
+        assert len(responses.calls) == 2
+
+    @responses.activate
+    def test_save_decides_again(self):
+        self.add_response("/customers/get", "paypal_customer.xml")
+        self.add_response("/customers/edit")
+        self.now = PERIOD_END + 1
+        assert self.cheddar.is_customer_active("test") is False
+
+        customer = Customer.get("test")
+        customer.first_name = "Changed"
+        customer.save()
+
+        assert self.cheddar.is_customer_active("test") is True
+        assert len(responses.calls) == 3
+
+    @responses.activate
+    def test_missing_customer_is_not_active(self):
+        self.add_response("/customers/get", "error_no_customer.xml", status=404)
+
+        assert self.cheddar.is_customer_active("test") is False
+        assert self.cheddar.is_customer_active("test") is False
+        assert len(responses.calls) == 1
+
+        # The customer may have been created since
+        self.now += self.cheddar.access_cache.missing_ttl
+        assert self.cheddar.is_customer_active("test") is False
+        assert len(responses.calls) == 2
+
+    def test_default_store_is_bounded(self):
+        access_cache = AccessCache(maxsize=2)
+        for code in ("a", "b", "c"):
+            access_cache.set(code, True)
+
+        assert len(access_cache.store) == 2
+        assert access_cache.get("a") is None
+        assert access_cache.get("c") is True
+
+    def test_requires_access_cache(self):
+        self.app.config["CHEDDAR_ACCESS_CACHE"] = False
+        self.cheddar.init_app(self.app)
+
+        with self.assertRaises(RuntimeError):
+            self.cheddar.is_customer_active("test")
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import unittest
+import urllib.parse
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from flask_cheddargetter import CheddarGetter
+from flask_cheddargetter import Customer
+from flask_cheddargetter import Plan
+from flask_cheddargetter.exceptions import NotFound
+
+from . import TestBase
+
+
+@unittest.skipIf(httpx is None, "httpx is not installed")
+class AsyncTests(TestBase):
+    def setUp(self):
+        super(AsyncTests, self).setUp()
+        self.cheddar = CheddarGetter(self.app)
+        self.routes = {}
+        self.calls = []
+        self.cheddar.state()._create_async_client = lambda: httpx.AsyncClient(
+            transport=httpx.MockTransport(self.handle)
+        )
+
+    def handle(self, request):
+        self.calls.append(request)
+        status, fixture = self.routes[str(request.url)]
+        return httpx.Response(status, content=self.read_fixture(fixture))
+
+    def route(self, url, fixture, status=200):
+        self.routes[url] = (status, fixture)
+
+    def run_async(self, coro):
+        return asyncio.run(coro)
+
+    def test_aget_customer(self):
+        self.route(
+            Customer.build_url("/customers/get", code="test"),
+            "customers_with_items.xml",
+        )
+
+        customer = self.run_async(Customer.aget("test"))
+
+        assert customer.code == "test"
+        assert customer.subscription.plan.code == "TRACKED_MONTHLY"
+        assert self.calls[0].headers["authorization"].startswith("Basic ")
+
+    def test_aget_customer_not_found(self):
+        self.route(
+            Customer.build_url("/customers/get", code=-1),
+            "error_no_customer.xml",
+            status=404,
+        )
+
+        with self.assertRaises(NotFound):
+            self.run_async(Customer.aget(-1))
+
+    def test_aall_plans(self):
+        self.route(Plan.build_url("/plans/get"), "plans.xml")
+
+        plans = self.run_async(Plan.aall())
+
+        assert [plan.code for plan in plans] == ["FREE_MONTHLY", "PAID_MONTHLY"]
+
+    def test_concurrent_requests(self):
+        self.route(
+            Customer.build_url("/customers/get", code="test"),
+            "customers_with_items.xml",
+        )
+
+        async def fetch():
+            return await asyncio.gather(*[Customer.aget("test") for i in range(20)])
+
+        customers = self.run_async(fetch())
+
+        assert len(customers) == 20
+        assert len(self.calls) == 20
+
+    def test_concurrent_identical_requests_are_coalesced(self):
+        url = Customer.build_url("/customers/get", code="test")
+        self.route(url, "customers_with_items.xml")
+
+        async def handle(request):
+            # Let the other requests start while this one is in flight
+            await asyncio.sleep(0.01)
+            return self.handle(request)
+
+        self.cheddar.state()._create_async_client = lambda: httpx.AsyncClient(
+            transport=httpx.MockTransport(handle)
+        )
+
+        async def fetch():
+            return await asyncio.gather(*[Customer.aget("test") for i in range(20)])
+
+        customers = self.run_async(fetch())
+
+        assert len(self.calls) == 1
+        assert len({id(customer) for customer in customers}) == 20
+
+    def test_aincrement_item(self):
+        url = Customer.build_url("/customers/get", code="test")
+        self.route(url, "customers_with_items.xml")
+
+        async def increment():
+            customer = await Customer.aget("test")
+            item = customer.subscription.items[0]
+            self.route(
+                Customer.build_url(
+                    "/customers/add-item-quantity", code="test", item_code=item.code
+                ),
+                "customers_with_items.xml",
+            )
+            return await item.aincrement(2)
+
+        item = self.run_async(increment())
+
+        body = urllib.parse.parse_qs(self.calls[1].content.decode())
+        assert body["quantity"] == ["2.0000"]
+        assert item.code == "MONTHLY_ITEM"
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+import responses
+from lxml import etree
+from unittest import mock
+
+from flask_cheddargetter import CheddarGetter
+from flask_cheddargetter import Customer
+from flask_cheddargetter import Plan
+from flask_cheddargetter.cache import CacheBackend
+from flask_cheddargetter.cache import LRUCache
+
+from . import TestBase
+
+
+class PlanCacheTests(TestBase):
+    def setUp(self):
+        super(PlanCacheTests, self).setUp()
+        self.cheddar = CheddarGetter(self.app)
+
+    def add_plans(self):
+        responses.add(
+            responses.POST,
+            Plan.build_url("/plans/get"),
+            body=self.read_fixture("plans.xml"),
+            content_type="application/xml",
+        )
+
+    @responses.activate
+    def test_catalog_is_cached(self):
+        self.add_plans()
+
+        plans = Plan.all()
+        plans[0].name = "Changed"
+        cached_plans = Plan.all()
+
+        assert len(responses.calls) == 1
+        assert [plan.code for plan in cached_plans] == [
+            "FREE_MONTHLY",
+            "PAID_MONTHLY",
+        ]
+        # Cached plans are fresh objects
+        assert cached_plans[0].name == "Free Monthly"
+
+        # Single plans are served from the catalog
+        assert Plan.get("PAID_MONTHLY").recurring_charge_amount == 20.0
+        assert len(responses.calls) == 1
+
+    @responses.activate
+    def test_single_plan_is_cached(self):
+        responses.add(
+            responses.POST,
+            Plan.build_url("/plans/get", code="FREE_MONTHLY"),
+            body=self.read_fixture("plan_free_monthly.xml"),
+            content_type="application/xml",
+        )
+
+        assert Plan.get("FREE_MONTHLY").code == "FREE_MONTHLY"
+        assert Plan.get("FREE_MONTHLY").code == "FREE_MONTHLY"
+        assert len(responses.calls) == 1
+
+        # Assigning a plan code to a subscription uses the cache too
+        customer = Customer()
+        customer.subscription.plan_code = "FREE_MONTHLY"
+        assert customer.subscription.plan.name == "Free Monthly"
+        assert len(responses.calls) == 1
+
+    @responses.activate
+    def test_cache_expires(self):
+        self.add_plans()
+        self.cheddar.plan_cache.ttl = 0.01
+
+        Plan.all()
+        time.sleep(0.02)
+        Plan.all()
+
+        assert len(responses.calls) == 2
+
+    @responses.activate
+    def test_refresh(self):
+        self.add_plans()
+
+        Plan.all()
+        Plan.refresh()
+        Plan.all()
+
+        assert len(responses.calls) == 2
+
+    @responses.activate
+    def test_delete_invalidates(self):
+        self.add_plans()
+        responses.add(
+            responses.POST,
+            Plan.build_url("/plans/delete", code="FREE_MONTHLY"),
+            body="<plans></plans>",
+            content_type="application/xml",
+        )
+
+        plan = Plan.all()[0]
+        plan.delete()
+        Plan.all()
+
+        assert len(responses.calls) == 3
+
+    @responses.activate
+    def test_cache_disabled(self):
+        self.app.config["CHEDDAR_PLAN_CACHE"] = False
+        self.cheddar.init_app(self.app)
+        self.add_plans()
+
+        Plan.all()
+        Plan.all()
+
+        assert len(responses.calls) == 2
+
+
+class CustomerCacheTests(TestBase):
+    def setUp(self):
+        super(CustomerCacheTests, self).setUp()
+        self.app.config["CHEDDAR_CUSTOMER_CACHE"] = "lru"
+        self.cheddar = CheddarGetter(self.app)
+
+    def add_customer(self):
+        responses.add(
+            responses.POST,
+            Customer.build_url("/customers/get", code="test"),
+            body=self.read_fixture("customers_with_items.xml"),
+            content_type="application/xml",
+        )
+
+    @responses.activate
+    def test_get_is_cached(self):
+        self.add_customer()
+
+        customer = Customer.get("test")
+        customer.first_name = "Changed"
+        cached_customer = Customer.get("test")
+
+        assert len(responses.calls) == 1
+        assert cached_customer is not customer
+        assert cached_customer.first_name == "Test"
+        assert cached_customer._to_persist == {}
+        assert cached_customer.subscription.plan.code == "TRACKED_MONTHLY"
+
+    @responses.activate
+    def test_save_invalidates(self):
+        self.add_customer()
+        responses.add(
+            responses.POST,
+            Customer.build_url("/customers/edit", code="test"),
+            body="<customers></customers>",
+            content_type="application/xml",
+        )
+
+        customer = Customer.get("test")
+        customer.first_name = "Changed"
+        customer.save()
+        Customer.get("test")
+
+        assert len(responses.calls) == 3
+
+    @responses.activate
+    def test_item_update_refreshes(self):
+        self.add_customer()
+        responses.add(
+            responses.POST,
+            Customer.build_url(
+                "/customers/add-item-quantity", code="test", item_code="MONTHLY_ITEM"
+            ),
+            body=self.read_fixture("customers_with_items.xml"),
+            content_type="application/xml",
+        )
+
+        customer = Customer.get("test")
+        customer.subscription.items[0].increment()
+        Customer.get("test")
+
+        assert len(responses.calls) == 2
+
+    @responses.activate
+    def test_custom_backend(self):
+        class DictCache(CacheBackend):
+            def __init__(self):
+                self.values = {}
+
+            def get(self, key):
+                return self.values.get(key)
+
+            def set(self, key, value):
+                self.values[key] = value
+
+            def delete(self, key):
+                self.values.pop(key, None)
+
+        backend = DictCache()
+        self.app.config["CHEDDAR_CUSTOMER_CACHE"] = backend
+        self.cheddar.init_app(self.app)
+        self.add_customer()
+
+        Customer.get("test")
+        Customer.get("test")
+
+        assert len(responses.calls) == 1
+        assert list(backend.values) == ["Test:test"]
+
+
+class StaleWhileRevalidateTests(TestBase):
+    def setUp(self):
+        super(StaleWhileRevalidateTests, self).setUp()
+        self.app.config["CHEDDAR_CUSTOMER_CACHE"] = "lru"
+        self.app.config["CHEDDAR_CUSTOMER_SOFT_TTL"] = 10
+        self.app.config["CHEDDAR_CUSTOMER_HARD_TTL"] = 60
+        self.cheddar = CheddarGetter(self.app)
+        self.now = time.time()
+        patcher = mock.patch("flask_cheddargetter.time.time", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_customer(self):
+        responses.add(
+            responses.POST,
+            Customer.build_url("/customers/get", code="test"),
+            body=self.read_fixture("customers_with_items.xml"),
+            content_type="application/xml",
+        )
+
+    @responses.activate
+    def test_fresh_copy_is_used(self):
+        self.add_customer()
+        Customer.get("test")
+
+        self.now += 5
+        Customer.get("test")
+
+        assert len(responses.calls) == 1
+
+    @responses.activate
+    def test_stale_copy_is_refreshed_in_background(self):
+        self.add_customer()
+        Customer.get("test")
+        responses.replace(
+            responses.POST,
+            Customer.build_url("/customers/get", code="test"),
+            body=self.read_fixture("customers_with_items.xml").replace(
+                "<firstName>Test<", "<firstName>Changed<"
+            ),
+            content_type="application/xml",
+        )
+
+        self.now += 30
+        assert Customer.get("test").first_name == "Test"
+        self.cheddar.revalidator.shutdown()
+
+        assert len(responses.calls) == 2
+        assert Customer.get("test").first_name == "Changed"
+        assert len(responses.calls) == 2
+
+    def test_cached_copy_is_stamped(self):
+        xml = etree.fromstring(self.read_fixture("customers_with_items.xml").encode())
+
+        Customer._refresh_customer_cache("test", xml)
+
+        cached = etree.fromstring(
+            self.cheddar.customer_cache.get(Customer._customer_cache_key("test"))
+        )
+        assert cached.get("code") == "test"
+        assert float(cached.get("fetchedAt")) == round(self.now, 3)
+        # The response itself is left alone
+        assert xml.find("customer").get("fetchedAt") is None
+
+    @responses.activate
+    def test_expired_copy_blocks(self):
+        self.add_customer()
+        Customer.get("test")
+
+        self.now += 90
+        Customer.get("test")
+
+        assert len(responses.calls) == 2
+        assert self.cheddar.revalidator._executor is None
+
+    @responses.activate
+    def test_ttls_per_call_site(self):
+        self.add_customer()
+        Customer.get("test")
+
+        self.now += 30
+        Customer.get("test", soft_ttl=60)
+        assert len(responses.calls) == 1
+        Customer.get("test", hard_ttl=20)
+        assert len(responses.calls) == 2
+
+    @responses.activate
+    def test_deleted_customer_is_dropped(self):
+        self.add_customer()
+        Customer.get("test")
+        responses.replace(
+            responses.POST,
+            Customer.build_url("/customers/get", code="test"),
+            status=404,
+            body=self.read_fixture("error_no_customer.xml"),
+            content_type="application/xml",
+        )
+
+        self.now += 30
+        Customer.get("test")
+        self.cheddar.revalidator.shutdown()
+
+        assert len(self.cheddar.customer_cache) == 0
+
+
+class LRUCacheTests(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+        assert len(cache) == 2
+
+    def test_expires(self):
+        cache = LRUCache(ttl=0.01)
+        cache.set("a", 1)
+        time.sleep(0.02)
+
+        assert cache.get("a") is None
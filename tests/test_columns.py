@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import datetime
+import responses
+from decimal import Decimal
+from unittest import mock
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from flask_cheddargetter import Customer
+from flask_cheddargetter import columns
+
+from . import TestBase
+
+
+class ColumnsTests(TestBase):
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    @responses.activate
+    def test_to_columns(self):
+        self.add_response("/customers/get", code=None, body=self.two_customers())
+
+        table = Customer.to_columns(plan_code="TRACKED_MONTHLY")
+
+        assert table.rows == 2
+        assert list(table) == columns.CustomerColumns.names()
+        assert list(table["code"]) == ["test", "other"]
+        assert list(table["plan_code"]) == ["TRACKED_MONTHLY", "FREE_MONTHLY"]
+        assert list(table["status"]) == ["active", "canceled"]
+        assert list(table["company"]) == [None, None]
+        assert table["recurring_charge_amount"].dtype == numpy.float64
+        assert table["recurring_charge_amount"].sum() == 10.0
+        assert (table["status"] == "active").sum() == 1
+        assert table["created_datetime"][0] == numpy.datetime64("2011-01-10T23:57:58")
+        assert numpy.isnat(table["canceled_datetime"][0])
+        assert table["canceled_datetime"][1] == numpy.datetime64("2011-03-10T05:45:51")
+        assert list(table.quantities["MONTHLY_ITEM"]) == [3.0, 0.0]
+        assert list(table.quantities["ONCE_ITEM"]) == [1.0, 0.0]
+
+        assert "planCode[]=TRACKED_MONTHLY" in (
+            responses.calls[0].request.body.replace("%5B%5D", "[]")
+        )
+
+    @responses.activate
+    def test_to_columns_without_numpy(self):
+        self.add_response("/customers/get", code=None, body=self.two_customers())
+
+        with mock.patch.object(columns, "numpy", None):
+            table = Customer.to_columns()
+
+        assert table["code"] == ["test", "other"]
+        assert table["recurring_charge_amount"] == [Decimal("10.00"), Decimal("0.00")]
+        assert table["canceled_datetime"] == [
+            None,
+            datetime.datetime(2011, 3, 10, 5, 45, 51, tzinfo=datetime.timezone.utc),
+        ]
+        assert table.quantities["MONTHLY_ITEM"] == [Decimal("3"), Decimal("0")]
+
+    @responses.activate
+    def test_to_columns_no_customers(self):
+        self.add_response(
+            "/customers/get", "error_no_customer.xml", status=404, code=None
+        )
+
+        table = Customer.to_columns()
+
+        assert table.rows == 0
+        assert len(table["code"]) == 0
+        assert table.quantities == {}
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import responses
+from decimal import Decimal
+
+from flask_cheddargetter import CheddarGetter
+from flask_cheddargetter import Customer
+from flask_cheddargetter import Plan
+from flask_cheddargetter.cache import ShelveCache
+from flask_cheddargetter.exceptions import NotFound
+from flask_cheddargetter.utils import get_items_by_customer_code
+
+from . import TestBase
+
+
+class EntitlementTests(TestBase):
+    def setUp(self):
+        super(EntitlementTests, self).setUp()
+        self.app.config["CHEDDAR_ENTITLEMENT_INDEX"] = True
+        self.cheddar = CheddarGetter(self.app)
+
+    def add_customer(self, quantity="3"):
+        responses.add(
+            responses.POST,
+            Customer.build_url("/customers/get", code="test"),
+            body=self.read_fixture("customers_with_items.xml").replace(
+                "<quantity>3</quantity>", "<quantity>{}</quantity>".format(quantity)
+            ),
+            content_type="application/xml",
+        )
+
+    @responses.activate
+    def test_get_entitlements(self):
+        self.add_customer()
+
+        entitlements = self.cheddar.get_entitlements("test")
+        assert self.cheddar.get_entitlements("test") == entitlements
+
+        assert len(responses.calls) == 1
+        assert sorted(entitlements) == ["MONTHLY_ITEM", "ONCE_ITEM"]
+        monthly = entitlements["MONTHLY_ITEM"]
+        assert monthly.name == "Monthly Item"
+        assert monthly.included == Decimal("2")
+        assert monthly.used == Decimal("3")
+        assert monthly.remaining == Decimal("-1")
+
+    @responses.activate
+    def test_get_entitlements_not_found(self):
+        responses.add(
+            responses.POST,
+            Customer.build_url("/customers/get", code=-1),
+            status=404,
+            body=self.read_fixture("error_no_customer.xml"),
+            content_type="application/xml",
+        )
+
+        with self.assertRaises(NotFound):
+            self.cheddar.get_entitlements(-1)
+
+    @responses.activate
+    def test_item_update_reindexes(self):
+        self.add_customer()
+        responses.add(
+            responses.POST,
+            Customer.build_url(
+                "/customers/add-item-quantity", code="test", item_code="MONTHLY_ITEM"
+            ),
+            body=self.read_fixture("customers_with_items.xml").replace(
+                "<quantity>3</quantity>", "<quantity>4</quantity>"
+            ),
+            content_type="application/xml",
+        )
+
+        customer = Customer.get("test")
+        assert self.cheddar.get_entitlements("test")["MONTHLY_ITEM"].used == 3
+        customer.subscription.items[0].increment()
+
+        assert self.cheddar.get_entitlements("test")["MONTHLY_ITEM"].used == 4
+        assert len(responses.calls) == 2
+
+    @responses.activate
+    def test_rebuild(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        store = ShelveCache(os.path.join(directory, "entitlements"))
+        self.addCleanup(store.close)
+        self.app.config["CHEDDAR_ENTITLEMENT_INDEX"] = store
+        cheddar = CheddarGetter(self.app)
+        store.set("entitlements:gone", "{}")
+        responses.add(
+            responses.POST,
+            Customer.build_url("/customers/get"),
+            body=self.read_fixture("customers_with_items.xml"),
+            content_type="application/xml",
+        )
+
+        assert cheddar.rebuild_entitlements() == 1
+        assert store.keys() == ["entitlements:test"]
+        assert cheddar.get_entitlements("test")["ONCE_ITEM"].used == 1
+
+    @responses.activate
+    def test_get_items_by_customer_code(self):
+        responses.add(
+            responses.POST,
+            Customer.build_url("/customers/list"),
+            body=self.read_fixture("customers_with_items.xml"),
+            content_type="application/xml",
+        )
+        responses.add(
+            responses.POST,
+            Plan.build_url("/plans/get"),
+            body=self.read_fixture("plans_with_items.xml"),
+            content_type="application/xml",
+        )
+
+        assert get_items_by_customer_code() == {
+            "test": {"Monthly Item": Decimal("2"), "Once Item": Decimal("0")}
+        }
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import shutil
+import tempfile
+import responses
+import urllib.parse
+from decimal import Decimal
+from requests.exceptions import ConnectionError
+
+from flask_cheddargetter import CheddarGetter
+from flask_cheddargetter import Customer
+from flask_cheddargetter.cache import ShelveCache
+
+from . import TestBase
+
+
+class MeteringTests(TestBase):
+    def setUp(self):
+        super(MeteringTests, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.store = ShelveCache(os.path.join(self.directory, "metering"))
+        self.app.config["CHEDDAR_METERING"] = self.store
+        self.app.config["CHEDDAR_METERING_INTERVAL"] = 3600
+        self.cheddar = CheddarGetter(self.app)
+
+    def tearDown(self):
+        self.cheddar.meter.stop(flush=False)
+        self.store.close()
+        shutil.rmtree(self.directory)
+        super(MeteringTests, self).tearDown()
+
+    def add_responses(self):
+        for path in ("/customers/get", "/customers/add-item-quantity"):
+            responses.add(
+                responses.POST,
+                Customer.build_url(
+                    path,
+                    code="test",
+                    item_code="MONTHLY_ITEM" if "item" in path else None,
+                ),
+                body=self.read_fixture("customers_with_items.xml"),
+                content_type="application/xml",
+            )
+
+    @responses.activate
+    def test_changes_are_combined(self):
+        self.add_responses()
+        item = Customer.get("test").subscription.items[0]
+
+        item.increment(deferred=True)
+        item.increment(2, deferred=True)
+        item.decrement(deferred=True)
+
+        assert item.quantity == Decimal("5")
+        assert len(responses.calls) == 1
+
+        assert self.cheddar.meter.flush() == 1
+        assert len(responses.calls) == 2
+        body = urllib.parse.parse_qs(responses.calls[1].request.body)
+        assert body["quantity"] == ["2.0000"]
+        assert self.cheddar.meter.pending == {}
+        assert self.cheddar.meter.flush() == 0
+
+    @responses.activate
+    def test_pending_usage_survives_restart(self):
+        self.cheddar.meter.record("test", "MONTHLY_ITEM", 3)
+
+        # Nothing is registered with responses so sending fails
+        with self.assertRaises(ConnectionError):
+            self.cheddar.meter.flush()
+        self.cheddar.meter.stop(flush=False)
+
+        self.add_responses()
+        self.cheddar = CheddarGetter(self.app)
+        assert self.cheddar.meter.pending == {("test", "MONTHLY_ITEM"): Decimal("3")}
+        assert self.cheddar.meter.flush() == 1
+        assert self.store.get(self.cheddar.meter.pending_key) == "[]"
+
+    @responses.activate
+    def test_flush_when_full(self):
+        self.add_responses()
+        self.cheddar.meter.max_pending = 1
+
+        self.cheddar.meter.record("test", "MONTHLY_ITEM")
+
+        deadline = time.monotonic() + 5
+        while self.cheddar.meter.pending and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert self.cheddar.meter.pending == {}
+        assert len(responses.calls) == 1
+
+    def test_metering_needs_a_store(self):
+        self.app.config["CHEDDAR_METERING"] = True
+
+        with self.assertRaises(ValueError):
+            CheddarGetter(self.app)
+
+    def test_metering_file(self):
+        self.app.config["CHEDDAR_METERING"] = os.path.join(self.directory, "usage")
+        self.cheddar = CheddarGetter(self.app)
+        self.cheddar.meter.record("test", "MONTHLY_ITEM", 3)
+
+        # The file is reopened by the next meter
+        self.cheddar = CheddarGetter(self.app)
+        assert self.cheddar.meter.pending == {("test", "MONTHLY_ITEM"): Decimal("3")}
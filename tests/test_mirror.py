@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import threading
+import responses
+from lxml import etree
+
+from flask_cheddargetter.mirror import CustomerMirror
+from flask_cheddargetter.sync import CustomerSync
+
+from . import TestBase
+
+
+class MirrorTests(TestBase):
+    def setUp(self):
+        super(MirrorTests, self).setUp()
+        self.mirror = CustomerMirror()
+
+    def tearDown(self):
+        self.mirror.close()
+        super(MirrorTests, self).tearDown()
+
+    def codes(self, customers):
+        return [customer.code for customer in customers]
+
+    def customers_xml(self):
+        return etree.fromstring(self.two_customers().encode()).findall("customer")
+
+    @responses.activate
+    def test_query(self):
+        self.add_response("/customers/get", code=None, body=self.two_customers())
+
+        assert self.mirror.load_all() == 2
+        assert len(self.mirror) == 2
+
+        assert self.codes(self.mirror.query()) == ["other", "test"]
+        assert self.codes(self.mirror.query(plan_code="TRACKED_MONTHLY")) == ["test"]
+        assert self.codes(
+            self.mirror.query(plan_code=["TRACKED_MONTHLY", "FREE_MONTHLY"])
+        ) == ["other", "test"]
+        assert self.codes(self.mirror.query(status="canceled")) == ["other"]
+        assert self.codes(self.mirror.query(over_quota=True)) == ["test"]
+        assert self.codes(
+            self.mirror.query(item_code="MONTHLY_ITEM", over_quota=True)
+        ) == ["test"]
+        assert self.codes(
+            self.mirror.query(created_after=datetime.date(2011, 1, 10), limit=1)
+        ) == ["other"]
+        assert self.mirror.query(plan_code="PAID_MONTHLY") == []
+
+        customer = self.mirror.query(status="active")[0]
+        assert customer.subscription.items[0].quantity == 3
+        assert customer.subscription.plan.code == "TRACKED_MONTHLY"
+        assert self.mirror.get_customer("test").first_name == "Test"
+        assert self.mirror.get_customer("missing") is None
+
+        with self.assertRaises(ValueError):
+            self.mirror.query(order_by="xml; DROP TABLE customers")
+
+    @responses.activate
+    def test_sync_into_mirror(self):
+        self.add_response("/customers/get", code=None, body=self.two_customers())
+
+        result = CustomerSync(self.mirror).run()
+
+        assert result.added == ["other", "test"]
+        assert self.codes(self.mirror.query(status="active")) == ["test"]
+        assert CustomerSync(self.mirror).watermark is not None
+
+        self.mirror.remove("test")
+        assert self.codes(self.mirror.query()) == ["other"]
+
+    def test_queries_are_served_while_loading(self):
+        self.mirror.load(self.customers_xml()[:1])
+        self.mirror.load_batch_size = 1
+        counts = []
+
+        def customers():
+            for customer_xml in self.customers_xml():
+                thread = threading.Thread(
+                    target=lambda: counts.append(len(self.mirror))
+                )
+                thread.start()
+                thread.join(5)
+                yield customer_xml
+
+        assert self.mirror.load(customers()) == 2
+        # The previous customers are served until the load is swapped in
+        assert counts == [1, 1]
+        assert self.codes(self.mirror.query()) == ["other", "test"]
+
+    def test_failed_load_keeps_the_mirror(self):
+        self.mirror.load(self.customers_xml())
+
+        def customers():
+            yield self.customers_xml()[0]
+            raise ValueError("Failed")
+
+        with self.assertRaises(ValueError):
+            self.mirror.load(customers())
+        assert self.codes(self.mirror.query()) == ["other", "test"]
+        # The staging database is gone, loading works again
+        assert self.mirror.load([]) == 0
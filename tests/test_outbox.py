@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import responses
+import urllib.parse
+from requests.exceptions import ConnectionError
+
+from flask_cheddargetter import CheddarGetter
+from flask_cheddargetter import Customer
+from flask_cheddargetter.exceptions import NotFound
+from flask_cheddargetter.exceptions import ValidationError
+from flask_cheddargetter.outbox import Outbox
+
+from . import TestBase
+
+
+class OutboxTests(TestBase):
+    def setUp(self):
+        super(OutboxTests, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.app.config["CHEDDAR_OUTBOX"] = os.path.join(self.directory, "outbox")
+        self.app.config["CHEDDAR_OUTBOX_BACKOFF"] = 0
+        self.cheddar = CheddarGetter(self.app)
+        self.results = []
+
+    def tearDown(self):
+        self.cheddar.outbox.stop()
+        shutil.rmtree(self.directory)
+        super(OutboxTests, self).tearDown()
+
+    def callback(self, code, customer, error):
+        self.results.append((code, customer, error))
+
+    def get_customer(self, fixture="customers_with_items.xml"):
+        self.add_response("/customers/get", fixture)
+        return Customer.get("test")
+
+    def bodies(self):
+        return [
+            urllib.parse.parse_qs(call.request.body) for call in responses.calls[1:]
+        ]
+
+    @responses.activate
+    def test_deferred_saves(self):
+        customer = self.get_customer()
+        self.add_response("/customers/edit")
+
+        customer.first_name = "Changed"
+        customer.save(deferred=True, callback=self.callback)
+        customer.last_name = "Changed"
+        customer.save(deferred=True)
+
+        assert customer._to_persist == {}
+        assert self.cheddar.outbox.join(5)
+        # Writes of a customer are sent in order
+        assert self.bodies() == [
+            {"firstName": ["Changed"]},
+            {"lastName": ["Changed"]},
+        ]
+        code, saved, error = self.results[0]
+        assert code == "test"
+        assert saved.code == "test"
+        assert error is None
+
+    @responses.activate
+    def test_deferred_subscription_save_is_retried(self):
+        customer = self.get_customer("paypal_customer.xml")
+        self.add_response("/customers/edit-subscription", body=ConnectionError())
+        self.add_response("/customers/edit-subscription")
+
+        customer.subscription.cc_zip = "54321"
+        customer.subscription.save(deferred=True, callback=self.callback)
+
+        assert self.cheddar.outbox.join(5)
+        assert self.bodies() == [{"ccZip": ["54321"]}, {"ccZip": ["54321"]}]
+        assert self.results[0][2] is None
+
+    @responses.activate
+    def test_deferred_save_permanent_error(self):
+        customer = self.get_customer()
+        self.add_response("/customers/edit", "error_no_customer.xml", status=404)
+
+        customer.first_name = "Changed"
+        customer.save(deferred=True, callback=self.callback)
+
+        assert self.cheddar.outbox.join(5)
+        assert len(responses.calls) == 2
+        code, saved, error = self.results[0]
+        assert saved is None
+        assert isinstance(error, NotFound)
+
+    @responses.activate
+    def test_card_details_are_not_deferred(self):
+        customer = self.get_customer()
+
+        customer.subscription.cc_number = "4111111111111111"
+        with self.assertRaises(ValidationError):
+            customer.save(deferred=True)
+        assert len(self.cheddar.outbox) == 0
+
+    @responses.activate
+    def test_saves_after_deferred_create_edit(self):
+        responses.add(
+            responses.POST,
+            Customer.build_url("/customers/new", code="test", is_new=True),
+            body=self.read_fixture("customers_with_items.xml"),
+            content_type="application/xml",
+        )
+        self.add_response("/customers/edit")
+        customer = Customer(code="test", first_name="Test")
+
+        customer.save(deferred=True)
+        customer.last_name = "Changed"
+        with self.assertRaises(ValidationError):
+            customer.save()
+        customer.save(deferred=True, callback=self.callback)
+
+        assert self.cheddar.outbox.join(5)
+        assert [call.request.url for call in responses.calls] == [
+            Customer.build_url("/customers/new", code="test", is_new=True),
+            Customer.build_url("/customers/edit", code="test"),
+        ]
+        assert urllib.parse.parse_qs(responses.calls[1].request.body) == {
+            "lastName": ["Changed"]
+        }
+        assert self.results[0][2] is None
+
+    @responses.activate
+    def test_queued_saves_survive_restart(self):
+        self.cheddar.outbox.stop()
+        self.app.config["CHEDDAR_OUTBOX_WORKERS"] = 0
+        cheddar = CheddarGetter(self.app)
+        customer = self.get_customer()
+        customer.first_name = "Changed"
+        customer.save(deferred=True)
+        cheddar.outbox.stop()
+
+        self.cheddar = CheddarGetter(self.app)
+        self.cheddar.outbox_handler(self.callback)
+        self.add_response("/customers/edit")
+
+        assert self.cheddar.outbox.process_pending() == 1
+        assert self.bodies() == [{"firstName": ["Changed"]}]
+        assert self.results[0][0] == "test"
+
+    def test_outbox_needs_a_file(self):
+        self.app.config["CHEDDAR_OUTBOX"] = True
+
+        with self.assertRaises(ValueError):
+            CheddarGetter(self.app)
+
+    def test_writes_are_claimed_once_across_processes(self):
+        self.cheddar.outbox.stop()
+        path = self.app.config["CHEDDAR_OUTBOX"]
+        first = Outbox(self.app, path, max_workers=0)
+        second = Outbox(self.app, path, max_workers=0)
+        first.put("/customers/edit", "test", firstName="Changed")
+
+        with first._lock:
+            row, wait = first._claim()
+        assert row[0] == 1
+        with second._lock:
+            assert second._claim()[0] is None
+
+        # The lease of the first outbox ran out, the write is taken over
+        with first._lock:
+            first.connection.execute("UPDATE outbox SET claimed_until = 0")
+            first.connection.commit()
+        with second._lock:
+            assert second._claim()[0][0] == 1
@@ -1,11 +1,17 @@
 # -*- coding: utf-8 -*-
 
 import arrow
+import datetime
 import responses
+import urllib.parse
+from decimal import Decimal
 
 from flask_cheddargetter import Customer
 from flask_cheddargetter import Plan
 from flask_cheddargetter import GatewayAccount
+from flask_cheddargetter import InvoiceRecord
+from flask_cheddargetter import ItemRecord
+from flask_cheddargetter import _parse_datetime
 from flask_cheddargetter.exceptions import BadRequest
 from flask_cheddargetter.exceptions import NotFound
 
@@ -359,3 +365,322 @@ class ParsingTests(TestBase):
         assert invoice.vat_rate == None
         assert invoice.type == "subscription"
         assert invoice.charges == []
+
+    @responses.activate
+    def test_get_many_customers(self):
+        responses.add(
+            responses.POST,
+            Customer.build_url("/customers/get", code="test"),
+            body=self.read_fixture("customers_with_items.xml"),
+            content_type="application/xml",
+        )
+        responses.add(
+            responses.POST,
+            Customer.build_url("/customers/get", code="missing"),
+            status=404,
+            body=self.read_fixture("error_no_customer.xml"),
+            content_type="application/xml",
+        )
+
+        customers = Customer.get_many(["test", "missing"], max_workers=2)
+
+        assert len(responses.calls) == 2
+        assert customers["test"].code == "test"
+        assert customers["missing"] is None
+
+    @responses.activate
+    def test_iter_all_customers(self):
+        customer = self.read_fixture("customers_with_items.xml")
+        customer = customer[
+            customer.index("<customer ") : customer.index("</customers>")
+        ]
+        body = "<customers>{}</customers>".format(
+            "".join(
+                customer.replace('code="test"', 'code="test{}"'.format(i))
+                for i in range(3)
+            )
+        )
+        responses.add(
+            responses.POST,
+            Customer.build_url("/customers/get"),
+            body=body,
+            content_type="application/xml",
+        )
+
+        codes = []
+        for customer in Customer.iter_all():
+            assert customer.subscription.plan.code == "TRACKED_MONTHLY"
+            codes.append(customer.code)
+
+        assert codes == ["test0", "test1", "test2"]
+
+        # Elements already processed are freed while iterating
+        for customer_xml in Customer.iter_request("/customers/get", "customer"):
+            previous = list(customer_xml.itersiblings(preceding=True))
+            assert len(previous) <= 1
+            assert all(len(i) == 0 for i in previous)
+
+    @responses.activate
+    def test_iter_all_no_customers(self):
+        responses.add(
+            responses.POST,
+            Customer.build_url("/customers/get"),
+            status=404,
+            body=self.read_fixture("error_no_customer.xml"),
+            content_type="application/xml",
+        )
+
+        assert list(Customer.iter_all()) == []
+
+    @responses.activate
+    def test_query_customers(self):
+        responses.add(
+            responses.POST,
+            Customer.build_url("/customers/get"),
+            body=self.read_fixture("customers_with_items.xml"),
+            content_type="application/xml",
+        )
+
+        customers = Customer.query(
+            plan_code=["TRACKED_MONTHLY", "PAID_MONTHLY"],
+            subscription_status="activeOnly",
+            created_after=datetime.date(2011, 1, 1),
+            page=2,
+            per_page=10,
+        )
+        assert len(responses.calls) == 0
+        customers = list(customers)
+
+        assert [customer.code for customer in customers] == ["test"]
+        body = urllib.parse.parse_qs(responses.calls[0].request.body)
+        assert body["planCode[]"] == ["TRACKED_MONTHLY", "PAID_MONTHLY"]
+        assert body["subscriptionStatus"] == ["activeOnly"]
+        assert body["createdAfterDate"] == ["2011-01-01"]
+        assert body["page"] == ["2"]
+        assert body["perPage"] == ["10"]
+
+    @responses.activate
+    def test_query_customers_pages(self):
+        for fixture in ["customers_with_items.xml", "customers_without_items.xml"]:
+            responses.add(
+                responses.POST,
+                Customer.build_url("/customers/get"),
+                body=self.read_fixture(fixture),
+                content_type="application/xml",
+            )
+        responses.add(
+            responses.POST,
+            Customer.build_url("/customers/get"),
+            status=404,
+            body=self.read_fixture("error_no_customer.xml"),
+            content_type="application/xml",
+        )
+
+        customers = list(Customer.query(per_page=1))
+
+        assert len(customers) == 2
+        assert len(responses.calls) == 3
+        pages = [
+            urllib.parse.parse_qs(call.request.body)["page"] for call in responses.calls
+        ]
+        assert pages == [["1"], ["2"], ["3"]]
+
+    @responses.activate
+    def test_query_customers_pages_ignored(self):
+        responses.add(
+            responses.POST,
+            Customer.build_url("/customers/get"),
+            body=self.read_fixture("customers_with_items.xml"),
+            content_type="application/xml",
+        )
+
+        # The same page comes back whatever page is asked for
+        customers = list(Customer.query(per_page=1))
+
+        assert len(customers) == 1
+        assert len(responses.calls) == 2
+
+    @responses.activate
+    def test_query_customers_per_page_ignored(self):
+        customer = self.read_fixture("customers_with_items.xml")
+        customer = customer[
+            customer.index("<customer ") : customer.index("</customers>")
+        ]
+        responses.add(
+            responses.POST,
+            Customer.build_url("/customers/get"),
+            body="<customers>{}</customers>".format(
+                "".join(
+                    customer.replace('id="', 'id="{}'.format(i), 1) for i in range(3)
+                )
+            ),
+            content_type="application/xml",
+        )
+
+        customers = list(Customer.query(per_page=2))
+
+        assert len(customers) == 3
+        assert len(responses.calls) == 1
+
+    def test_parse_datetime_matches_arrow(self):
+        for value in [
+            "2011-01-10T23:57:58+00:00",
+            "2011-01-10T23:57:58-05:00",
+            "2011-01-10T23:57:58",
+            "2011-01-10",
+        ]:
+            expected = arrow.get(value).datetime
+            parsed = _parse_datetime(value)
+            assert parsed == expected
+            assert parsed.utcoffset() == expected.utcoffset()
+
+    @responses.activate
+    def test_field_schemas(self):
+        body = self.read_fixture("customers_with_items.xml")
+        body = body.replace("<ccZip>12345</ccZip>", "<ccZip>01234</ccZip>")
+        body = body.replace("<notes/>", "<notes>42</notes>")
+        body = body.replace(
+            "<recurringChargeAmount>10.00</recurringChargeAmount>",
+            "<recurringChargeAmount>10.10</recurringChargeAmount>",
+        )
+        body = body.replace(
+            "<isVatExempt>0</isVatExempt>", "<isVatExempt>no</isVatExempt>"
+        )
+        responses.add(
+            responses.POST,
+            Customer.build_url("/customers/get", code="test"),
+            body=body,
+            content_type="application/xml",
+        )
+
+        customer = Customer.get("test")
+        subscription = customer.subscription
+
+        # Amounts keep their precision
+        assert subscription.plan.recurring_charge_amount == Decimal("10.10")
+        assert subscription.items[0].quantity == Decimal("3")
+        # Fields without a converter are kept as strings
+        assert subscription.cc_zip == "01234"
+        assert customer.notes == "42"
+        # Values that can't be converted are kept as strings
+        assert customer.is_vat_exempt == "no"
+        assert subscription.invoices[0].number == 1
+        assert (
+            subscription.cc_expiration_date
+            == arrow.get("2011-07-31T00:00:00+00:00").datetime
+        )
+
+    @responses.activate
+    def test_lazy_customer_parsing(self):
+        responses.add(
+            responses.POST,
+            Customer.build_url("/customers/get", code="test"),
+            body=self.read_fixture("customers_with_items.xml"),
+            content_type="application/xml",
+        )
+
+        eager = Customer.get("test")
+        customer = Customer.get("test", lazy=True)
+
+        # Nothing is decoded until it is used
+        assert customer.code == "test"
+        assert customer._xml is not None
+        assert customer._data == {}
+
+        assert customer.subscription.plan.code == "TRACKED_MONTHLY"
+        assert customer._xml is None
+        subscription = customer.subscription
+        assert subscription.plan.name == "Tracked Monthly"
+        # Invoices have not been read so they are still undecoded
+        assert subscription.__dict__["invoices"][0]._xml is not None
+
+        assert customer._data == eager._data
+        assert subscription._data == eager.subscription._data
+        assert subscription.items[1].quantity == eager.subscription.items[1].quantity
+        assert (
+            subscription.invoices[0].billing_datetime
+            == eager.subscription.invoices[0].billing_datetime
+        )
+        assert subscription.customer is customer
+        assert customer.subscriptions[0]._to_persist == {}
+
+    @responses.activate
+    def test_lazy_customer_updating(self):
+        responses.add(
+            responses.POST,
+            Customer.build_url("/customers/get", code="test"),
+            body=self.read_fixture("customers_with_items.xml"),
+            content_type="application/xml",
+        )
+        responses.add(
+            responses.POST,
+            Customer.build_url("/customers/edit", code="test"),
+            body="<customers></customers>",
+            content_type="application/xml",
+        )
+
+        customer = Customer.get("test", lazy=True)
+        customer.first_name = "Changed"
+        customer.save()
+
+        assert customer.last_name == "User"
+        body = urllib.parse.parse_qs(responses.calls[1].request.body)
+        assert body == {"firstName": ["Changed"]}
+
+    @responses.activate
+    def test_compact_customer_parsing(self):
+        responses.add(
+            responses.POST,
+            Customer.build_url("/customers/get", code="test"),
+            body=self.read_fixture("customers_with_items.xml"),
+            content_type="application/xml",
+        )
+
+        eager = Customer.get("test")
+        customer = Customer.get("test", compact=True)
+        subscription = customer.subscription
+
+        item = subscription.items[0]
+        assert isinstance(item, ItemRecord)
+        assert not hasattr(item, "__dict__")
+        assert item.id == eager.subscription.items[0].id
+        assert item.code == "MONTHLY_ITEM"
+        assert item.quantity == Decimal("3")
+        assert item.created_datetime == eager.subscription.items[0].created_datetime
+        assert item._asdict() == eager.subscription.items[0]._asdict()
+        assert isinstance(subscription.plan.items[0], ItemRecord)
+
+        invoice = subscription.invoices[0]
+        assert isinstance(invoice, InvoiceRecord)
+        assert invoice.number == 1
+        assert invoice.vat_rate is None
+        assert invoice.charges == ()
+
+        with self.assertRaises(AttributeError):
+            invoice.number = 2
+        with self.assertRaises(AttributeError):
+            invoice.missing
+
+        # The customer itself can still be read and modified as usual
+        assert customer._data == eager._data
+        customer.first_name = "Changed"
+        assert customer._to_persist == {"first_name": "Changed"}
+
+    @responses.activate
+    def test_default_children_created_lazily(self):
+        responses.add(
+            responses.POST,
+            Customer.build_url("/customers/get", code="test"),
+            body=self.read_fixture("customers_without_items.xml"),
+            content_type="application/xml",
+        )
+
+        customer = Customer()
+        assert "subscriptions" not in customer.__dict__
+        assert customer.subscription.plans[0].code is None
+        assert customer.subscription.customer is customer
+        assert customer.meta_data == []
+
+        customer = Customer.get("test")
+        assert customer.subscription.plan.code == "FREE_MONTHLY"
+        assert len(customer.subscription.plans) == 1
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import responses
+from unittest import mock
+
+from flask_cheddargetter import CheddarGetter
+from flask_cheddargetter import Customer
+from flask_cheddargetter.ratelimit import FileBackend
+from flask_cheddargetter.ratelimit import MemoryBackend
+from flask_cheddargetter.ratelimit import RateLimiter
+from flask_cheddargetter.ratelimit import TokenBucket
+
+from . import TestBase
+
+
+class RateLimitTests(TestBase):
+    def setUp(self):
+        super(RateLimitTests, self).setUp()
+        self.now = 1000.0
+        patcher = mock.patch(
+            "flask_cheddargetter.ratelimit.time.time", lambda: self.now
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_bucket_refills(self):
+        bucket = TokenBucket("read", 2, 3, MemoryBackend())
+
+        assert [bucket.take() for i in range(3)] == [0, 0, 0]
+        assert bucket.take() == 0.5
+
+        self.now += 0.5
+        assert bucket.take() == 0
+        # Tokens never exceed the capacity
+        self.now += 60
+        assert [bucket.take() for i in range(4)] == [0, 0, 0, 0.5]
+
+    def test_reads_and_writes_have_separate_budgets(self):
+        limiter = RateLimiter(reads=1, read_burst=1, writes=1, write_burst=1)
+
+        assert limiter._wait_time("/customers/get") == 0
+        assert limiter._wait_time("/customers/get") == 1
+        assert limiter._wait_time("/customers/edit") == 0
+        assert limiter._wait_time("/customers/edit") == 1
+
+    def test_background_leaves_a_reserve(self):
+        limiter = RateLimiter(reads=1, read_burst=4, reserve=0.5)
+
+        with limiter.background():
+            waits = [limiter._wait_time("/customers/get") for i in range(3)]
+        assert waits == [0, 0, 1]
+        # Interactive requests still get the reserved tokens
+        waits = [limiter._wait_time("/customers/get") for i in range(3)]
+        assert waits == [0, 0, 1]
+
+    def test_file_backend_is_shared(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "ratelimit")
+        first = RateLimiter(reads=1, read_burst=2, backend=FileBackend(path))
+        second = RateLimiter(reads=1, read_burst=2, backend=FileBackend(path))
+        self.addCleanup(first.backend.close)
+        self.addCleanup(second.backend.close)
+
+        assert first._wait_time("/customers/get") == 0
+        assert second._wait_time("/customers/get") == 0
+        assert first._wait_time("/customers/get") == 1
+        assert second._wait_time("/customers/get") == 1
+
+    @responses.activate
+    def test_requests_wait_for_a_token(self):
+        self.app.config["CHEDDAR_RATE_LIMIT"] = True
+        self.app.config["CHEDDAR_RATE_LIMIT_READS"] = 1
+        self.app.config["CHEDDAR_RATE_LIMIT_READ_BURST"] = 1
+        cheddar = CheddarGetter(self.app)
+        responses.add(
+            responses.POST,
+            Customer.build_url("/customers/get", code="test"),
+            body=self.read_fixture("customers_with_items.xml"),
+            content_type="application/xml",
+        )
+
+        def sleep(seconds):
+            self.now += seconds
+
+        with mock.patch("flask_cheddargetter.ratelimit.time.sleep") as sleeper:
+            sleeper.side_effect = sleep
+            Customer.get("test")
+            with cheddar.background():
+                Customer.get("test")
+
+        sleeper.assert_called_once_with(1)
+        assert len(responses.calls) == 2
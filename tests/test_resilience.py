@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import responses
+from requests.exceptions import ConnectionError
+
+from flask_cheddargetter import CheddarGetter
+from flask_cheddargetter import Customer
+from flask_cheddargetter.exceptions import CircuitOpen
+from flask_cheddargetter.exceptions import GatewayConnectionError
+from flask_cheddargetter.exceptions import NotFound
+from flask_cheddargetter.exceptions import UnexpectedResponse
+from flask_cheddargetter.resilience import CircuitBreaker
+from flask_cheddargetter.resilience import RetryPolicy
+
+from . import TestBase
+
+ERROR = '<error id="1" code="500" auxCode="">Internal error</error>'
+
+
+class ResilienceTests(TestBase):
+    def setUp(self):
+        super(ResilienceTests, self).setUp()
+        self.app.config["CHEDDAR_RETRY_BACKOFF"] = 0
+        self.app.config["CHEDDAR_CIRCUIT_MINIMUM_REQUESTS"] = 4
+        self.cheddar = CheddarGetter(self.app)
+
+    @responses.activate
+    def test_reads_are_retried(self):
+        self.add_response("/customers/get", status=500, body=ERROR)
+        self.add_response("/customers/get", body=ConnectionError())
+        self.add_response("/customers/get")
+
+        customer = Customer.get("test")
+
+        assert customer.code == "test"
+        assert len(responses.calls) == 3
+
+    @responses.activate
+    def test_retries_give_up(self):
+        self.add_response("/customers/get", status=500, body=ERROR)
+
+        with self.assertRaises(GatewayConnectionError):
+            Customer.get("test")
+        assert len(responses.calls) == 3
+
+    @responses.activate
+    def test_server_failures_are_retried(self):
+        self.add_response("/customers/get", status=503, body="Service Unavailable")
+        self.add_response("/customers/get", status=429, body=ERROR)
+        self.add_response("/customers/get")
+
+        assert Customer.get("test").code == "test"
+        assert len(responses.calls) == 3
+
+    @responses.activate
+    def test_client_errors_are_not_retried(self):
+        self.add_response("/customers/get", status=401, body=ERROR)
+
+        with self.assertRaises(UnexpectedResponse):
+            Customer.get("test")
+        assert len(responses.calls) == 1
+        assert self.cheddar.circuit_breaker._results[0][1] is True
+
+    @responses.activate
+    def test_writes_are_not_retried(self):
+        self.add_response("/customers/get")
+        self.add_response("/customers/edit", status=500, body=ERROR)
+        customer = Customer.get("test")
+
+        customer.first_name = "Changed"
+        with self.assertRaises(GatewayConnectionError):
+            customer.save()
+        assert len(responses.calls) == 2
+
+    @responses.activate
+    def test_circuit_breaker(self):
+        self.app.config["CHEDDAR_RETRY_ATTEMPTS"] = 1
+        self.cheddar = CheddarGetter(self.app)
+        breaker = self.cheddar.circuit_breaker
+        self.add_response("/customers/get", status=500, body=ERROR)
+        self.add_response("/customers/get", status=404, body=ERROR)
+        self.add_response("/customers/get", status=500, body=ERROR)
+
+        errors = []
+        for i in range(4):
+            try:
+                Customer.get("test")
+            except Exception as e:
+                errors.append(type(e))
+        assert (
+            errors == [GatewayConnectionError, NotFound] + [GatewayConnectionError] * 2
+        )
+        assert breaker.state == CircuitBreaker.OPEN
+
+        with self.assertRaises(CircuitOpen):
+            Customer.get("test")
+        assert len(responses.calls) == 4
+
+        # After the recovery timeout a single probe is let through
+        breaker.recovery_timeout = 0
+        responses.replace(
+            responses.POST,
+            Customer.build_url("/customers/get", code="test"),
+            body=self.read_fixture("customers_with_items.xml"),
+            content_type="application/xml",
+        )
+        assert Customer.get("test").code == "test"
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_half_open_allows_one_probe(self):
+        breaker = CircuitBreaker(minimum_requests=1, recovery_timeout=0)
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+
+        breaker.before_request()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        with self.assertRaises(CircuitOpen):
+            breaker.before_request()
+
+        breaker.record_failure(probe=True)
+        assert breaker.state == CircuitBreaker.OPEN
+
+    def test_only_the_probe_closes_the_breaker(self):
+        breaker = CircuitBreaker(minimum_requests=2, recovery_timeout=0)
+        breaker.record_failure()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+
+        # Requests in flight from before the breaker opened are ignored
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.OPEN
+
+        assert breaker.before_request() is True
+        breaker.record_success()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        breaker.record_success(probe=True)
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_cancelled_probe_is_released(self):
+        breaker = self.cheddar.circuit_breaker
+        breaker.recovery_timeout = 0
+        breaker.minimum_requests = 1
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+
+        async def probe():
+            async def send():
+                await asyncio.sleep(10)
+
+            await asyncio.wait_for(Customer._acall("/customers/get", send), 0.01)
+
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(probe())
+
+        # The cancelled probe counts as failed, the next one is let through
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.before_request() is True
+
+    def test_retry_delay_has_jitter(self):
+        policy = RetryPolicy(backoff=1, max_backoff=3)
+
+        delays = [policy.delay(5) for i in range(100)]
+
+        assert all(0 <= delay <= 3 for delay in delays)
+        assert len(set(delays)) > 1
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+import flask
+import threading
+import responses
+from requests.exceptions import Timeout
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from flask_cheddargetter import CheddarGetter
+from flask_cheddargetter import Customer
+
+from . import TestBase
+
+
+class SessionTests(TestBase):
+    def setUp(self):
+        super(SessionTests, self).setUp()
+        self.app.config["CHEDDAR_POOL_MAXSIZE"] = 4
+        self.cheddar = CheddarGetter(self.app)
+
+    @responses.activate
+    def test_session_is_reused(self):
+        responses.add(
+            responses.POST,
+            Customer.build_url("/customers/get", code="test"),
+            body=self.read_fixture("customers_with_items.xml"),
+            content_type="application/xml",
+        )
+
+        session = self.cheddar.session
+        Customer.get("test")
+        Customer.get("test")
+
+        assert len(responses.calls) == 2
+        assert self.cheddar.session is session
+        assert session.get_adapter("https://cheddargetter.com") is (
+            self.cheddar.state()._adapter
+        )
+        assert self.cheddar.state()._adapter._pool_maxsize == 4
+
+    def test_sessions_share_pool_between_threads(self):
+        sessions = []
+        thread = threading.Thread(target=lambda: sessions.append(self.cheddar.session))
+        thread.start()
+        thread.join()
+
+        assert sessions[0] is not self.cheddar.session
+        assert sessions[0].get_adapter("https://cheddargetter.com") is (
+            self.cheddar.session.get_adapter("https://cheddargetter.com")
+        )
+
+    def test_apps_keep_their_own_state(self):
+        other = flask.Flask(__name__)
+        other.config["CHEDDAR_POOL_MAXSIZE"] = 2
+        cheddar = CheddarGetter()
+        cheddar.init_app(self.app)
+        cheddar.init_app(other)
+
+        assert cheddar.state()._adapter._pool_maxsize == 4
+        with other.app_context():
+            assert cheddar.state()._adapter._pool_maxsize == 2
+            assert cheddar.session is not cheddar.state(self.app).session
+        assert cheddar.state(other) is not cheddar.state(self.app)
+
+    def test_keep_alive_disabled(self):
+        self.app.config["CHEDDAR_KEEP_ALIVE"] = False
+        cheddar = CheddarGetter(self.app)
+
+        assert cheddar.session.headers["Connection"] == "close"
+
+    @responses.activate
+    def test_requests_time_out(self):
+        self.app.config["CHEDDAR_TIMEOUT"] = 5
+        self.app.config["CHEDDAR_RETRY_BACKOFF"] = 0
+        cheddar = CheddarGetter(self.app)
+        url = Customer.build_url("/customers/get", code="test")
+        responses.add(responses.POST, url, body=Timeout())
+        responses.add(
+            responses.POST,
+            url,
+            body=self.read_fixture("customers_with_items.xml"),
+            content_type="application/xml",
+        )
+
+        # A read that times out is retried like any connection failure
+        assert Customer.get("test").code == "test"
+        assert [call.request.req_kwargs["timeout"] for call in responses.calls] == [
+            5,
+            5,
+        ]
+        if httpx is not None:
+            assert cheddar.state()._create_async_client().timeout == httpx.Timeout(5)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+import responses
+
+from flask_cheddargetter import CheddarGetter
+from flask_cheddargetter import Customer
+from flask_cheddargetter.exceptions import NotFound
+from flask_cheddargetter.singleflight import SingleFlight
+
+from . import TestBase
+
+
+class SingleFlightTests(TestBase):
+    def setUp(self):
+        super(SingleFlightTests, self).setUp()
+        self.cheddar = CheddarGetter(self.app)
+        self.release = threading.Event()
+
+    def held_response(self, code, status=200, fixture="customers_with_items.xml"):
+        def callback(request):
+            # Hold the request until every thread is waiting for it
+            self.release.wait(5)
+            return status, {}, self.read_fixture(fixture)
+
+        self.add_response("/customers/get", code=code, callback=callback)
+
+    def run_threads(self, func, count=10):
+        results = [None] * count
+
+        def run(i):
+            with self.app.app_context():
+                try:
+                    results[i] = func()
+                except Exception as e:
+                    results[i] = e
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    @responses.activate
+    def test_concurrent_gets_share_a_request(self):
+        self.held_response("test")
+
+        customers = self.run_threads(lambda: Customer.get("test"))
+
+        assert len(responses.calls) == 1
+        assert all(customer.code == "test" for customer in customers)
+        # Every caller still gets its own copy
+        customers[0].first_name = "Changed"
+        assert customers[1].first_name == "Test"
+        assert customers[0].subscription is not customers[1].subscription
+
+    @responses.activate
+    def test_errors_are_shared(self):
+        self.held_response("missing", status=404, fixture="error_no_customer.xml")
+
+        errors = self.run_threads(lambda: Customer.get("missing"))
+
+        assert len(responses.calls) == 1
+        assert all(isinstance(error, NotFound) for error in errors)
+
+    @responses.activate
+    def test_different_customers_are_not_coalesced(self):
+        self.release.set()
+        self.held_response("test")
+        self.held_response("other", status=404, fixture="error_no_customer.xml")
+
+        Customer.get("test")
+        with self.assertRaises(NotFound):
+            Customer.get("other")
+        Customer.get("test")
+
+        assert len(responses.calls) == 3
+        assert len(self.cheddar.single_flight) == 0
+
+    @responses.activate
+    def test_coalescing_can_be_disabled(self):
+        self.app.config["CHEDDAR_COALESCE_READS"] = False
+        self.cheddar = CheddarGetter(self.app)
+        self.held_response("test")
+
+        self.run_threads(lambda: Customer.get("test"), count=3)
+
+        assert len(responses.calls) == 3
+
+    def test_calls_run_again_once_finished(self):
+        group = SingleFlight()
+        calls = []
+
+        assert group.do("key", lambda: calls.append(1) or len(calls)) == 1
+        assert group.do("key", lambda: calls.append(1) or len(calls)) == 2
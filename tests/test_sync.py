@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import datetime
+import tempfile
+import responses
+import urllib.parse
+
+from flask_cheddargetter.cache import ShelveCache
+from flask_cheddargetter.sync import CustomerSync
+
+from . import TestBase
+
+
+class SyncTests(TestBase):
+    def setUp(self):
+        super(SyncTests, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.store = ShelveCache(os.path.join(self.directory, "customers"))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+        super(SyncTests, self).tearDown()
+
+    @responses.activate
+    def test_sync(self):
+        self.add_response("/customers/get", "customers_with_items.xml", code=None)
+
+        sync = CustomerSync(self.store)
+        result = sync.run()
+
+        assert result.added == ["test"]
+        assert result.changed == []
+        assert result.cancelled == []
+        assert sync.watermark == datetime.datetime.utcnow().date()
+        assert sync.get("test").first_name == "Test"
+
+        # Only changed customers are fetched on the next run
+        responses.reset()
+        changed = self.read_fixture("customers_with_items.xml").replace(
+            "<firstName>Test</firstName>", "<firstName>Changed</firstName>"
+        )
+        self.add_response(
+            "/customers/get", "error_no_customer.xml", code=None, status=404
+        )
+        self.add_response("/customers/get", code=None, body=changed)
+        cancelled = self.read_fixture("customers_without_items.xml").replace(
+            'code="test"', 'code="new"'
+        )
+        self.add_response("/customers/get", code=None, body=cancelled)
+
+        result = sync.run()
+
+        assert len(responses.calls) == 3
+        watermark = sync.watermark.isoformat()
+        bodies = [urllib.parse.parse_qs(call.request.body) for call in responses.calls]
+        assert bodies[0]["createdAfterDate"] == [watermark]
+        assert bodies[1]["transactedAfterDate"] == [watermark]
+        assert bodies[2]["canceledAfterDate"] == [watermark]
+
+        assert result.added == ["new"]
+        assert result.changed == ["test"]
+        assert result.cancelled == ["new"]
+        assert sync.get("test").first_name == "Changed"
+
+    @responses.activate
+    def test_sync_unchanged(self):
+        self.add_response("/customers/get", "customers_with_items.xml", code=None)
+        self.add_response("/customers/get", "customers_with_items.xml", code=None)
+        self.add_response(
+            "/customers/get", "error_no_customer.xml", code=None, status=404
+        )
+
+        sync = CustomerSync(self.store)
+        sync.run()
+        result = sync.run()
+
+        assert result == ([], [], [])
+
+    @responses.activate
+    def test_sync_ignores_position_in_response(self):
+        customer = self.read_fixture("customers_with_items.xml")
+        customer = customer[
+            customer.index("<customer ") : customer.index("</customers>")
+        ].strip()
+        other = customer.replace('code="test"', 'code="other"')
+        body = "<customers>\n  {}\n  {}\n</customers>"
+        self.add_response(
+            "/customers/get", code=None, body=body.format(customer, other)
+        )
+        self.add_response(
+            "/customers/get", code=None, body=body.format(other, customer)
+        )
+        self.add_response(
+            "/customers/get", "error_no_customer.xml", code=None, status=404
+        )
+        self.add_response(
+            "/customers/get", "error_no_customer.xml", code=None, status=404
+        )
+
+        sync = CustomerSync(self.store)
+        sync.run()
+        result = sync.run()
+
+        assert result == ([], [], [])
+
+    @responses.activate
+    def test_sync_cancelled_reported_once(self):
+        self.add_response(
+            "/customers/get", "error_no_customer.xml", code=None, status=404
+        )
+        sync = CustomerSync(self.store)
+        sync.run()
+
+        for i in range(2):
+            self.add_response(
+                "/customers/get", "error_no_customer.xml", code=None, status=404
+            )
+            self.add_response(
+                "/customers/get", "error_no_customer.xml", code=None, status=404
+            )
+            self.add_response("/customers/get", "paypal_customer.xml", code=None)
+        first = sync.run()
+        second = sync.run()
+
+        assert first.cancelled == ["test"]
+        assert second == ([], [], [])
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+import responses
+import urllib.parse
+
+from flask_cheddargetter import CheddarGetter
+from flask_cheddargetter import Customer
+from flask_cheddargetter.exceptions import GatewayFailure
+from flask_cheddargetter.exceptions import NotFound
+
+from . import TestBase
+
+
+class UnitOfWorkTests(TestBase):
+    def setUp(self):
+        super(UnitOfWorkTests, self).setUp()
+        self.app.config["CHEDDAR_IDENTITY_MAP"] = True
+        self.app.config["CHEDDAR_UNIT_OF_WORK"] = True
+        self.cheddar = CheddarGetter(self.app)
+        self.client = self.app.test_client()
+
+    def edits(self):
+        return [
+            urllib.parse.parse_qs(call.request.body)
+            for call in responses.calls
+            if "/customers/edit/" in call.request.url
+        ]
+
+    @responses.activate
+    def test_customer_is_loaded_once_per_request(self):
+        self.add_response("/customers/get")
+
+        with self.app.test_request_context():
+            customer = Customer.get("test")
+            assert Customer.get("test") is customer
+            # The full customer serves compact lookups as well
+            assert Customer.get("test", compact=True) is customer
+        with self.app.test_request_context():
+            assert Customer.get("test") is not customer
+
+        assert len(responses.calls) == 2
+
+    @responses.activate
+    def test_identity_map_is_per_request_only(self):
+        self.add_response("/customers/get")
+
+        assert Customer.get("test") is not Customer.get("test")
+        assert len(responses.calls) == 2
+
+    @responses.activate
+    def test_empty_customer_list_is_not_held(self):
+        self.add_response("/customers/get", body="<customers></customers>")
+
+        with self.app.test_request_context():
+            assert Customer.get("test") is None
+            assert Customer.get("test") is None
+
+        assert len(responses.calls) == 2
+
+    @responses.activate
+    def test_saves_are_sent_once_at_teardown(self):
+        self.add_response("/customers/get")
+        self.add_response("/customers/edit")
+
+        @self.app.route("/edit", methods=["POST"])
+        def edit():
+            customer = Customer.get("test")
+            customer.first_name = "Changed"
+            customer.save()
+            Customer.get("test").last_name = "Changed"
+            Customer.get("test").save()
+            assert self.edits() == []
+            return ""
+
+        assert self.client.post("/edit").status_code == 200
+        assert len(responses.calls) == 2
+        assert self.edits() == [{"firstName": ["Changed"], "lastName": ["Changed"]}]
+
+    @responses.activate
+    def test_declined_card_is_raised(self):
+        self.add_response("/customers/get")
+        self.add_response(
+            "/customers/edit",
+            status=422,
+            body='<error id="1" code="6000" auxCode="">Declined</error>',
+        )
+
+        with self.app.test_request_context():
+            customer = Customer.get("test")
+            customer.subscription.cc_number = "4111111111111111"
+            with self.assertRaises(GatewayFailure):
+                customer.save()
+
+    @responses.activate
+    def test_paypal_redirect_is_loaded(self):
+        self.add_response("/customers/get")
+        self.add_response("/customers/edit", "paypal_customer.xml")
+
+        with self.app.test_request_context():
+            customer = Customer.get("test")
+            customer.subscription.method = "paypal"
+            customer.subscription.return_url = "https://example.com/return"
+            customer.subscription.cancel_url = "https://example.com/cancel"
+            customer.save()
+            assert len(self.edits()) == 1
+            assert customer.subscription.redirect_url.startswith(
+                "https://cheddargetter.com/service/paypal/"
+            )
+
+    @responses.activate
+    def test_failed_request_sends_nothing(self):
+        self.add_response("/customers/get")
+        self.app.config["PROPAGATE_EXCEPTIONS"] = False
+
+        @self.app.route("/edit", methods=["POST"])
+        def edit():
+            customer = Customer.get("test")
+            customer.first_name = "Changed"
+            customer.save()
+            raise ValueError("Failed")
+
+        assert self.client.post("/edit").status_code == 500
+        assert len(responses.calls) == 1
+
+    @responses.activate
+    def test_flush_raises_errors(self):
+        self.add_response("/customers/get")
+        self.add_response(
+            "/customers/edit", status=404, fixture="error_no_customer.xml"
+        )
+
+        with self.app.test_request_context():
+            customer = Customer.get("test")
+            customer.first_name = "Changed"
+            customer.save()
+            with self.assertRaises(NotFound):
+                self.cheddar.flush()
+
+    @responses.activate
+    def test_unit_of_work_disabled(self):
+        self.app.config["CHEDDAR_UNIT_OF_WORK"] = False
+        self.add_response("/customers/get")
+        self.add_response("/customers/edit")
+
+        with self.app.test_request_context():
+            customer = Customer.get("test")
+            customer.first_name = "Changed"
+            customer.save()
+            assert len(self.edits()) == 1
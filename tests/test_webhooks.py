@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+import responses
+
+from flask_cheddargetter import CheddarGetter
+from flask_cheddargetter import Customer
+from flask_cheddargetter import Plan
+from flask_cheddargetter.webhooks import SIGNATURE_HEADER
+from flask_cheddargetter.webhooks import sign
+
+from . import TestBase
+
+
+class WebhookTests(TestBase):
+    def setUp(self):
+        super(WebhookTests, self).setUp()
+        self.app.config["CHEDDAR_CUSTOMER_CACHE"] = "lru"
+        self.app.config["CHEDDAR_ENTITLEMENT_INDEX"] = True
+        self.app.config["CHEDDAR_WEBHOOK_SECRET"] = "secret"
+        self.cheddar = CheddarGetter(self.app)
+        self.app.register_blueprint(
+            self.cheddar.webhook_blueprint(), url_prefix="/cheddargetter"
+        )
+        self.client = self.app.test_client()
+
+        self.received = []
+        self.cheddar.webhook_handler(
+            lambda activity_type, customer: self.received.append(
+                (activity_type, customer)
+            )
+        )
+
+    def payload(self, activity_type, fixture="customers_with_items.xml"):
+        customers = self.read_fixture(fixture)
+        customer = customers[
+            customers.index("<customer ") : customers.index("</customers>")
+        ]
+        return (
+            "<webhook><activityType>{}</activityType>{}</webhook>".format(
+                activity_type, customer
+            )
+        ).encode("utf-8")
+
+    def post(self, body, signature=None):
+        if signature is None:
+            signature = sign("secret", body)
+        return self.client.post(
+            "/cheddargetter/webhook",
+            data=body,
+            headers={SIGNATURE_HEADER: signature},
+            content_type="application/xml",
+        )
+
+    @responses.activate
+    def test_webhook_refreshes_caches(self):
+        response = self.post(self.payload("subscriptionChanged"))
+
+        assert response.status_code == 204
+        # Served from the caches, no request is registered with responses
+        customer = Customer.get("test")
+        assert customer.subscription.plan.code == "TRACKED_MONTHLY"
+        assert self.cheddar.get_entitlements("test")["MONTHLY_ITEM"].used == 3
+        assert Plan.get("TRACKED_MONTHLY").recurring_charge_amount == 10
+        assert len(responses.calls) == 0
+
+        activity_type, customer = self.received[0]
+        assert activity_type == "subscriptionChanged"
+        assert customer.code == "test"
+        assert customer.first_name == "Test"
+
+    @responses.activate
+    def test_webhook_keeps_unchanged_plans(self):
+        responses.add(
+            responses.POST,
+            Plan.build_url("/plans/get"),
+            body=self.read_fixture("plans.xml"),
+            content_type="application/xml",
+        )
+        Plan.all()
+
+        self.post(self.payload("newSubscription", "customers_without_items.xml"))
+        assert self.cheddar.plan_cache.all() is not None
+
+        self.post(self.payload("subscriptionChanged"))
+        assert self.cheddar.plan_cache.all() is None
+
+    def test_webhook_deleted_customer(self):
+        self.post(self.payload("subscriptionChanged"))
+        response = self.post(self.payload("customerDeleted"))
+
+        assert response.status_code == 204
+        assert (
+            self.cheddar.customer_cache.get(Customer._customer_cache_key("test"))
+            is None
+        )
+        assert self.cheddar.entitlement_index.get("test") is None
+
+    def test_webhook_bad_signature(self):
+        response = self.post(self.payload("subscriptionChanged"), signature="bad")
+
+        assert response.status_code == 403
+        assert len(self.cheddar.customer_cache) == 0
+        assert self.received == []
+
+    def test_webhook_invalid_payload(self):
+        assert self.post(b"<webhook>").status_code == 400
+        assert self.post(b"<webhook></webhook>").status_code == 400